@@ -0,0 +1,286 @@
+// Minimal simulated DOM for running extension content scripts under Node.
+//
+// Implements only what the content script touches, and counts the calls
+// that are expensive in a real browser (computed style, layout reads,
+// visibility checks) so benchmarks can report them alongside wall time.
+
+"use strict";
+
+const NodeFilter = {
+  SHOW_ELEMENT: 1,
+  SHOW_TEXT: 4,
+  FILTER_ACCEPT: 1,
+  FILTER_REJECT: 2,
+  FILTER_SKIP: 3,
+};
+
+const DEFAULT_HIDDEN = new Set(["HEAD", "SCRIPT", "STYLE", "TEMPLATE", "NOSCRIPT", "META", "LINK", "TITLE"]);
+const VALUE_TAGS = new Set(["INPUT", "TEXTAREA", "SELECT", "BUTTON", "OPTION"]);
+
+function newStats() {
+  return { computedStyle: 0, layoutReads: 0, visibilityChecks: 0 };
+}
+
+class FakeText {
+  constructor(data) {
+    this.nodeType = 3;
+    this.data = data;
+    this.parentNode = null;
+    this.childNodes = [];
+  }
+
+  get textContent() {
+    return this.data;
+  }
+}
+
+class FakeElement {
+  constructor(doc, tag, attrs = {}, style = {}) {
+    this.nodeType = 1;
+    this.ownerDocument = doc;
+    this.tagName = tag.toUpperCase();
+    this.attrs = { ...attrs };
+    this.style = { display: DEFAULT_HIDDEN.has(this.tagName) ? "none" : "block", ...style };
+    this.childNodes = [];
+    this.children = [];
+    this.parentNode = null;
+    this.order = doc.nextOrder++;
+  }
+
+  get id() {
+    return this.attrs.id || "";
+  }
+
+  get name() {
+    return VALUE_TAGS.has(this.tagName) ? this.attrs.name || "" : undefined;
+  }
+
+  get type() {
+    if (this.tagName === "INPUT") return this.attrs.type || "text";
+    if (this.tagName === "BUTTON") return this.attrs.type || "submit";
+    return undefined;
+  }
+
+  get href() {
+    if (this.tagName !== "A") return undefined;
+    return "href" in this.attrs ? new URL(this.attrs.href, this.ownerDocument.baseURI).href : "";
+  }
+
+  get value() {
+    return VALUE_TAGS.has(this.tagName) ? this.attrs.value || "" : undefined;
+  }
+
+  get placeholder() {
+    return this.tagName === "INPUT" || this.tagName === "TEXTAREA" ? this.attrs.placeholder || "" : undefined;
+  }
+
+  get parentElement() {
+    return this.parentNode && this.parentNode.nodeType === 1 ? this.parentNode : null;
+  }
+
+  get firstChild() {
+    return this.childNodes[0] || null;
+  }
+
+  get isConnected() {
+    let node = this;
+    while (node.parentNode) node = node.parentNode;
+    return node === this.ownerDocument;
+  }
+
+  get textContent() {
+    return this.childNodes.map((child) => child.textContent).join("");
+  }
+
+  get innerHTML() {
+    return this.childNodes.map((child) => (child.nodeType === 3 ? child.data : child.outerHTML)).join("");
+  }
+
+  get outerHTML() {
+    const tag = this.tagName.toLowerCase();
+    const attrs = Object.entries(this.attrs).map(([k, v]) => ` ${k}="${v}"`).join("");
+    return `<${tag}${attrs}>${this.innerHTML}</${tag}>`;
+  }
+
+  remove() {
+    const parent = this.parentNode;
+    if (!parent) return;
+    parent.childNodes.splice(parent.childNodes.indexOf(this), 1);
+    if (parent.children) parent.children.splice(parent.children.indexOf(this), 1);
+    this.parentNode = null;
+  }
+
+  append(...nodes) {
+    for (const node of nodes) {
+      const child = typeof node === "string" ? new FakeText(node) : node;
+      child.parentNode = this;
+      this.childNodes.push(child);
+      if (child.nodeType === 1) this.children.push(child);
+    }
+    return this;
+  }
+
+  getAttribute(name) {
+    return name in this.attrs ? String(this.attrs[name]) : null;
+  }
+
+  hasAttribute(name) {
+    return name in this.attrs;
+  }
+
+  matches(selectorList) {
+    return compileSelector(selectorList)(this);
+  }
+
+  // Ancestor-or-self has display:none.
+  isRendered() {
+    for (let el = this; el; el = el.parentElement) {
+      if (el.style.display === "none") return false;
+    }
+    return true;
+  }
+
+  computedVisibility() {
+    for (let el = this; el; el = el.parentElement) {
+      if (el.style.visibility) return el.style.visibility;
+    }
+    return "visible";
+  }
+
+  get offsetParent() {
+    this.ownerDocument.stats.layoutReads++;
+    if (!this.isRendered() || this.tagName === "BODY" || this.tagName === "HTML") return null;
+    return this.parentElement;
+  }
+
+  getBoundingClientRect() {
+    this.ownerDocument.stats.layoutReads++;
+    return { x: (this.order * 7) % 1280, y: this.order * 18, width: 120, height: 18 };
+  }
+
+  checkVisibility(options = {}) {
+    this.ownerDocument.stats.visibilityChecks++;
+    if (!this.isRendered()) return false;
+    if ((options.visibilityProperty || options.checkVisibilityCSS) && this.computedVisibility() !== "visible") {
+      return false;
+    }
+    if (options.opacityProperty || options.checkOpacity) {
+      for (let el = this; el; el = el.parentElement) {
+        if (el.style.opacity === "0") return false;
+      }
+    }
+    return true;
+  }
+}
+
+class FakeTreeWalker {
+  constructor(root, whatToShow, filter) {
+    this.root = root;
+    this.whatToShow = whatToShow;
+    this.filter = filter;
+    this.stack = [...root.childNodes].reverse();
+  }
+
+  nextNode() {
+    while (this.stack.length) {
+      const node = this.stack.pop();
+      const shown = node.nodeType === 1
+        ? this.whatToShow & NodeFilter.SHOW_ELEMENT
+        : this.whatToShow & NodeFilter.SHOW_TEXT;
+      let result = NodeFilter.FILTER_SKIP;
+      if (shown) {
+        if (!this.filter) result = NodeFilter.FILTER_ACCEPT;
+        else if (typeof this.filter === "function") result = this.filter(node);
+        else result = this.filter.acceptNode(node);
+      }
+      if (result !== NodeFilter.FILTER_REJECT) {
+        for (let i = node.childNodes.length - 1; i >= 0; i--) this.stack.push(node.childNodes[i]);
+      }
+      if (result === NodeFilter.FILTER_ACCEPT) return node;
+    }
+    return null;
+  }
+}
+
+// Events are real (Node's EventTarget), so scripts loaded into separate
+// contexts -- the page's world and the content script's -- can talk through it.
+class FakeDocument extends EventTarget {
+  constructor({ url = "https://bench.test/", title = "Synthetic page" } = {}) {
+    super();
+    this.nodeType = 9;
+    this.nextOrder = 0;
+    this.stats = newStats();
+    this.baseURI = url;
+    this.title = title;
+    this.documentElement = new FakeElement(this, "html");
+    this.head = new FakeElement(this, "head");
+    this.body = new FakeElement(this, "body");
+    this.documentElement.append(this.head, this.body);
+    this.documentElement.parentNode = this;
+    this.childNodes = [this.documentElement];
+  }
+
+  createElement(tag, attrs, style) {
+    return new FakeElement(this, tag, attrs, style);
+  }
+
+  querySelectorAll(selector) {
+    const matches = selector.trim() === "*" ? () => true : compileSelector(selector);
+    const out = [];
+    const walker = new FakeTreeWalker(this, NodeFilter.SHOW_ELEMENT, null);
+    for (let node = walker.nextNode(); node; node = walker.nextNode()) {
+      if (matches(node)) out.push(node);
+    }
+    return out;
+  }
+
+  querySelector(selector) {
+    return this.querySelectorAll(selector)[0] || null;
+  }
+
+  createTreeWalker(root, whatToShow, filter) {
+    return new FakeTreeWalker(root, whatToShow, filter || null);
+  }
+
+  getComputedStyle(el) {
+    this.stats.computedStyle++;
+    return { display: el.style.display, visibility: el.computedVisibility(), opacity: el.style.opacity || "1" };
+  }
+
+  resetStats() {
+    this.stats = newStats();
+  }
+}
+
+// Supports comma lists of `tag`, `[attr]` and `[attr='value']`.
+const selectorCache = new Map();
+
+function compileSelector(selectorList) {
+  let compiled = selectorCache.get(selectorList);
+  if (compiled) return compiled;
+
+  const tests = selectorList.split(",").map((raw) => {
+    const part = raw.trim();
+    const attr = part.match(/^\[([\w-]+)(?:=['"]?([^'"\]]*)['"]?)?\]$/);
+    if (attr) {
+      const [, name, value] = attr;
+      return value === undefined
+        ? (el) => el.hasAttribute(name)
+        : (el) => el.getAttribute(name) === value;
+    }
+    if (/^[\w-]+$/.test(part)) {
+      const tag = part.toUpperCase();
+      return (el) => el.tagName === tag;
+    }
+    throw new Error(`Unsupported selector in fake DOM: ${part}`);
+  });
+  compiled = (el) => tests.some((test) => test(el));
+  selectorCache.set(selectorList, compiled);
+  return compiled;
+}
+
+const CSS = {
+  escape: (value) => String(value).replace(/[^a-zA-Z0-9_-]/g, (c) => `\\${c}`),
+};
+
+module.exports = { CSS, FakeDocument, FakeElement, FakeText, NodeFilter };
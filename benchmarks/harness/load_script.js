@@ -0,0 +1,66 @@
+// Load an extension script into a fresh VM context backed by a FakeDocument.
+
+"use strict";
+
+const fs = require("fs");
+const path = require("path");
+const vm = require("vm");
+
+const { CSS, FakeElement, NodeFilter } = require("./fake_dom");
+
+const EXTENSION_DIR = path.resolve(__dirname, "..", "..", "extension");
+
+function chromeStub() {
+  const listeners = () => ({ addListener() {}, removeListener() {} });
+  return {
+    runtime: {
+      connect: () => ({ onDisconnect: listeners(), onMessage: listeners(), postMessage() {} }),
+      onMessage: listeners(),
+      sendMessage: () => Promise.resolve(),
+    },
+  };
+}
+
+class MutationObserver {
+  observe() {
+    MutationObserver.observing += 1;
+  }
+
+  disconnect() {
+    MutationObserver.observing -= 1;
+  }
+}
+MutationObserver.observing = 0;
+
+// ``globals`` adds to or replaces what the script sees, e.g. a chrome stub
+// that records port messages, or page-world objects like ``window``.
+function loadScript(file, doc, globals = {}) {
+  const window = {
+    location: { href: doc.baseURI },
+    getComputedStyle: (el) => doc.getComputedStyle(el),
+  };
+  const context = vm.createContext({
+    document: doc,
+    window,
+    chrome: chromeStub(),
+    CSS,
+    NodeFilter,
+    Element: FakeElement,
+    CustomEvent,
+    Event,
+    EventTarget,
+    MutationObserver,
+    crypto,
+    console,
+    setTimeout,
+    clearTimeout,
+    setInterval,
+    clearInterval,
+    ...globals,
+  });
+  const source = fs.readFileSync(path.isAbsolute(file) ? file : path.join(EXTENSION_DIR, file), "utf8");
+  vm.runInContext(source, context, { filename: file });
+  return (name) => vm.runInContext(name, context);
+}
+
+module.exports = { MutationObserver, loadScript };
@@ -0,0 +1,90 @@
+// Snapshot engine as shipped before the single-pass rewrite. Kept only so
+// benchmarks/snapshot_bench.js can compare output and cost against it.
+
+const elementRefs = new Map();
+
+function doSnapshot(params) {
+  const interactiveOnly = params && params.interactive_only;
+  const elements = [];
+
+  const selectors = interactiveOnly
+    ? "a, button, input, select, textarea, [role='button'], [role='link'], [tabindex], [contenteditable]"
+    : "*";
+
+  const nodes = document.querySelectorAll(selectors);
+  const limit = (params && params.limit) || 500;
+
+  let count = 0;
+  elementRefs.clear();
+  for (const node of nodes) {
+    if (count >= limit) break;
+    if (!isVisible(node)) continue;
+
+    const rect = node.getBoundingClientRect();
+    const info = {
+      ref: `e${count}`,
+      tag: node.tagName.toLowerCase(),
+      text: (node.textContent || "").trim().slice(0, 120),
+      selector: buildSelector(node),
+    };
+
+    if (node.id) info.id = node.id;
+    if (node.name) info.name = node.name;
+    if (node.type) info.type = node.type;
+    if (node.href) info.href = node.href;
+    if (node.value) info.value = node.value;
+    if (node.placeholder) info.placeholder = node.placeholder;
+    if (node.getAttribute("role")) info.role = node.getAttribute("role");
+    if (node.getAttribute("aria-label")) info.ariaLabel = node.getAttribute("aria-label");
+
+    info.rect = {
+      x: Math.round(rect.x),
+      y: Math.round(rect.y),
+      w: Math.round(rect.width),
+      h: Math.round(rect.height),
+    };
+
+    elements.push(info);
+    elementRefs.set(info.ref, node);
+    count++;
+  }
+
+  return {
+    ok: true,
+    url: window.location.href,
+    title: document.title,
+    elements,
+  };
+}
+function isVisible(el) {
+  if (!el.offsetParent && el.tagName !== "BODY" && el.tagName !== "HTML") return false;
+  const style = window.getComputedStyle(el);
+  return style.display !== "none" && style.visibility !== "hidden" && style.opacity !== "0";
+}
+
+function buildSelector(el) {
+  if (el.id) return `#${CSS.escape(el.id)}`;
+
+  const parts = [];
+  let current = el;
+  while (current && current !== document.body) {
+    let selector = current.tagName.toLowerCase();
+    if (current.id) {
+      parts.unshift(`#${CSS.escape(current.id)}`);
+      break;
+    }
+    const parent = current.parentElement;
+    if (parent) {
+      const siblings = Array.from(parent.children).filter(
+        (c) => c.tagName === current.tagName
+      );
+      if (siblings.length > 1) {
+        const index = siblings.indexOf(current) + 1;
+        selector += `:nth-of-type(${index})`;
+      }
+    }
+    parts.unshift(selector);
+    current = current.parentElement;
+  }
+  return parts.join(" > ");
+}
@@ -0,0 +1,126 @@
+// Compare the snapshot engine against the previous implementation on a
+// synthetic page, using the simulated DOM harness.
+//
+//   node benchmarks/snapshot_bench.js [--nodes 50000] [--check]
+//
+// --check only verifies that both engines produce identical snapshots and
+// exits non-zero if they differ.
+
+"use strict";
+
+const path = require("path");
+
+const { FakeDocument } = require("./harness/fake_dom");
+const { loadScript } = require("./harness/load_script");
+
+function parseArgs(argv) {
+  const args = { nodes: 50000, check: false };
+  for (let i = 0; i < argv.length; i++) {
+    if (argv[i] === "--nodes") args.nodes = Number(argv[++i]);
+    else if (argv[i] === "--check") args.check = true;
+  }
+  return args;
+}
+
+// A page shaped like a long results listing: a nav bar, wide lists of
+// linked items, a form table, hidden panels and a few invisible leaves.
+function buildPage(targetNodes) {
+  const doc = new FakeDocument();
+  const el = (tag, attrs, style) => doc.createElement(tag, attrs, style);
+  let count = 3;
+
+  doc.head.append(el("title").append("Synthetic page"), el("script").append("var x = 1;"));
+  count += 3;
+
+  const nav = el("nav", { id: "top" });
+  for (let i = 0; i < 40; i++) {
+    nav.append(el("a", { href: `/section/${i}` }).append(`Section ${i}`));
+  }
+  doc.body.append(nav);
+  count += 41;
+
+  const form = el("table", { class: "form" });
+  for (let i = 0; i < 200; i++) {
+    const input = el("input", { name: `field${i}`, placeholder: `Field ${i}` });
+    form.append(el("tr").append(el("td").append(`Label ${i}`), el("td").append(input)));
+  }
+  doc.body.append(form);
+  count += 1 + 200 * 4;
+
+  const hidden = el("div", { class: "panel" }, { display: "none" });
+  for (let i = 0; i < 500; i++) {
+    hidden.append(el("div").append(el("button").append(`Hidden ${i}`)));
+  }
+  doc.body.append(hidden);
+  count += 1 + 500 * 2;
+
+  const main = el("main");
+  doc.body.append(main);
+  count++;
+
+  let section = 0;
+  while (count < targetNodes) {
+    const list = el("ul", section === 0 ? { id: "results" } : {});
+    main.append(el("section").append(el("h2").append(`Results ${section}`), list));
+    count += 3;
+    for (let i = 0; i < 2000 && count < targetNodes; i++) {
+      const style = i % 97 === 0 ? { opacity: "0" } : i % 89 === 0 ? { visibility: "hidden" } : {};
+      const link = el("a", { href: `/item/${section}/${i}` }, style).append(`  Item ${section}-${i}  `);
+      const meta = el("span", { class: "meta" }).append("Lorem ipsum dolor sit amet ".repeat(3));
+      list.append(el("li").append(link, meta));
+      count += 3;
+    }
+    section++;
+  }
+
+  return { doc, count };
+}
+
+function run(engine, doc, params) {
+  doc.resetStats();
+  const started = process.hrtime.bigint();
+  const result = engine(params);
+  const ms = Number(process.hrtime.bigint() - started) / 1e6;
+  return { result, ms, stats: { ...doc.stats } };
+}
+
+function main() {
+  const args = parseArgs(process.argv.slice(2));
+  const { doc, count } = buildPage(args.nodes);
+  const legacy = loadScript(path.join(__dirname, "legacy", "snapshot_v1.js"), doc)("doSnapshot");
+
+  const scenarios = [
+    { name: "interactive, limit 200", params: { interactive_only: true, limit: 200 } },
+    { name: "interactive, limit 10000", params: { interactive_only: true, limit: 10000 } },
+    { name: "all, limit 100000", params: { interactive_only: false, limit: 100000 } },
+  ];
+
+  console.log(`Synthetic page: ${count} element nodes`);
+  let identical = true;
+  for (const scenario of scenarios) {
+    // Refs are stable for a page's lifetime, so each scenario gets a fresh
+    // content script, as a newly loaded page would.
+    const current = loadScript("content.js", doc)("doSnapshot");
+    const before = run(legacy, doc, scenario.params);
+    const after = run(current, doc, scenario.params);
+    // The legacy engine did not report the viewport.
+    const { viewport: _viewport, ...comparable } = after.result;
+    const same = JSON.stringify(before.result) === JSON.stringify(comparable);
+    identical = identical && same;
+    if (args.check) {
+      console.log(`${scenario.name}: ${after.result.elements.length} elements, ${same ? "identical" : "DIFFERENT"}`);
+      continue;
+    }
+    console.log(`\n${scenario.name} (${after.result.elements.length} elements, output ${same ? "identical" : "DIFFERENT"})`);
+    for (const [label, r] of [["legacy", before], ["current", after]]) {
+      const { computedStyle, layoutReads, visibilityChecks } = r.stats;
+      console.log(
+        `  ${label.padEnd(8)} ${r.ms.toFixed(1).padStart(9)} ms  ` +
+          `computedStyle=${computedStyle} layoutReads=${layoutReads} visibilityChecks=${visibilityChecks}`
+      );
+    }
+  }
+  process.exitCode = identical ? 0 : 1;
+}
+
+main();
@@ -0,0 +1,83 @@
+"""Compare per-command overhead of the relay's TCP and Unix-socket transports.
+
+    python benchmarks/transport_bench.py [--iterations 500]
+
+One relay serves both transports; a simulated extension answers over TCP,
+as the real one does. Each transport is measured two ways: a fresh
+connection per call (what every CLI invocation does) and one reused client
+(what RelayClient users get).
+"""
+
+import argparse
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from werkzeug.serving import make_server
+
+from browser_relay.client import RelayClient, connect
+from browser_relay.relay.server import create_app, serve_unix_socket
+from browser_relay.relay.simulator import SimulatedExtension
+
+
+def measure(fn, iterations: int) -> list[float]:
+    for _ in range(min(20, iterations)):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def report(label: str, samples: list[float]) -> None:
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"  {label:<28} mean {statistics.mean(samples):7.3f} ms  p50 {samples[len(samples) // 2]:7.3f} ms  p99 {p99:7.3f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+
+    flask_app = create_app()
+    tcp = make_server("127.0.0.1", 0, flask_app, threaded=True)
+    threading.Thread(target=tcp.serve_forever, args=(0.05,), daemon=True).start()
+    tcp_url = f"http://127.0.0.1:{tcp.server_port}"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sock_path = Path(tmp) / "relay.sock"
+        uds = serve_unix_socket(flask_app, sock_path)
+        transports = {"tcp": None, "unix": sock_path}
+
+        print(f"/status round trip ({args.iterations} calls)")
+        for name, path in transports.items():
+            def fresh():
+                with connect(tcp_url, path) as http:
+                    http.get("/status")
+
+            with connect(tcp_url, path) as shared:
+                report(f"{name}, reused connection", measure(lambda: shared.get("/status"), args.iterations))
+            report(f"{name}, connection per call", measure(fresh, args.iterations))
+
+        print(f"\nping command, submit + result ({args.iterations} commands)")
+        with SimulatedExtension(tcp_url, poll_interval=0.0005):
+            for name, path in transports.items():
+                def fresh_command():
+                    with RelayClient(tcp_url, path) as relay:
+                        relay.run("ping", timeout=5)
+
+                with RelayClient(tcp_url, path) as relay:
+                    report(f"{name}, reused connection", measure(lambda: relay.run("ping", timeout=5), args.iterations))
+                report(f"{name}, connection per call", measure(fresh_command, args.iterations))
+
+        uds.shutdown()
+    tcp.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,82 @@
 const RELAY_URL = "http://localhost:18321";
 const POLL_INTERVAL_MS = 500;
 const KEEPALIVE_INTERVAL_MS = 20000;
+const MAX_CONCURRENT_COMMANDS = 4;
+const CHUNK_THRESHOLD = 512 * 1024;
+const CHUNK_SIZE = 256 * 1024;
 
 let polling = false;
 const activePorts = new Set();
+const inflight = new Map();
+const tabChains = new Map();
+const registeredScripts = new Map();
+let scriptsLoaded = false;
+let browserId = null;
+
+// Lean-load blocking. Global rules are dynamic (they survive restarts);
+// per-navigation overrides are session rules scoped to one tab. The header
+// rule in rules.json has a higher priority than any of these, so an allow
+// override never strips the Sec-CH-UA rewrite.
+const SUBRESOURCE_TYPES = [
+  "sub_frame", "stylesheet", "script", "image", "font", "object", "xmlhttprequest",
+  "ping", "csp_report", "media", "websocket", "webtransport", "webbundle", "other",
+];
+const BLOCK_TYPES_RULE_ID = 1001;
+const BLOCK_DOMAINS_RULE_ID = 1002;
+const GLOBAL_BLOCK_PRIORITY = 2;
+const TAB_ALLOW_PRIORITY = 3;
+const TAB_BLOCK_PRIORITY = 4;
+const tabBlockRules = new Map();
+let nextTabRuleId = 100000;
+let tabRulesLoaded = false;
+const blockStats = { total: 0, byType: {}, byTab: new Map() };
+
+// Content-script readiness per tab and frame. The keepalive port a content
+// script opens when it loads marks its frame ready; the port closing (the
+// document unloading) marks it gone.
+const CONTENT_READY_TIMEOUT_MS = 10000;
+const readyFrames = new Map();
+const readyWaiters = new Map();
+
+// Page events are only collected while a client follows the relay's event
+// stream; every poll reports how many do.
+const EVENT_FLUSH_MS = 250;
+const MAX_PENDING_EVENTS = 1000;
+const pendingEvents = [];
+let eventFlushTimer = null;
+let pageEventsWanted = false;
+
+// Stable name for this browser, so federated relays can route commands to it.
+async function getBrowserId() {
+  if (browserId) return browserId;
+  const { browser_id: stored } = await chrome.storage.local.get("browser_id");
+  browserId = stored || `browser-${crypto.randomUUID().slice(0, 8)}`;
+  if (!stored) await chrome.storage.local.set({ browser_id: browserId });
+  return browserId;
+}
 
 async function pollForCommand() {
   if (polling) return;
   polling = true;
 
   try {
-    const resp = await fetch(`${RELAY_URL}/command`, { method: "GET" });
-    if (resp.status === 204) return;
-    if (!resp.ok) return;
+    const browser = encodeURIComponent(await getBrowserId());
+    while (true) {
+      const cancelOnly = inflight.size >= MAX_CONCURRENT_COMMANDS;
+      const resp = await fetch(`${RELAY_URL}/command?browser=${browser}${cancelOnly ? "&cancel_only=1" : ""}`, {
+        method: "GET",
+      });
+      setEventSubscribers(Number(resp.headers.get("X-Relay-Subscribers")) || 0);
+      if (resp.status === 204) return;
+      if (!resp.ok) return;
 
-    const command = await resp.json();
-    await executeCommand(command);
+      const command = await resp.json();
+      if (command.action === "cancel") {
+        cancelCommand(command.params.id, new Error("Cancelled"));
+        continue;
+      }
+      startCommand(command);
+    }
   } catch (_err) {
     // Relay server not running -- silently ignore
   } finally {
@@ -23,13 +84,185 @@ async function pollForCommand() {
   }
 }
 
+function startCommand(command) {
+  const entry = { controller: new AbortController(), tabId: null, timer: null };
+  inflight.set(command.id, entry);
+
+  if (command.deadline_ms) {
+    entry.timer = setTimeout(
+      () => cancelCommand(command.id, new Error("Deadline exceeded")),
+      Math.max(0, command.deadline_ms - Date.now())
+    );
+  }
+
+  executeCommand(command, entry).finally(() => {
+    clearTimeout(entry.timer);
+    inflight.delete(command.id);
+    pollForCommand();
+  });
+}
+
+function cancelCommand(commandId, reason) {
+  const entry = inflight.get(commandId);
+  if (!entry) return;
+  entry.controller.abort(reason);
+  if (entry.tabId !== null) {
+    chrome.tabs.sendMessage(entry.tabId, { action: "cancel", params: { id: commandId } }).catch(() => {});
+  }
+}
+
+function abortable(promise, signal) {
+  return new Promise((resolve, reject) => {
+    if (signal.aborted) {
+      reject(signal.reason);
+      return;
+    }
+    const onAbort = () => reject(signal.reason);
+    signal.addEventListener("abort", onAbort, { once: true });
+    promise.then(resolve, reject).finally(() => signal.removeEventListener("abort", onAbort));
+  });
+}
+
 chrome.runtime.onConnect.addListener((port) => {
   if (port.name === "keepalive") {
     activePorts.add(port);
-    port.onDisconnect.addListener(() => activePorts.delete(port));
+    const frame = port.sender.tab ? frameKey(port.sender.tab.id, port.sender.frameId) : null;
+    if (frame) markFrameReady(frame, port);
+    if (pageEventsWanted) port.postMessage({ pageEvents: true });
+    port.onDisconnect.addListener(() => {
+      activePorts.delete(port);
+      if (frame && readyFrames.get(frame) === port) readyFrames.delete(frame);
+    });
+    port.onMessage.addListener((message) => {
+      if (message.event && port.sender.tab) {
+        queueEvent({ ...message.event, tab_id: port.sender.tab.id, url: port.sender.url });
+      }
+    });
   }
 });
 
+function frameKey(tabId, frameId = 0) {
+  return `${tabId}:${frameId}`;
+}
+
+function markFrameReady(frame, port) {
+  readyFrames.set(frame, port);
+  const waiters = readyWaiters.get(frame);
+  readyWaiters.delete(frame);
+  for (const resolve of waiters || []) resolve();
+}
+
+function waitForContentScript(tabId, frameId, timeout, signal) {
+  const frame = frameKey(tabId, frameId);
+  if (readyFrames.has(frame)) return Promise.resolve();
+  return new Promise((resolve, reject) => {
+    const done = () => {
+      clearTimeout(timer);
+      readyWaiters.get(frame)?.delete(done);
+      resolve();
+    };
+    const timer = setTimeout(() => {
+      readyWaiters.get(frame)?.delete(done);
+      reject(new Error(`Content script did not load in tab ${tabId} within ${timeout} ms`));
+    }, timeout);
+    if (!readyWaiters.has(frame)) readyWaiters.set(frame, new Set());
+    readyWaiters.get(frame).add(done);
+    signal?.addEventListener("abort", () => {
+      clearTimeout(timer);
+      readyWaiters.get(frame)?.delete(done);
+      reject(signal.reason);
+    }, { once: true });
+  });
+}
+
+// Make sure a frame has the content script, injecting it if the manifest did
+// not (tabs open before the extension loaded) -- without waiting for the page
+// to finish loading. A frame between documents gets the manifest's
+// document_start injection as soon as the new one commits.
+async function ensureContentScript(tabId, frameId, signal) {
+  if (readyFrames.has(frameKey(tabId, frameId))) return;
+  const target = { tabId, frameIds: [frameId] };
+  try {
+    // Never load a second copy into a document that already has one.
+    const [{ result: loaded }] = await chrome.scripting.executeScript({
+      target, func: contentScriptLoaded, injectImmediately: true,
+    });
+    if (!loaded) await chrome.scripting.executeScript({ target, files: ["content.js"], injectImmediately: true });
+  } catch (err) {
+    const tab = await chrome.tabs.get(tabId);
+    if (tab.status === "complete") throw new Error(`Cannot run commands in tab ${tabId}: ${err.message}`);
+    await waitForContentScript(tabId, frameId, CONTENT_READY_TIMEOUT_MS, signal);
+  }
+}
+
+// Also flags a document about to get a late copy, so that copy skips the
+// page-events handshake (page scripts may be listening by now).
+function contentScriptLoaded() {
+  if (globalThis.browserRelayContentLoaded === true) return true;
+  globalThis.browserRelayInjectedLate = true;
+  return false;
+}
+
+async function sendToContent(tabId, message, signal, frameId = 0) {
+  await ensureContentScript(tabId, frameId, signal);
+  try {
+    return await chrome.tabs.sendMessage(tabId, message, { frameId });
+  } catch (err) {
+    // Only retry a message that was never delivered: the document went away
+    // between the readiness check and the send.
+    if (!/Receiving end does not exist/.test(err.message)) throw err;
+    readyFrames.delete(frameKey(tabId, frameId));
+    await ensureContentScript(tabId, frameId, signal);
+    return chrome.tabs.sendMessage(tabId, message, { frameId });
+  }
+}
+
+// Page events are batched and pushed to the relay's event stream. A relay
+// that is down loses them; they are notifications, not state.
+function queueEvent(event) {
+  if (!pageEventsWanted) return;
+  if (pendingEvents.length >= MAX_PENDING_EVENTS) pendingEvents.shift();
+  pendingEvents.push({ ts: Date.now() / 1000, ...event });
+  if (!eventFlushTimer) eventFlushTimer = setTimeout(flushEvents, EVENT_FLUSH_MS);
+}
+
+async function flushEvents() {
+  eventFlushTimer = null;
+  const events = pendingEvents.splice(0);
+  if (!events.length) return;
+  try {
+    const browser = encodeURIComponent(await getBrowserId());
+    const resp = await fetch(`${RELAY_URL}/events?browser=${browser}`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ events }),
+    });
+    if (resp.ok) setEventSubscribers((await resp.json()).subscribers || 0);
+  } catch (_err) {
+    // Relay server not running -- drop the batch
+  }
+}
+
+// Start or stop event collection in every content script as the first
+// subscriber arrives or the last one leaves.
+function setEventSubscribers(count) {
+  const wanted = count > 0;
+  if (wanted === pageEventsWanted) return;
+  pageEventsWanted = wanted;
+  if (!wanted) {
+    pendingEvents.length = 0;
+    clearTimeout(eventFlushTimer);
+    eventFlushTimer = null;
+  }
+  for (const port of activePorts) {
+    try {
+      port.postMessage({ pageEvents: wanted });
+    } catch (_err) {
+      // Port closing; its page is going away.
+    }
+  }
+}
+
 chrome.alarms.create("poll", { periodInMinutes: 0.5 });
 chrome.alarms.onAlarm.addListener((alarm) => {
   if (alarm.name === "poll") {
@@ -37,10 +270,14 @@ chrome.alarms.onAlarm.addListener((alarm) => {
   }
 });
 
-async function executeCommand(command) {
+async function executeCommand(command, entry) {
   const { id, action, params } = command;
 
   try {
+    if (command.deadline_ms && Date.now() >= command.deadline_ms) {
+      throw new Error("Deadline exceeded");
+    }
+
     if (action === "tabs") {
       const tabs = await chrome.tabs.query({ currentWindow: true });
       await postResult(id, {
@@ -51,7 +288,7 @@ async function executeCommand(command) {
     }
 
     if (action === "new_tab") {
-      const tab = await chrome.tabs.create({ url: params.url || "about:blank", active: true });
+      const tab = await chrome.tabs.create({ url: params.url || "about:blank", active: params.active !== false });
       await postResult(id, { ok: true, tab: { id: tab.id, url: tab.url, title: tab.title } });
       return;
     }
@@ -80,42 +317,59 @@ async function executeCommand(command) {
       return;
     }
 
-    if (action === "navigate") {
-      const [tab] = await chrome.tabs.query({ active: true, currentWindow: true });
-      if (!tab) throw new Error("No active tab");
-      await chrome.tabs.update(tab.id, { url: params.url });
-      await waitForTabLoad(tab.id, params.timeout || 30000);
-      await postResult(id, { ok: true, url: params.url });
+    if (action === "register_script") {
+      if (!params.name || typeof params.source !== "string") {
+        throw new Error("Missing script name or source");
+      }
+      const script = { source: params.source, version: await hashSource(params.source) };
+      registeredScripts.set(params.name, script);
+      await chrome.storage.local.set({ [`script:${params.name}`]: script });
+      await postResult(id, { ok: true, name: params.name, version: script.version, bytes: params.source.length });
+      return;
+    }
+
+    if (action === "unregister_script") {
+      registeredScripts.delete(params.name);
+      await chrome.storage.local.remove(`script:${params.name}`);
+      await postResult(id, { ok: true, name: params.name });
       return;
     }
 
-    if (action === "back") {
-      const [tab] = await chrome.tabs.query({ active: true, currentWindow: true });
-      if (!tab) throw new Error("No active tab");
-      await chrome.tabs.goBack(tab.id);
-      await postResult(id, { ok: true });
+    if (action === "list_scripts") {
+      await loadRegisteredScripts();
+      const scripts = Array.from(registeredScripts, ([name, script]) => ({
+        name,
+        version: script.version,
+        bytes: script.source.length,
+      }));
+      await postResult(id, { ok: true, scripts });
       return;
     }
 
-    if (action === "forward") {
-      const [tab] = await chrome.tabs.query({ active: true, currentWindow: true });
-      if (!tab) throw new Error("No active tab");
-      await chrome.tabs.goForward(tab.id);
-      await postResult(id, { ok: true });
+    if (action === "block") {
+      const rules = blockRules(params, [BLOCK_TYPES_RULE_ID, BLOCK_DOMAINS_RULE_ID], GLOBAL_BLOCK_PRIORITY);
+      await chrome.declarativeNetRequest.updateDynamicRules({
+        removeRuleIds: [BLOCK_TYPES_RULE_ID, BLOCK_DOMAINS_RULE_ID],
+        addRules: rules,
+      });
+      await postResult(id, { ok: true, rules: rules.length, ...(await blockConfig()) });
       return;
     }
 
-    if (action === "reload") {
-      const [tab] = await chrome.tabs.query({ active: true, currentWindow: true });
-      if (!tab) throw new Error("No active tab");
-      await chrome.tabs.reload(tab.id);
-      await postResult(id, { ok: true });
+    if (action === "block_stats") {
+      await postResult(id, {
+        ok: true,
+        ...(await blockConfig()),
+        counting: Boolean(chrome.declarativeNetRequest.onRuleMatchedDebug),
+        blocked: blockStats.total,
+        by_type: blockStats.byType,
+        by_tab: Object.fromEntries(blockStats.byTab),
+      });
       return;
     }
 
-    if (action === "tab_info") {
-      const [tab] = await chrome.tabs.query({ active: true, currentWindow: true });
-      await postResult(id, { ok: true, tab: tab ? { id: tab.id, url: tab.url, title: tab.title } : null });
+    if (action === "state_export") {
+      await postResult(id, await exportState(params, entry.controller.signal));
       return;
     }
 
@@ -125,49 +379,476 @@ async function executeCommand(command) {
       return;
     }
 
-    const [tab] = await chrome.tabs.query({ active: true, currentWindow: true });
+    const tab = await targetTab(params);
     if (!tab) {
       await postResult(id, { ok: false, error: "No active tab" });
       return;
     }
-
-    const result = await chrome.tabs.sendMessage(tab.id, { id, action, params });
+    entry.tabId = tab.id;
+    const result = await abortable(
+      runInTab(tab.id, () => executeTabCommand(command, entry, tab)),
+      entry.controller.signal
+    );
     await postResult(id, result);
   } catch (err) {
     await postResult(id, { ok: false, error: err.message });
   }
 }
 
-function waitForTabLoad(tabId, timeout) {
+// Commands against one tab run in order; different tabs run in parallel.
+async function executeTabCommand(command, entry, tab) {
+  const { id, action, params } = command;
+  const signal = entry.controller.signal;
+  signal.throwIfAborted();
+
+  if (action === "navigate") {
+    await setTabBlockOverride(tab.id, params.block);
+    blockStats.byTab.set(tab.id, 0);
+    await chrome.tabs.update(tab.id, { url: params.url });
+    await waitForTabLoad(tab.id, params.timeout || 30000, signal);
+    return { ok: true, url: params.url, tab_id: tab.id, blocked: blockStats.byTab.get(tab.id) || 0 };
+  }
+
+  if (action === "back") {
+    await chrome.tabs.goBack(tab.id);
+    return { ok: true, tab_id: tab.id };
+  }
+
+  if (action === "forward") {
+    await chrome.tabs.goForward(tab.id);
+    return { ok: true, tab_id: tab.id };
+  }
+
+  if (action === "reload") {
+    await chrome.tabs.reload(tab.id);
+    return { ok: true, tab_id: tab.id };
+  }
+
+  if (action === "tab_info") {
+    return { ok: true, tab: { id: tab.id, url: tab.url, title: tab.title } };
+  }
+
+  if (action === "evaluate" && params.script) {
+    return evaluateScript(command, tab, signal);
+  }
+
+  if (action === "state_import") {
+    return importState(params, tab, signal);
+  }
+
+  if (action === "snapshot") {
+    const result = await sendToContent(tab.id, { id, action, params, deadline_ms: command.deadline_ms }, signal);
+    return result && result.ok ? { ...result, tab_id: tab.id } : result;
+  }
+
+  return sendToContent(tab.id, { id, action, params, deadline_ms: command.deadline_ms }, signal);
+}
+
+// Send only the script handle; the source goes along once per tab (or after
+// the script changes) when the content script reports it has no compiled copy.
+async function evaluateScript(command, tab, signal) {
+  await loadRegisteredScripts();
+  const script = registeredScripts.get(command.params.script);
+  if (!script) throw new Error(`Unknown script: ${command.params.script}`);
+
+  const message = {
+    id: command.id,
+    action: "evaluate",
+    params: { ...command.params, version: script.version },
+    deadline_ms: command.deadline_ms,
+  };
+  const result = await sendToContent(tab.id, message, signal);
+  if (!result || !result.missing_script) return result;
+  message.params.source = script.source;
+  return sendToContent(tab.id, message, signal);
+}
+
+async function loadRegisteredScripts() {
+  if (scriptsLoaded) return;
+  const stored = await chrome.storage.local.get(null);
+  for (const [key, script] of Object.entries(stored)) {
+    const name = key.slice("script:".length);
+    if (key.startsWith("script:") && !registeredScripts.has(name)) registeredScripts.set(name, script);
+  }
+  scriptsLoaded = true;
+}
+
+async function hashSource(source) {
+  const digest = await crypto.subtle.digest("SHA-256", new TextEncoder().encode(source));
+  return Array.from(new Uint8Array(digest).slice(0, 8), (b) => b.toString(16).padStart(2, "0")).join("");
+}
+
+// `{types, domains}` -> up to two block rules, using `ids` in order.
+function blockRules({ types = [], domains = [] }, ids, priority, extraCondition = {}) {
+  const rules = [];
+  const blockedTypes = types.filter((type) => SUBRESOURCE_TYPES.includes(type));
+  if (blockedTypes.length) {
+    rules.push({
+      id: ids[0],
+      priority,
+      action: { type: "block" },
+      condition: { resourceTypes: blockedTypes, ...extraCondition },
+    });
+  }
+  if (domains.length) {
+    rules.push({
+      id: ids[1],
+      priority,
+      action: { type: "block" },
+      condition: { requestDomains: domains, resourceTypes: SUBRESOURCE_TYPES, ...extraCondition },
+    });
+  }
+  return rules;
+}
+
+async function blockConfig() {
+  const rules = await chrome.declarativeNetRequest.getDynamicRules();
+  const byId = new Map(rules.map((rule) => [rule.id, rule]));
+  return {
+    types: byId.get(BLOCK_TYPES_RULE_ID)?.condition.resourceTypes || [],
+    domains: byId.get(BLOCK_DOMAINS_RULE_ID)?.condition.requestDomains || [],
+  };
+}
+
+// Per-navigation override: `undefined` keeps the global rules, `false` lets
+// everything through, `{types, domains}` replaces the global rules for the tab.
+async function setTabBlockOverride(tabId, override) {
+  await loadTabBlockRules();
+  const removeRuleIds = tabBlockRules.get(tabId) || [];
+  const addRules = [];
+  if (override !== undefined && override !== null) {
+    const scope = { tabIds: [tabId] };
+    addRules.push({
+      id: nextTabRuleId++,
+      priority: TAB_ALLOW_PRIORITY,
+      action: { type: "allow" },
+      condition: { resourceTypes: SUBRESOURCE_TYPES, ...scope },
+    });
+    if (override) {
+      addRules.push(...blockRules(override, [nextTabRuleId++, nextTabRuleId++], TAB_BLOCK_PRIORITY, scope));
+    }
+  }
+  if (!removeRuleIds.length && !addRules.length) return;
+  await chrome.declarativeNetRequest.updateSessionRules({ removeRuleIds, addRules });
+  if (addRules.length) tabBlockRules.set(tabId, addRules.map((rule) => rule.id));
+  else tabBlockRules.delete(tabId);
+}
+
+// Session rules outlive a service worker restart; pick up where it left off.
+async function loadTabBlockRules() {
+  if (tabRulesLoaded) return;
+  for (const rule of await chrome.declarativeNetRequest.getSessionRules()) {
+    const tabId = rule.condition.tabIds?.[0];
+    if (tabId === undefined) continue;
+    const ids = tabBlockRules.get(tabId) || [];
+    // Allow rule first, as setTabBlockOverride creates them.
+    if (rule.action.type === "allow") ids.unshift(rule.id);
+    else ids.push(rule.id);
+    tabBlockRules.set(tabId, ids);
+    nextTabRuleId = Math.max(nextTabRuleId, rule.id + 1);
+  }
+  tabRulesLoaded = true;
+}
+
+// Counting needs the feedback permission, which Chrome grants to unpacked
+// extensions only; block_stats reports `counting: false` otherwise.
+chrome.declarativeNetRequest.onRuleMatchedDebug?.addListener(({ request, rule }) => {
+  if (rule.rulesetId === "brand_headers") return;
+  if (rule.ruleId !== BLOCK_TYPES_RULE_ID && rule.ruleId !== BLOCK_DOMAINS_RULE_ID && !isTabBlockRule(rule.ruleId)) {
+    return;
+  }
+  blockStats.total++;
+  blockStats.byType[request.type] = (blockStats.byType[request.type] || 0) + 1;
+  if (request.tabId >= 0) blockStats.byTab.set(request.tabId, (blockStats.byTab.get(request.tabId) || 0) + 1);
+});
+
+function isTabBlockRule(ruleId) {
+  for (const ids of tabBlockRules.values()) {
+    // The first id of a tab override is its allow rule.
+    if (ids.indexOf(ruleId) > 0) return true;
+  }
+  return false;
+}
+
+// Tell the relay a tab is loading a new page, so clients can drop what they
+// cached about the old one (e.g. snapshot indexes). The relay also publishes
+// these as navigation events; finished loads go out as load events.
+chrome.tabs.onUpdated.addListener((tabId, changeInfo, tab) => {
+  if (changeInfo.status === "complete") queueEvent({ type: "load", tab_id: tabId, url: tab.url, title: tab.title });
+  if (changeInfo.status !== "loading" && !changeInfo.url) return;
+  reportNavigation(tabId, changeInfo.url).catch(() => {});
+});
+
+async function reportNavigation(tabId, url) {
+  const browser = encodeURIComponent(await getBrowserId());
+  await fetch(`${RELAY_URL}/navigation?browser=${browser}`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ tab_id: tabId, url: url || null }),
+  });
+}
+
+chrome.tabs.onRemoved.addListener((tabId) => {
+  blockStats.byTab.delete(tabId);
+  setTabBlockOverride(tabId, undefined).catch(() => {});
+});
+
+// Session state: cookies plus localStorage/sessionStorage per origin. Storage
+// needs a document of the origin; a tab already on it is used when there is
+// one, otherwise a cheap same-origin document is loaded just for the purpose.
+const STATE_BOOTSTRAP_PATH = "/robots.txt";
+const STATE_LOAD_TIMEOUT_MS = 15000;
+
+async function exportState(params, signal) {
+  let origins = (params.origins || []).map((url) => new URL(url).origin);
+  if (!origins.length) {
+    const tabs = await chrome.tabs.query({ currentWindow: true });
+    origins = [...new Set(tabs.map((tab) => tab.url).filter(isWebUrl).map((url) => new URL(url).origin))];
+  }
+
+  const cookies = new Map();
+  const storage = {};
+  for (const origin of origins) {
+    for (const cookie of await originCookies(origin)) {
+      cookies.set(`${cookie.domain}|${cookie.path}|${cookie.name}`, compactCookie(cookie));
+    }
+    storage[origin] = await readOriginStorage(origin, signal);
+  }
+  return { ok: true, origins, cookies: [...cookies.values()], storage };
+}
+
+// Every cookie the origin's host would be sent, whatever its path: those set
+// for the host itself and domain cookies of its parent domains. Querying by
+// url would only return cookies whose path matches "/".
+async function originCookies(origin) {
+  const host = new URL(origin).hostname;
+  const domains = [host];
+  if (!/^[\d.]+$|:/.test(host)) {
+    const labels = host.split(".");
+    for (let i = 1; i < labels.length - 1; i++) domains.push(labels.slice(i).join("."));
+  }
+  const found = [];
+  for (const domain of domains) {
+    for (const cookie of await chrome.cookies.getAll({ domain })) {
+      // A domain query also returns cookies of sibling subdomains.
+      const cookieHost = cookie.domain.replace(/^\./, "");
+      if (cookieHost === host || (!cookie.hostOnly && host.endsWith("." + cookieHost))) found.push(cookie);
+    }
+  }
+  return found;
+}
+
+async function importState(params, tab, signal) {
+  const cookies = params.cookies || [];
+  const failed = [];
+  await Promise.all(
+    cookies.map((cookie) => chrome.cookies.set(cookieDetails(cookie)).then((set) => set || failed.push(cookie.name)))
+  );
+
+  // sessionStorage belongs to the tab, so storage is written in the tab the
+  // caller will go on to use, before its first real navigation.
+  const origins = Object.entries(params.storage || {}).filter(
+    ([, s]) => Object.keys(s.local || {}).length || Object.keys(s.session || {}).length
+  );
+  const failedOrigins = [];
+  for (const [origin, originStorage] of origins) {
+    await chrome.tabs.update(tab.id, { url: origin + STATE_BOOTSTRAP_PATH });
+    await waitForTabLoad(tab.id, STATE_LOAD_TIMEOUT_MS, signal);
+    // The bootstrap page may redirect elsewhere; never write into another origin.
+    const [{ result: written }] = await chrome.scripting.executeScript({
+      target: { tabId: tab.id },
+      func: writeStorage,
+      args: [originStorage, origin],
+    });
+    if (!written) failedOrigins.push(origin);
+  }
+  if (origins.length) {
+    await chrome.tabs.update(tab.id, { url: "about:blank" });
+    await waitForTabLoad(tab.id, STATE_LOAD_TIMEOUT_MS, signal);
+  }
+  return {
+    ok: true,
+    cookies: cookies.length - failed.length,
+    failed_cookies: failed,
+    origins: origins.length - failedOrigins.length,
+    failed_origins: failedOrigins,
+  };
+}
+
+async function readOriginStorage(origin, signal) {
+  const [open] = await chrome.tabs.query({ url: `${origin}/*` });
+  if (open) {
+    const [{ result }] = await chrome.scripting.executeScript({ target: { tabId: open.id }, func: readStorage });
+    return result;
+  }
+  // A throwaway tab only sees localStorage; sessionStorage lives in tabs.
+  const tab = await chrome.tabs.create({ url: origin + STATE_BOOTSTRAP_PATH, active: false });
+  try {
+    await waitForTabLoad(tab.id, STATE_LOAD_TIMEOUT_MS, signal);
+    const [{ result }] = await chrome.scripting.executeScript({ target: { tabId: tab.id }, func: readStorage });
+    return { local: result.local, session: {} };
+  } finally {
+    chrome.tabs.remove(tab.id).catch(() => {});
+  }
+}
+
+// Injected into pages; must be self-contained.
+function readStorage() {
+  const dump = (store) => {
+    const out = {};
+    for (let i = 0; i < store.length; i++) {
+      const key = store.key(i);
+      out[key] = store.getItem(key);
+    }
+    return out;
+  };
+  return { local: dump(localStorage), session: dump(sessionStorage) };
+}
+
+function writeStorage({ local = {}, session = {} }, origin) {
+  if (location.origin !== origin) return false;
+  for (const [key, value] of Object.entries(local)) localStorage.setItem(key, value);
+  for (const [key, value] of Object.entries(session)) sessionStorage.setItem(key, value);
+  return true;
+}
+
+function compactCookie(cookie) {
+  const out = { name: cookie.name, value: cookie.value, domain: cookie.domain, path: cookie.path };
+  if (cookie.secure) out.secure = true;
+  if (cookie.httpOnly) out.httpOnly = true;
+  if (cookie.hostOnly) out.hostOnly = true;
+  if (cookie.sameSite && cookie.sameSite !== "unspecified") out.sameSite = cookie.sameSite;
+  if (!cookie.session) out.expirationDate = cookie.expirationDate;
+  return out;
+}
+
+function cookieDetails(cookie) {
+  const host = cookie.domain.replace(/^\./, "");
+  const details = {
+    url: `http${cookie.secure ? "s" : ""}://${host}${cookie.path}`,
+    name: cookie.name,
+    value: cookie.value,
+    path: cookie.path,
+    secure: Boolean(cookie.secure),
+    httpOnly: Boolean(cookie.httpOnly),
+  };
+  if (!cookie.hostOnly) details.domain = cookie.domain;
+  if (cookie.sameSite) details.sameSite = cookie.sameSite;
+  if (cookie.expirationDate) details.expirationDate = cookie.expirationDate;
+  return details;
+}
+
+function isWebUrl(url) {
+  return typeof url === "string" && /^https?:/.test(url);
+}
+
+async function targetTab(params) {
+  if (typeof params.tab_id === "number") {
+    return chrome.tabs.get(params.tab_id);
+  }
+  const [tab] = await chrome.tabs.query({ active: true, currentWindow: true });
+  return tab || null;
+}
+
+function runInTab(tabId, fn) {
+  const previous = tabChains.get(tabId) || Promise.resolve();
+  const run = previous.then(fn);
+  const tail = run.catch(() => {});
+  tabChains.set(tabId, tail);
+  tail.then(() => {
+    if (tabChains.get(tabId) === tail) tabChains.delete(tabId);
+  });
+  return run;
+}
+
+function waitForTabLoad(tabId, timeout, signal) {
   return new Promise((resolve, reject) => {
     const timer = setTimeout(() => {
-      chrome.tabs.onUpdated.removeListener(listener);
+      cleanup();
       reject(new Error("Navigation timeout"));
     }, timeout);
 
+    function cleanup() {
+      clearTimeout(timer);
+      chrome.tabs.onUpdated.removeListener(listener);
+      if (signal) signal.removeEventListener("abort", onAbort);
+    }
+
+    function onAbort() {
+      cleanup();
+      reject(signal.reason);
+    }
+
     function listener(updatedTabId, changeInfo) {
       if (updatedTabId === tabId && changeInfo.status === "complete") {
-        clearTimeout(timer);
-        chrome.tabs.onUpdated.removeListener(listener);
+        cleanup();
         resolve();
       }
     }
     chrome.tabs.onUpdated.addListener(listener);
+    if (signal) {
+      if (signal.aborted) onAbort();
+      else signal.addEventListener("abort", onAbort, { once: true });
+    }
   });
 }
 
 async function postResult(commandId, result) {
   try {
+    let body = JSON.stringify({ id: commandId, ...result });
+    if (body.length > CHUNK_THRESHOLD) {
+      body = JSON.stringify({ id: commandId, ...(await postChunks(commandId, result)) });
+    }
     await fetch(`${RELAY_URL}/result`, {
       method: "POST",
       headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ id: commandId, ...result }),
+      body,
     });
   } catch (_err) {
     // Relay server gone -- drop the result
   }
 }
 
+// Upload the bulk of a large result in pieces. If one string field dominates
+// (html, data_url, ...) only that field is streamed raw; otherwise the whole
+// result is streamed as JSON text.
+async function postChunks(commandId, result) {
+  const field = largestStringField(result);
+  const text = field ? result[field] : JSON.stringify(result);
+
+  let seq = 0;
+  let offset = 0;
+  while (offset < text.length) {
+    let end = Math.min(offset + CHUNK_SIZE, text.length);
+    const last = text.charCodeAt(end - 1);
+    if (end < text.length && last >= 0xd800 && last <= 0xdbff) end--;
+    const resp = await fetch(`${RELAY_URL}/result/${encodeURIComponent(commandId)}/chunk?seq=${seq}`, {
+      method: "POST",
+      headers: { "Content-Type": "text/plain; charset=utf-8" },
+      body: text.slice(offset, end),
+    });
+    if (!resp.ok) throw new Error(`Chunk upload failed: ${resp.status}`);
+    offset = end;
+    seq++;
+  }
+
+  const stream = { chunks: seq, length: text.length, format: field ? "text" : "json" };
+  if (!field) return { ok: result.ok, stream };
+  const rest = { ...result, stream: { ...stream, field } };
+  delete rest[field];
+  return rest;
+}
+
+function largestStringField(result) {
+  let best = null;
+  for (const [key, value] of Object.entries(result)) {
+    if (typeof value === "string" && value.length > CHUNK_SIZE && (!best || value.length > result[best].length)) {
+      best = key;
+    }
+  }
+  return best;
+}
+
 setInterval(pollForCommand, POLL_INTERVAL_MS);
 
 chrome.runtime.onInstalled.addListener(() => {
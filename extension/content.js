@@ -1,34 +1,141 @@
+// Checked by the background worker before injecting this script on demand.
+globalThis.browserRelayContentLoaded = true;
+
 let keepalivePort = null;
-const elementRefs = new Map();
+// Element refs. A ref is bound to one element for as long as the element
+// lives: later snapshots reuse it, and the registry holds elements weakly
+// so detached nodes can be collected. Entries are kept in the order they
+// were last seen; beyond REF_REGISTRY_SIZE the least recently seen go.
+const REF_REGISTRY_SIZE = 5000;
+const RETIRED_REF_MEMORY = 1000;
+const elementRefs = new Map(); // ref -> { element: WeakRef, seen: snapshot generation }
+const refOfElement = new WeakMap();
+const retiredRefs = new Map(); // ref -> why it is no longer resolvable
+let nextRef = 0;
+let snapshotGeneration = 0;
+const cancelHandlers = new Map();
+const compiledScripts = new Map();
+const expressionCache = new Map();
+const EXPRESSION_CACHE_SIZE = 64;
+const AsyncFunction = Object.getPrototypeOf(async function () {}).constructor;
 
 function connectKeepalive() {
   keepalivePort = chrome.runtime.connect({ name: "keepalive" });
+  keepalivePort.onMessage.addListener((message) => {
+    if ("pageEvents" in message) setPageEventsWanted(message.pageEvents);
+  });
   keepalivePort.onDisconnect.addListener(() => {
     setTimeout(connectKeepalive, 1000);
   });
 }
 connectKeepalive();
 
+// Page events for the relay's event stream, only while a client is
+// subscribed (the background worker says when). Console messages and dialogs
+// come from page_events.js in the page's world, over an event name chosen
+// here at random and handed over before any page script runs; DOM changes
+// are summarised here at most once per MUTATION_FLUSH_MS.
+const PAGE_EVENTS_HANDSHAKE = "__relay_page_events";
+const PAGE_EVENT_SEP = "\u0001";
+const CONSOLE_LEVELS = new Set(["log", "info", "warn", "error", "debug"]);
+const DIALOG_KINDS = new Set(["alert", "confirm", "prompt"]);
+const MUTATION_FLUSH_MS = 1000;
+let pageEventsWanted = false;
+let mutationObserver = null;
+let mutationSummary = null;
+
+function sendPageEvent(event) {
+  if (!pageEventsWanted) return;
+  try {
+    keepalivePort.postMessage({ event });
+  } catch (_err) {
+    // Service worker restarting; the port reconnects shortly.
+  }
+}
+
+function onPageEvent(e) {
+  if (typeof e.detail !== "string") return;
+  const [type, kind, text, uncaught] = e.detail.split(PAGE_EVENT_SEP);
+  if (type === "console" && CONSOLE_LEVELS.has(kind)) {
+    sendPageEvent(uncaught ? { type, level: kind, text, uncaught: true } : { type, level: kind, text });
+  } else if (type === "dialog" && DIALOG_KINDS.has(kind)) {
+    sendPageEvent({ type, kind, message: text });
+  }
+}
+
+// A late, on-demand injection runs after page scripts, which could be
+// listening for the handshake; only the manifest's document_start load does it.
+if (!globalThis.browserRelayInjectedLate) {
+  const pageEventChannel = crypto.randomUUID();
+  document.addEventListener(pageEventChannel, onPageEvent);
+  document.dispatchEvent(new CustomEvent(PAGE_EVENTS_HANDSHAKE, { detail: pageEventChannel }));
+}
+
+function onMutations(records) {
+  if (!mutationSummary) {
+    mutationSummary = { added: 0, removed: 0, attributes: 0, text: 0 };
+    setTimeout(() => {
+      sendPageEvent({ type: "mutation", ...mutationSummary });
+      mutationSummary = null;
+    }, MUTATION_FLUSH_MS);
+  }
+  for (const record of records) {
+    if (record.type === "childList") {
+      mutationSummary.added += record.addedNodes.length;
+      mutationSummary.removed += record.removedNodes.length;
+    } else if (record.type === "attributes") {
+      mutationSummary.attributes += 1;
+    } else {
+      mutationSummary.text += 1;
+    }
+  }
+}
+
+function setPageEventsWanted(wanted) {
+  pageEventsWanted = wanted;
+  if (wanted && !mutationObserver) {
+    mutationObserver = new MutationObserver(onMutations);
+    mutationObserver.observe(document.documentElement || document, {
+      childList: true, subtree: true, attributes: true, characterData: true,
+    });
+  } else if (!wanted && mutationObserver) {
+    mutationObserver.disconnect();
+    mutationObserver = null;
+  }
+}
+
 chrome.runtime.onMessage.addListener((message, _sender, sendResponse) => {
   handleMessage(message).then(sendResponse);
   return true;
 });
 
 async function handleMessage(message) {
-  const { action, params } = message;
+  const { id, action, params } = message;
+  const deadlineMs = message.deadline_ms || null;
 
   try {
+    if (deadlineMs && Date.now() >= deadlineMs) {
+      return { ok: false, error: "Deadline exceeded" };
+    }
+    // Loaded at document_start: wait for the DOM to be parsed, not for the
+    // page to finish loading.
+    if (action !== "cancel" && document.readyState === "loading") {
+      await domContentLoaded(deadlineMs);
+      if (deadlineMs && Date.now() >= deadlineMs) return { ok: false, error: "Deadline exceeded" };
+    }
     switch (action) {
+      case "cancel":
+        return doCancel(params);
       case "click":
         return doClick(params);
       case "type":
-        return doType(params);
+        return doType(params, id, deadlineMs);
       case "select":
         return doSelect(params);
       case "snapshot":
         return doSnapshot(params);
       case "wait":
-        return doWait(params);
+        return doWait(params, id, deadlineMs);
       case "evaluate":
         return doEvaluate(params);
       case "scroll":
@@ -43,6 +150,8 @@ async function handleMessage(message) {
         return doGetValue(params);
       case "count":
         return doCount(params);
+      case "extract":
+        return doExtract(params);
       case "hover":
         return doHover(params);
       case "focus":
@@ -67,24 +176,84 @@ async function handleMessage(message) {
   }
 }
 
+function domContentLoaded(deadlineMs) {
+  return new Promise((resolve) => {
+    document.addEventListener("DOMContentLoaded", resolve, { once: true });
+    if (deadlineMs) setTimeout(resolve, Math.max(0, deadlineMs - Date.now()));
+  });
+}
+
 function resolveElement(target) {
   if (!target || typeof target !== "string") {
     throw new Error("Missing element target");
   }
 
-  if (/^e\d+$/.test(target)) {
-    const refEl = elementRefs.get(target);
-    if (!refEl || !refEl.isConnected) {
-      throw new Error(`Element ref not found or stale: ${target}`);
-    }
-    return refEl;
-  }
+  if (/^e\d+$/.test(target)) return resolveRef(target);
 
   const el = document.querySelector(target);
   if (!el) throw new Error(`Element not found: ${target}`);
   return el;
 }
 
+function resolveRef(ref) {
+  const entry = elementRefs.get(ref);
+  if (!entry) {
+    const retired = retiredRefs.get(ref);
+    if (retired) throw new Error(`Element ref not found or stale: ${ref} ${retired}`);
+    if (Number(ref.slice(1)) >= nextRef) {
+      throw new Error(
+        nextRef
+          ? `Element ref not found or stale: ${ref} was never issued on this page (refs go up to e${nextRef - 1}; refs do not survive navigation)`
+          : `Element ref not found or stale: ${ref} -- no snapshot has been taken on this page (refs do not survive navigation)`
+      );
+    }
+    throw new Error(`Element ref not found or stale: ${ref} is no longer tracked; take a new snapshot`);
+  }
+  const el = entry.element.deref();
+  if (!el) {
+    retireRef(ref, `was removed from the page after snapshot ${entry.seen} and collected`);
+    throw new Error(`Element ref not found or stale: ${ref} ${retiredRefs.get(ref)}`);
+  }
+  if (!el.isConnected) {
+    throw new Error(
+      `Element ref not found or stale: ${ref} is detached from the page (last seen in snapshot ${entry.seen}, now ${snapshotGeneration})`
+    );
+  }
+  return el;
+}
+
+// The element's ref, issuing one if it has none; marks it seen in this snapshot.
+function refFor(node) {
+  let ref = refOfElement.get(node);
+  if (ref === undefined) {
+    ref = `e${nextRef++}`;
+    refOfElement.set(node, ref);
+  }
+  // Re-inserting keeps the map ordered by when each ref was last seen.
+  const entry = elementRefs.get(ref);
+  elementRefs.delete(ref);
+  elementRefs.set(ref, { element: entry ? entry.element : new WeakRef(node), seen: snapshotGeneration });
+  retiredRefs.delete(ref);
+  return ref;
+}
+
+function retireRef(ref, reason) {
+  elementRefs.delete(ref);
+  retiredRefs.set(ref, reason);
+  if (retiredRefs.size > RETIRED_REF_MEMORY) retiredRefs.delete(retiredRefs.keys().next().value);
+}
+
+// Drop collected elements, then the least recently seen beyond the size cap.
+function pruneRefs() {
+  for (const [ref, entry] of elementRefs) {
+    if (!entry.element.deref()) retireRef(ref, `was removed from the page after snapshot ${entry.seen} and collected`);
+  }
+  for (const [ref, entry] of elementRefs) {
+    if (elementRefs.size <= REF_REGISTRY_SIZE || entry.seen === snapshotGeneration) break;
+    retireRef(ref, `expired: not seen since snapshot ${entry.seen} and the registry keeps ${REF_REGISTRY_SIZE} refs`);
+  }
+}
+
 function doClick(params) {
   const el = resolveElement(getTarget(params));
   el.scrollIntoView({ block: "center", behavior: "instant" });
@@ -92,28 +261,108 @@ function doClick(params) {
   return { ok: true };
 }
 
-function doType(params) {
+function doType(params, commandId, deadlineMs) {
   const el = resolveElement(getTarget(params));
   el.scrollIntoView({ block: "center", behavior: "instant" });
   el.focus();
+  const mode = params.mode || "keys";
+
+  if (mode === "fast") {
+    if (!el.isContentEditable && !("value" in el)) {
+      const tag = el.tagName.toLowerCase();
+      return { ok: false, error: `Cannot type into <${tag}>: fast mode needs an input, textarea or contenteditable element` };
+    }
+    insertWholeText(el, params.text, params.clear);
+    return { ok: true, mode, length: params.text.length };
+  }
 
   if (params.clear) {
-    el.value = "";
+    setNativeValue(el, "");
     el.dispatchEvent(new Event("input", { bubbles: true }));
   }
 
+  if (mode === "human") {
+    return typeWithCadence(el, params, commandId, deadlineMs);
+  }
+
   for (const char of params.text) {
-    el.dispatchEvent(new KeyboardEvent("keydown", { key: char, bubbles: true }));
-    el.dispatchEvent(new KeyboardEvent("keypress", { key: char, bubbles: true }));
-    if ("value" in el) {
-      el.value += char;
-    }
-    el.dispatchEvent(new Event("input", { bubbles: true }));
-    el.dispatchEvent(new KeyboardEvent("keyup", { key: char, bubbles: true }));
+    typeChar(el, char);
   }
   el.dispatchEvent(new Event("change", { bubbles: true }));
 
-  return { ok: true };
+  return { ok: true, mode };
+}
+
+// One value write and one input/change pair, however long the text.
+function insertWholeText(el, text, clear) {
+  if (el.isContentEditable) {
+    if (clear) el.textContent = "";
+    // Focus leaves the caret at the start; append rather than prepend.
+    const range = document.createRange();
+    range.selectNodeContents(el);
+    range.collapse(false);
+    const selection = window.getSelection();
+    selection.removeAllRanges();
+    selection.addRange(range);
+    document.execCommand("insertText", false, text);
+  } else {
+    setNativeValue(el, (clear ? "" : el.value) + text);
+    el.dispatchEvent(new InputEvent("input", { bubbles: true, inputType: "insertText", data: text }));
+  }
+  el.dispatchEvent(new Event("change", { bubbles: true }));
+}
+
+function typeWithCadence(el, params, commandId, deadlineMs) {
+  const delayMs = params.delay_ms ?? 80;
+  const jitterMs = params.jitter_ms ?? 40;
+  const chars = Array.from(params.text);
+
+  return new Promise((resolve) => {
+    let typed = 0;
+    let timer = null;
+    const finish = (result) => {
+      clearTimeout(timer);
+      cancelHandlers.delete(commandId);
+      resolve(result);
+    };
+    cancelHandlers.set(commandId, () => finish({ ok: false, error: "Cancelled", typed }));
+
+    const step = () => {
+      if (deadlineMs && Date.now() >= deadlineMs) {
+        finish({ ok: false, error: "Deadline exceeded", typed });
+        return;
+      }
+      if (typed >= chars.length) {
+        el.dispatchEvent(new Event("change", { bubbles: true }));
+        finish({ ok: true, mode: "human", length: typed });
+        return;
+      }
+      typeChar(el, chars[typed++]);
+      timer = setTimeout(step, Math.max(0, delayMs + (Math.random() * 2 - 1) * jitterMs));
+    };
+    step();
+  });
+}
+
+function typeChar(el, char) {
+  el.dispatchEvent(new KeyboardEvent("keydown", { key: char, bubbles: true }));
+  el.dispatchEvent(new KeyboardEvent("keypress", { key: char, bubbles: true }));
+  if ("value" in el) {
+    setNativeValue(el, el.value + char);
+  }
+  el.dispatchEvent(new InputEvent("input", { bubbles: true, inputType: "insertText", data: char }));
+  el.dispatchEvent(new KeyboardEvent("keyup", { key: char, bubbles: true }));
+}
+
+// Framework-controlled inputs (React and friends) track the value through the
+// prototype setter; assigning el.value directly can be swallowed.
+function setNativeValue(el, value) {
+  const descriptor = Object.getOwnPropertyDescriptor(Object.getPrototypeOf(el), "value");
+  if (descriptor && descriptor.set) {
+    descriptor.set.call(el, value);
+  } else {
+    el.value = value;
+  }
 }
 
 function doSelect(params) {
@@ -123,29 +372,48 @@ function doSelect(params) {
   return { ok: true };
 }
 
+const INTERACTIVE_SELECTOR =
+  "a, button, input, select, textarea, [role='button'], [role='link'], [tabindex], [contenteditable]";
+const UNRENDERED_TAGS = new Set(["HEAD", "SCRIPT", "STYLE", "TEMPLATE", "NOSCRIPT", "META", "LINK"]);
+const SNAPSHOT_TEXT_LENGTH = 120;
+
 function doSnapshot(params) {
   const interactiveOnly = params && params.interactive_only;
-  const elements = [];
+  const limit = (params && params.limit) || 500;
 
-  const selectors = interactiveOnly
-    ? "a, button, input, select, textarea, [role='button'], [role='link'], [tabindex], [contenteditable]"
-    : "*";
+  // One pass over the tree. Unrendered and display:none subtrees are pruned
+  // whole instead of being visited node by node.
+  const walker = document.createTreeWalker(document, NodeFilter.SHOW_ELEMENT, {
+    acceptNode(node) {
+      if (UNRENDERED_TAGS.has(node.tagName)) return NodeFilter.FILTER_REJECT;
+      if (interactiveOnly && !node.matches(INTERACTIVE_SELECTOR)) return NodeFilter.FILTER_SKIP;
+      if (isVisible(node)) return NodeFilter.FILTER_ACCEPT;
+      return hasLayoutBox(node) ? NodeFilter.FILTER_SKIP : NodeFilter.FILTER_REJECT;
+    },
+  });
 
-  const nodes = document.querySelectorAll(selectors);
-  const limit = (params && params.limit) || 500;
+  const nodes = [];
+  while (nodes.length < limit) {
+    const node = walker.nextNode();
+    if (!node) break;
+    nodes.push(node);
+  }
 
-  let count = 0;
-  elementRefs.clear();
-  for (const node of nodes) {
-    if (count >= limit) break;
-    if (!isVisible(node)) continue;
+  // Geometry is read in one batch after the walk; nothing writes to the DOM
+  // in between, so layout is computed at most once.
+  const rects = nodes.map((node) => node.getBoundingClientRect());
+  const memo = { selectors: new Map(), positions: new Map() };
 
-    const rect = node.getBoundingClientRect();
+  snapshotGeneration++;
+  const elements = [];
+  for (let count = 0; count < nodes.length; count++) {
+    const node = nodes[count];
+    const rect = rects[count];
     const info = {
-      ref: `e${count}`,
+      ref: refFor(node),
       tag: node.tagName.toLowerCase(),
-      text: (node.textContent || "").trim().slice(0, 120),
-      selector: buildSelector(node),
+      text: boundedText(node, SNAPSHOT_TEXT_LENGTH),
+      selector: selectorFor(node, memo),
     };
 
     if (node.id) info.id = node.id;
@@ -156,6 +424,7 @@ function doSnapshot(params) {
     if (node.placeholder) info.placeholder = node.placeholder;
     if (node.getAttribute("role")) info.role = node.getAttribute("role");
     if (node.getAttribute("aria-label")) info.ariaLabel = node.getAttribute("aria-label");
+    if (node.isContentEditable) info.contenteditable = true;
 
     info.rect = {
       x: Math.round(rect.x),
@@ -165,46 +434,64 @@ function doSnapshot(params) {
     };
 
     elements.push(info);
-    elementRefs.set(info.ref, node);
-    count++;
   }
+  pruneRefs();
 
   return {
     ok: true,
     url: window.location.href,
     title: document.title,
+    viewport: { w: window.innerWidth, h: window.innerHeight },
     elements,
   };
 }
 
-function doWait(params) {
+function doCancel(params) {
+  const cancel = cancelHandlers.get(params.id);
+  if (!cancel) return { ok: false, error: `No running command: ${params.id}` };
+  cancel();
+  return { ok: true };
+}
+
+function doWait(params, commandId, deadlineMs) {
   const target = getTarget(params);
-  if (target) {
-    const timeoutMs = params.timeout_ms || params.timeout || 10000;
-    const start = Date.now();
-    return new Promise((resolve) => {
+  const remaining = deadlineMs ? Math.max(0, deadlineMs - Date.now()) : Infinity;
+
+  return new Promise((resolve) => {
+    let stop = () => {};
+    const finish = (result) => {
+      stop();
+      cancelHandlers.delete(commandId);
+      resolve(result);
+    };
+    cancelHandlers.set(commandId, () => finish({ ok: false, error: "Cancelled" }));
+
+    if (target) {
+      const timeoutMs = Math.min(params.timeout_ms || params.timeout || 10000, remaining);
+      const start = Date.now();
       const timer = setInterval(() => {
         try {
           const el = resolveElement(target);
           if (el) {
-            clearInterval(timer);
-            resolve({ ok: true, selector: target });
+            finish({ ok: true, selector: target });
             return;
           }
         } catch (_err) {
           // Keep polling until timeout.
         }
         if (Date.now() - start > timeoutMs) {
-          clearInterval(timer);
-          resolve({ ok: false, error: `Timeout waiting for element: ${target}` });
+          finish({ ok: false, error: `Timeout waiting for element: ${target}` });
         }
       }, 100);
-    });
-  }
+      stop = () => clearInterval(timer);
+      return;
+    }
 
-  const ms = params.ms || 1000;
-  return new Promise((resolve) => {
-    setTimeout(() => resolve({ ok: true }), ms);
+    const ms = params.ms || 1000;
+    const timer = ms > remaining
+      ? setTimeout(() => finish({ ok: false, error: "Deadline exceeded" }), remaining)
+      : setTimeout(() => finish({ ok: true }), ms);
+    stop = () => clearTimeout(timer);
   });
 }
 
@@ -224,14 +511,58 @@ function doFingerprint() {
   };
 }
 
-function doEvaluate(params) {
-  let expr = params.expression;
-  if (!expr.trimStart().startsWith("return ") && !expr.includes(";")) {
-    expr = "return " + expr;
+async function doEvaluate(params) {
+  let fn;
+  if (params.script) {
+    fn = loadScript(params);
+    if (!fn) return { ok: false, missing_script: true, error: `Script not loaded: ${params.script}` };
+  } else {
+    if (typeof params.expression !== "string") throw new Error("Missing expression");
+    fn = compileExpression(params.expression);
+  }
+  const result = await fn(params.args === undefined ? {} : params.args);
+  return { ok: true, result: toJsonValue(result) };
+}
+
+function loadScript(params) {
+  const cached = compiledScripts.get(params.script);
+  if (cached && cached.version === params.version) return cached.fn;
+  if (typeof params.source !== "string") return null;
+  const fn = new AsyncFunction("args", params.source);
+  compiledScripts.set(params.script, { version: params.version, fn });
+  return fn;
+}
+
+function compileExpression(expression) {
+  let fn = expressionCache.get(expression);
+  if (fn) return fn;
+
+  let body = expression;
+  if (!body.trimStart().startsWith("return ") && !body.includes(";")) {
+    body = "return " + body;
+  }
+  fn = new AsyncFunction("args", body);
+  if (expressionCache.size >= EXPRESSION_CACHE_SIZE) {
+    expressionCache.delete(expressionCache.keys().next().value);
+  }
+  expressionCache.set(expression, fn);
+  return fn;
+}
+
+function toJsonValue(value) {
+  if (value === undefined) return null;
+  try {
+    return JSON.parse(JSON.stringify(value, (_key, v) => {
+      if (typeof v === "bigint") return v.toString();
+      if (v instanceof Element) return v.outerHTML;
+      if (v instanceof Map) return Object.fromEntries(v);
+      if (v instanceof Set) return Array.from(v);
+      return v;
+    }));
+  } catch (_err) {
+    // Cyclic or otherwise unserialisable -- fall back to its string form.
+    return String(value);
   }
-  const fn = new Function(expr);
-  const result = fn();
-  return { ok: true, result: result !== undefined ? String(result) : null };
 }
 
 function doScroll(params) {
@@ -252,7 +583,12 @@ function doGetText(params) {
 
 function doGetHtml(params) {
   const el = resolveElement(getTarget(params));
-  return { ok: true, html: el.innerHTML };
+  const html = el.innerHTML;
+  // Characters, not bytes: an upper bound that the CLI tightens to exact bytes.
+  if (params.max_bytes && html.length > params.max_bytes) {
+    return { ok: true, html: html.slice(0, params.max_bytes), truncated: true, length: html.length };
+  }
+  return { ok: true, html };
 }
 
 function doGetAttr(params) {
@@ -275,6 +611,59 @@ function doCount(params) {
   return { ok: true, count: document.querySelectorAll(selector).length };
 }
 
+function doExtract(params) {
+  const schema = params.schema || {};
+  if (!schema.rows) throw new Error("Schema is missing a 'rows' selector");
+  const fields = Object.entries(schema.fields || {}).map(([name, spec]) => [
+    name,
+    typeof spec === "string" ? { selector: spec, attr: "text" } : { attr: "text", ...spec },
+  ]);
+
+  const rows = document.querySelectorAll(schema.rows);
+  const offset = params.offset || 0;
+  const end = Math.min(rows.length, offset + (params.limit || 500));
+  const columnar = params.format === "columnar";
+  const columns = Object.fromEntries(fields.map(([name]) => [name, []]));
+  const records = [];
+
+  for (let i = offset; i < end; i++) {
+    const record = {};
+    for (const [name, spec] of fields) {
+      const value = extractField(rows[i], spec);
+      if (columnar) columns[name].push(value);
+      else record[name] = value;
+    }
+    if (!columnar) records.push(record);
+  }
+
+  return {
+    ok: true,
+    total: rows.length,
+    offset,
+    count: end - offset,
+    next_offset: end < rows.length ? end : null,
+    ...(columnar ? { columns } : { rows: records }),
+  };
+}
+
+function extractField(row, spec) {
+  if (spec.all) {
+    const els = spec.selector ? row.querySelectorAll(spec.selector) : [row];
+    return Array.from(els, (el) => readField(el, spec.attr));
+  }
+  const el = spec.selector ? row.querySelector(spec.selector) : row;
+  return el ? readField(el, spec.attr) : null;
+}
+
+function readField(el, attr) {
+  if (attr === "text") return (el.textContent || "").trim();
+  if (attr === "html") return el.innerHTML;
+  if (attr === "value") return "value" in el ? el.value : null;
+  // Resolved absolute URLs are what callers want from links and images.
+  if ((attr === "href" || attr === "src") && typeof el[attr] === "string") return el[attr];
+  return el.getAttribute(attr);
+}
+
 function doHover(params) {
   const el = resolveElement(getTarget(params));
   el.scrollIntoView({ block: "center", behavior: "instant" });
@@ -332,34 +721,75 @@ function getTarget(params = {}) {
 }
 
 function isVisible(el) {
+  if (typeof el.checkVisibility === "function") {
+    return el.checkVisibility({
+      opacityProperty: true,
+      visibilityProperty: true,
+      checkOpacity: true,
+      checkVisibilityCSS: true,
+    });
+  }
   if (!el.offsetParent && el.tagName !== "BODY" && el.tagName !== "HTML") return false;
   const style = window.getComputedStyle(el);
   return style.display !== "none" && style.visibility !== "hidden" && style.opacity !== "0";
 }
 
-function buildSelector(el) {
-  if (el.id) return `#${CSS.escape(el.id)}`;
+// False only when the element and therefore its whole subtree render nothing
+// (display:none on it or an ancestor).
+function hasLayoutBox(el) {
+  if (typeof el.checkVisibility === "function") return el.checkVisibility();
+  return window.getComputedStyle(el).display !== "none";
+}
 
-  const parts = [];
-  let current = el;
-  while (current && current !== document.body) {
-    let selector = current.tagName.toLowerCase();
-    if (current.id) {
-      parts.unshift(`#${CSS.escape(current.id)}`);
-      break;
+// First `max` characters of the trimmed text, without materialising the
+// textContent of large containers.
+function boundedText(el, max) {
+  const walker = document.createTreeWalker(el, NodeFilter.SHOW_TEXT);
+  let text = "";
+  for (let node = walker.nextNode(); node; node = walker.nextNode()) {
+    text += node.data;
+    const trimmed = text.trimStart();
+    if (trimmed.length >= max && /\S/.test(trimmed.slice(max - 1))) {
+      return trimmed.slice(0, max);
     }
-    const parent = current.parentElement;
-    if (parent) {
-      const siblings = Array.from(parent.children).filter(
-        (c) => c.tagName === current.tagName
-      );
-      if (siblings.length > 1) {
-        const index = siblings.indexOf(current) + 1;
-        selector += `:nth-of-type(${index})`;
-      }
-    }
-    parts.unshift(selector);
-    current = current.parentElement;
   }
-  return parts.join(" > ");
+  return text.trim().slice(0, max);
+}
+
+// Same selectors as a per-element ancestor walk, but each ancestor's selector
+// and each parent's sibling positions are computed once per snapshot.
+function selectorFor(el, memo) {
+  if (el.id) return `#${CSS.escape(el.id)}`;
+  if (el === document.body) return "";
+  const cached = memo.selectors.get(el);
+  if (cached !== undefined) return cached;
+
+  let part = el.tagName.toLowerCase();
+  const parent = el.parentElement;
+  if (parent) {
+    const position = siblingPositions(parent, memo).get(el);
+    if (position.count > 1) part += `:nth-of-type(${position.index})`;
+  }
+  const prefix = parent && parent !== document.body ? selectorFor(parent, memo) : "";
+  const selector = prefix ? `${prefix} > ${part}` : part;
+  memo.selectors.set(el, selector);
+  return selector;
+}
+
+function siblingPositions(parent, memo) {
+  let positions = memo.positions.get(parent);
+  if (positions) return positions;
+
+  positions = new Map();
+  const counts = new Map();
+  for (const child of parent.children) {
+    const index = (counts.get(child.tagName) || 0) + 1;
+    counts.set(child.tagName, index);
+    positions.set(child, { index, tag: child.tagName });
+  }
+  for (const position of positions.values()) {
+    position.count = counts.get(position.tag);
+  }
+  memo.positions.set(parent, positions);
+  return positions;
 }
@@ -0,0 +1,129 @@
+// Injected into MAIN world at document_start, before any page JS runs.
+// Reports console messages, dialogs and uncaught errors to content.js for
+// the relay's event stream.
+//
+// Nothing here may be observable by the page. content.js sends a random
+// per-load event name once, before any page script exists; events go out
+// under that name only, so the page can neither listen nor forge them.
+// Everything this code calls later is captured now, and page values are
+// described by their type -- never read, converted or serialized -- so no
+// page getter, toJSON, toString or Proxy trap ever runs on our behalf.
+
+(function () {
+  const HANDSHAKE = "__relay_page_events";
+  const SEP = "\u0001";
+  const MAX_TEXT = 2000;
+  const MAX_EARLY = 100;
+
+  const apply = Reflect.apply;
+  const dispatch = EventTarget.prototype.dispatchEvent;
+  const removeListener = EventTarget.prototype.removeEventListener;
+  const slice = String.prototype.slice;
+  const mapHas = Map.prototype.has;
+  const mapGet = Map.prototype.get;
+  const PageEvent = CustomEvent;
+  const doc = document;
+
+  function getter(proto, name) {
+    const descriptor = proto && Object.getOwnPropertyDescriptor(proto, name);
+    return descriptor && descriptor.get;
+  }
+  const errorGetters = [
+    getter(globalThis.ErrorEvent && ErrorEvent.prototype, "message"),
+    getter(globalThis.ErrorEvent && ErrorEvent.prototype, "filename"),
+    getter(globalThis.ErrorEvent && ErrorEvent.prototype, "lineno"),
+  ];
+  const reasonGetter = getter(globalThis.PromiseRejectionEvent && PromiseRejectionEvent.prototype, "reason");
+
+  // --- toString spoofing utility ---
+  // Wraps whatever toString is current (stealth.js may have patched it).
+  const currentToString = Function.prototype.toString;
+  const spoofedFns = new Map();
+
+  function makeNative(fn, nativeName) {
+    spoofedFns.set(fn, `function ${nativeName}() { [native code] }`);
+    return fn;
+  }
+
+  Function.prototype.toString = function () {
+    if (apply(mapHas, spoofedFns, [this])) return apply(mapGet, spoofedFns, [this]);
+    return apply(currentToString, this, []);
+  };
+  spoofedFns.set(Function.prototype.toString, "function toString() { [native code] }");
+
+  // --- Channel to content.js ---
+  let channel = null;
+  let early = [];
+
+  function send(detail) {
+    if (channel === null) {
+      if (early.length < MAX_EARLY) early[early.length] = detail;
+      return;
+    }
+    apply(dispatch, doc, [new PageEvent(channel, { __proto__: null, detail })]);
+  }
+
+  function onHandshake(e) {
+    apply(removeListener, doc, [HANDSHAKE, onHandshake]);
+    if (channel !== null || typeof e.detail !== "string") return;
+    channel = e.detail;
+    const pending = early;
+    early = null;
+    for (let i = 0; i < pending.length; i++) send(pending[i]);
+  }
+  doc.addEventListener(HANDSHAKE, onHandshake);
+
+  function emit(type, kind, text, uncaught) {
+    try {
+      send(type + SEP + kind + SEP + text + SEP + (uncaught ? "1" : ""));
+    } catch (_err) {
+      // Never let reporting break the page.
+    }
+  }
+
+  function describe(value) {
+    const type = typeof value;
+    if (type === "string") return value;
+    if (value === null) return "null";
+    if (type === "object" || type === "function" || type === "symbol") return "[" + type + "]";
+    return "" + value;
+  }
+
+  function format(args) {
+    let text = "";
+    for (let i = 0; i < args.length; i++) text += (i ? " " : "") + describe(args[i]);
+    return text.length > MAX_TEXT ? apply(slice, text, [0, MAX_TEXT]) + "…" : text;
+  }
+
+  for (const level of ["log", "info", "warn", "error", "debug"]) {
+    const original = console[level];
+    // Method syntax: named like the original and, like it, not a constructor.
+    const wrapped = { [level](...args) {
+      emit("console", level, format(args), false);
+      return apply(original, this, args);
+    } }[level];
+    console[level] = makeNative(wrapped, level);
+  }
+
+  for (const kind of ["alert", "confirm", "prompt"]) {
+    const original = window[kind];
+    const wrapped = { [kind](...args) {
+      emit("dialog", kind, args.length ? describe(args[0]) : "", false);
+      return apply(original, this, args);
+    } }[kind];
+    window[kind] = makeNative(wrapped, kind);
+  }
+
+  if (errorGetters[0] && errorGetters[1] && errorGetters[2]) {
+    window.addEventListener("error", (e) => {
+      const message = describe(apply(errorGetters[0], e, []));
+      const where = describe(apply(errorGetters[1], e, [])) + ":" + describe(apply(errorGetters[2], e, []));
+      emit("console", "error", message + " (" + where + ")", true);
+    });
+  }
+  if (reasonGetter) {
+    window.addEventListener("unhandledrejection", (e) => {
+      emit("console", "error", "Unhandled rejection: " + describe(apply(reasonGetter, e, [])), true);
+    });
+  }
+})();
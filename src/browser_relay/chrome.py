@@ -1,13 +1,29 @@
 """Find and launch Chrome for Testing (or Playwright's Chromium) with extension loaded."""
 
+import atexit
 import json
 import os
 import platform
+import shutil
 import subprocess
 import sys
+import tempfile
+import threading
 from pathlib import Path
 
 PROFILE_DIR = Path.home() / ".browser-relay" / "chrome-profile"
+TEMPLATE_DIR = Path.home() / ".browser-relay" / "profile-template"
+EPHEMERAL_PREFIX = "browser-relay-profile-"
+EPHEMERAL_CACHE_MB = 64
+
+# Left out when a template is made from a used profile: caches, crash state,
+# and the singleton lock a running Chrome holds.
+_TEMPLATE_SKIP = {
+    "Cache", "Code Cache", "GPUCache", "DawnCache", "DawnGraphiteCache", "DawnWebGPUCache",
+    "GrShaderCache", "GraphiteDawnCache", "ShaderCache", "CacheStorage", "ScriptCache",
+    "Crashpad", "Crash Reports", "component_crx_cache", "optimization_guide_model_store",
+    "SingletonLock", "SingletonSocket", "SingletonCookie", "lockfile",
+}
 
 _PLAYWRIGHT_CHROMIUM_GLOBS = {
     "win32": [
@@ -75,9 +91,9 @@ def find_system_chrome() -> Path | None:
     return None
 
 
-def _clear_crash_flag():
+def _clear_crash_flag(profile_dir: Path | None = None):
     """Mark the Chrome profile as cleanly exited to suppress restore prompts."""
-    prefs_path = PROFILE_DIR / "Default" / "Preferences"
+    prefs_path = (profile_dir or PROFILE_DIR) / "Default" / "Preferences"
     if not prefs_path.exists():
         return
     try:
@@ -91,8 +107,118 @@ def _clear_crash_flag():
         pass
 
 
-def launch_chrome(extension_dir: Path, chrome_path: Path | None = None, url: str = "about:blank") -> subprocess.Popen:
-    """Launch Chrome with the extension loaded. Returns the process handle."""
+def ram_dir() -> Path:
+    """Where ephemeral profiles go: BROWSER_RELAY_EPHEMERAL_DIR, else /dev/shm (tmpfs), else the temp dir."""
+    override = os.environ.get("BROWSER_RELAY_EPHEMERAL_DIR")
+    if override:
+        return Path(override)
+    shm = Path("/dev/shm")
+    if shm.is_dir() and os.access(shm, os.W_OK):
+        return shm
+    return Path(tempfile.gettempdir())
+
+
+def prepare_template(source: Path | None = None, template_dir: Path | None = None) -> Path:
+    """Build the template ephemeral profiles are cloned from.
+
+    With ``source``, an existing profile is copied without its caches and
+    crash state; otherwise the template is an empty profile. Either way it is
+    marked as cleanly exited, so clones never need their Preferences fixed up.
+    """
+    template_dir = template_dir or TEMPLATE_DIR
+    template_dir.parent.mkdir(parents=True, exist_ok=True)
+    # Built beside the old template and swapped in, so a clone never sees half of one.
+    staging = Path(tempfile.mkdtemp(prefix=".template-", dir=template_dir.parent))
+    try:
+        if source is not None:
+            shutil.copytree(
+                source, staging, symlinks=True, dirs_exist_ok=True,
+                ignore=lambda _dir, names: [n for n in names if n in _TEMPLATE_SKIP],
+            )
+        (staging / "Default").mkdir(exist_ok=True)
+        prefs_path = staging / "Default" / "Preferences"
+        if not prefs_path.exists():
+            prefs_path.write_text(json.dumps({"profile": {}}), encoding="utf-8")
+        _clear_crash_flag(staging)
+        if template_dir.exists():
+            shutil.rmtree(template_dir)
+        staging.rename(template_dir)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return template_dir
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def remove_stale_profiles(root: Path | None = None) -> list[Path]:
+    """Delete ephemeral profiles whose owning process is gone (e.g. after a crash)."""
+    removed = []
+    for path in (root or ram_dir()).glob(f"{EPHEMERAL_PREFIX}*"):
+        pid = path.name[len(EPHEMERAL_PREFIX):].split("-", 1)[0]
+        if pid.isdigit() and not _pid_alive(int(pid)):
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path)
+    return removed
+
+
+class EphemeralProfile:
+    """A throwaway profile cloned from the template into RAM-backed storage."""
+
+    def __init__(self, template_dir: Path | None = None, root: Path | None = None):
+        template_dir = template_dir or TEMPLATE_DIR
+        if not (template_dir / "Default" / "Preferences").exists():
+            prepare_template(template_dir=template_dir)
+        root = root or ram_dir()
+        root.mkdir(parents=True, exist_ok=True)
+        remove_stale_profiles(root)
+        # The owner's pid is in the name so stale profiles can be recognised.
+        self.path = Path(tempfile.mkdtemp(prefix=f"{EPHEMERAL_PREFIX}{os.getpid()}-", dir=root))
+        shutil.copytree(template_dir, self.path, symlinks=True, dirs_exist_ok=True)
+
+    def cleanup(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def _remove_after_exit(proc: subprocess.Popen, profile: EphemeralProfile) -> None:
+    proc.wait()
+    profile.cleanup()
+
+
+def _stop_and_remove(proc: subprocess.Popen, profile: EphemeralProfile) -> None:
+    """At interpreter exit: a browser cannot outlive its ephemeral profile."""
+    if proc.poll() is None:
+        proc.terminate()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+    profile.cleanup()
+
+
+def launch_chrome(
+    extension_dir: Path,
+    chrome_path: Path | None = None,
+    url: str = "about:blank",
+    ephemeral: bool = False,
+    cache_size_mb: int | None = None,
+) -> subprocess.Popen:
+    """Launch Chrome with the extension loaded. Returns the process handle.
+
+    ``ephemeral`` runs Chrome on a fresh clone of the profile template in
+    RAM-backed storage, deleted when Chrome exits; its disk cache is capped
+    at ``cache_size_mb`` (default EPHEMERAL_CACHE_MB). Otherwise the
+    persistent PROFILE_DIR is used.
+    """
     if chrome_path is None:
         chrome_path = find_chrome_for_testing()
     if chrome_path is None:
@@ -101,21 +227,39 @@ def launch_chrome(extension_dir: Path, chrome_path: Path | None = None, url: str
             "uv run playwright install chromium"
         )
 
-    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
-    _clear_crash_flag()
+    profile = None
+    if ephemeral:
+        profile = EphemeralProfile()
+        profile_dir = profile.path
+        if cache_size_mb is None:
+            cache_size_mb = EPHEMERAL_CACHE_MB
+    else:
+        profile_dir = PROFILE_DIR
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        _clear_crash_flag()
 
     args = [
         str(chrome_path),
         f"--load-extension={extension_dir}",
-        f"--user-data-dir={PROFILE_DIR}",
+        f"--user-data-dir={profile_dir}",
         "--no-first-run",
         "--no-default-browser-check",
-        url,
     ]
+    if cache_size_mb is not None:
+        args.append(f"--disk-cache-size={cache_size_mb * 1024 * 1024}")
+    args.append(url)
 
-    proc = subprocess.Popen(
-        args,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
-    )
+    try:
+        proc = subprocess.Popen(
+            args,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+    except BaseException:
+        if profile is not None:
+            profile.cleanup()
+        raise
+    if profile is not None:
+        threading.Thread(target=_remove_after_exit, args=(proc, profile), daemon=True).start()
+        atexit.register(_stop_and_remove, proc, profile)
     return proc
@@ -0,0 +1,12 @@
+"""Command-line interface.
+
+``BROWSER_RELAY_PROFILE=DIR`` profiles a whole CLI run, imports included
+(see ``browser_relay.profiling``), so it is checked before anything else loads.
+"""
+
+import os
+
+if os.environ.get("BROWSER_RELAY_PROFILE"):
+    from browser_relay import profiling
+
+    profiling.start(os.environ["BROWSER_RELAY_PROFILE"], "cli")
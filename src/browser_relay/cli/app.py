@@ -1,8 +1,12 @@
 """CLI for browser-relay -- send commands to Chrome via the relay server."""
 
 import base64
+import gzip
 import json
+import os
+import queue
 import shutil
+import socket
 import sys
 import threading
 import time
@@ -12,25 +16,45 @@ from typing import Optional
 import httpx
 import typer
 
+from browser_relay import client, profiling, snapshot_index, snapshot_text
+from browser_relay.relay.events import EVENT_TYPES
+from browser_relay.relay.federation import TOKEN_ENV, is_loopback
+from browser_relay.relay.queue import PRIORITIES
+
 app = typer.Typer(name="browser-relay", help="Undetectable browser automation via Chrome extension relay.")
 
-RELAY_URL = "http://127.0.0.1:18321"
+RELAY_URL = client.RELAY_URL
+SOCKET_PATH = client.SOCKET_PATH
+SNAPSHOT_DIR = snapshot_index.INDEX_DIR
 EXTENSION_DIR = Path(__file__).resolve().parent.parent.parent.parent / "extension"
 INSTALL_DIR = Path.home() / ".browser-relay" / "extension"
+STATE_DIR = Path.home() / ".browser-relay" / "state"
+STATE_VERSION = 1
+
+BLOCKABLE_TYPES = (
+    "sub_frame", "stylesheet", "script", "image", "font", "object", "xmlhttprequest",
+    "ping", "csp_report", "media", "websocket", "webtransport", "webbundle", "other",
+)
+
+_options = {"priority": "normal", "browser": None}
 
 
-def _send_command(action: str, params: dict | None = None, timeout: float = 30.0) -> dict:
-    """Post a command to the relay and wait for the result."""
-    params = params or {}
-    with httpx.Client(base_url=RELAY_URL, timeout=5.0) as client:
-        resp = client.post("/command", json={"action": action, "params": params})
-        resp.raise_for_status()
-        cmd_info = resp.json()
-        typer.echo(f"Command queued: {cmd_info['id']}")
+def _connect(timeout: float = 5.0) -> httpx.Client:
+    """HTTP client for the relay, over its Unix socket when it has one."""
+    return client.connect(RELAY_URL, SOCKET_PATH, timeout=timeout)
 
-        result = client.get("/result", params={"timeout": str(timeout)}, timeout=timeout + 5)
-        result.raise_for_status()
-        return result.json()
+
+def _send_command(action: str, params: dict | None = None, timeout: float = 30.0, quiet: bool = False) -> dict:
+    """Post a command to the relay and wait for the result.
+
+    The command carries ``timeout`` as its deadline. If the wait times out or
+    is interrupted, the command is cancelled on the relay.
+    """
+    with client.RelayClient(RELAY_URL, SOCKET_PATH, _options["priority"], _options["browser"]) as relay:
+        cmd_id = relay.submit(action, params, timeout=timeout)
+        if not quiet:
+            typer.echo(f"Command queued: {cmd_id}", err=True)
+        return relay.wait(cmd_id, timeout)
 
 
 def _print_result(data: dict):
@@ -46,6 +70,123 @@ def _print_result(data: dict):
         raise typer.Exit(1)
 
 
+def _iter_stream(result: dict):
+    """Yield the decoded bytes of a result the extension uploaded in chunks."""
+    with _connect(timeout=30.0) as http:
+        with http.stream("GET", f"/result/{result['id']}/stream") as resp:
+            resp.raise_for_status()
+            yield from resp.iter_bytes()
+
+
+def _utf8_prefix(data: bytes, limit: int) -> bytes:
+    """At most ``limit`` bytes of ``data``, not ending inside a UTF-8 character."""
+    if len(data) <= limit:
+        return data
+    cut = limit
+    while cut > 0 and data[cut] & 0xC0 == 0x80:
+        cut -= 1
+    return data[:cut]
+
+
+def _split_utf8_tail(data: bytes) -> tuple[bytes, bytes]:
+    """``data`` as whole characters and the start of one the next chunk completes."""
+    for k in range(1, min(4, len(data)) + 1):
+        lead = data[-k]
+        if lead & 0xC0 != 0x80:
+            need = 4 if lead >= 0xF0 else 3 if lead >= 0xE0 else 2 if lead >= 0xC0 else 1
+            return (data[:-k], data[-k:]) if need > k else (data, b"")
+    return data, b""
+
+
+def _limit_utf8(chunks, max_bytes: int | None):
+    """Yield at most ``max_bytes`` bytes of UTF-8 text, ending on a character boundary.
+
+    Stops reading as soon as the limit is reached.
+    """
+    if max_bytes is None:
+        yield from chunks
+        return
+    carry = b""
+    for data in chunks:
+        data = carry + data
+        if len(data) > max_bytes:
+            yield _utf8_prefix(data, max_bytes)
+            return
+        whole, carry = _split_utf8_tail(data)
+        yield whole
+        max_bytes -= len(whole)
+    yield carry
+
+
+def _load_result(result: dict) -> dict:
+    """Return a result whole, fetching it from the relay if it was streamed as JSON."""
+    stream = result.get("stream")
+    if not stream or stream.get("format") != "json":
+        return result
+    loaded = json.loads(b"".join(_iter_stream(result)))
+    loaded.setdefault("id", result.get("id"))
+    return loaded
+
+
+def _emit_result(
+    result: dict, field: str, output: Path | None = None, max_bytes: int | None = None, raw: bool = False
+):
+    """Print a result as JSON, or write its ``field`` raw to ``output`` (or stdout with ``raw``).
+
+    The format never depends on whether the payload was small enough to come
+    back inline; raw output of a streamed payload is written without
+    buffering it. ``max_bytes`` caps the field's UTF-8 bytes either way.
+    """
+    if not result.get("ok"):
+        _print_result(result)
+        return
+
+    stream = result.get("stream")
+    if stream and stream.get("format") == "json":
+        result, stream = _load_result(result), None
+    if stream:
+        field = stream.get("field", field)
+        chunks = _limit_utf8(_iter_stream(result), max_bytes)
+    else:
+        value = result.get(field)
+        data = value.encode("utf-8") if isinstance(value, str) else json.dumps(value, ensure_ascii=False).encode("utf-8")
+        chunks = [_utf8_prefix(data, max_bytes) if max_bytes is not None else data]
+
+    if output is None and not raw:
+        if stream or len(chunks[0]) < len(data):
+            text = b"".join(chunks).decode("utf-8")
+            result = {**{k: v for k, v in result.items() if k != "stream"}, field: text}
+        _print_result(result)
+        return
+
+    written = 0
+    sink = output.open("wb") if output else typer.get_binary_stream("stdout")
+    try:
+        for data in chunks:
+            sink.write(data)
+            written += len(data)
+    finally:
+        if output:
+            sink.close()
+        else:
+            sink.flush()
+    if output:
+        typer.echo(f"Wrote {written} bytes to: {output}")
+
+
+def _load_schema(value: str) -> dict:
+    """Read an extraction schema from a JSON file or an inline JSON string."""
+    path = Path(value)
+    try:
+        text = path.read_text(encoding="utf-8") if path.is_file() else value
+        schema = json.loads(text)
+    except (OSError, ValueError) as e:
+        raise typer.BadParameter(f"not a JSON file or JSON string: {e}", param_hint="SCHEMA")
+    if not isinstance(schema, dict) or "rows" not in schema:
+        raise typer.BadParameter("schema must be an object with a 'rows' selector", param_hint="SCHEMA")
+    return schema
+
+
 def _target_params(selector_or_ref: str) -> dict:
     """Map a selector/ref argument into relay params."""
     if selector_or_ref.startswith("e") and selector_or_ref[1:].isdigit():
@@ -58,8 +199,8 @@ def _wait_for_extension(timeout: float = 15.0) -> bool:
     deadline = time.time() + timeout
     while time.time() < deadline:
         try:
-            with httpx.Client(base_url=RELAY_URL, timeout=2.0) as client:
-                resp = client.get("/status")
+            with _connect(timeout=2.0) as http:
+                resp = http.get("/status")
                 if resp.status_code == 200 and resp.json().get("extension_connected"):
                     return True
         except Exception:
@@ -68,12 +209,37 @@ def _wait_for_extension(timeout: float = 15.0) -> bool:
     return False
 
 
+@app.callback()
+def main(
+    priority: str = typer.Option(
+        "normal",
+        envvar="BROWSER_RELAY_PRIORITY",
+        help="Queue priority for commands: interactive, normal or background",
+    ),
+    browser: Optional[str] = typer.Option(
+        None,
+        envvar="BROWSER_RELAY_BROWSER",
+        help="Run commands on this browser, on this relay or any federated peer (see 'browsers')",
+    ),
+):
+    """Undetectable browser automation via Chrome extension relay."""
+    if priority not in PRIORITIES:
+        raise typer.BadParameter(f"must be one of: {', '.join(PRIORITIES)}", param_hint="--priority")
+    _options["priority"] = priority
+    _options["browser"] = browser
+
+
 @app.command()
 def start(
     host: str = typer.Option("127.0.0.1", help="Relay server host"),
     port: int = typer.Option(18321, help="Relay server port"),
     url: str = typer.Option("about:blank", help="Initial URL to open"),
     system_chrome: bool = typer.Option(False, "--system-chrome", help="Use system Chrome (requires manual extension load)"),
+    state: Optional[str] = typer.Option(None, "--state", help="Load saved session state before opening the URL"),
+    ephemeral: bool = typer.Option(
+        False, "--ephemeral", help="Use a throwaway profile cloned from the template into RAM, deleted on exit"
+    ),
+    cache_mb: Optional[int] = typer.Option(None, "--cache-mb", min=1, help="Cap Chrome's disk cache [default: 64 with --ephemeral]"),
 ):
     """Start relay server + launch Chrome with extension loaded. One command, zero clicks."""
     from browser_relay.chrome import find_chrome_for_testing, find_system_chrome, launch_chrome
@@ -98,17 +264,29 @@ def start(
 
     typer.echo(f"Starting relay server on {host}:{port}")
     server_thread = threading.Thread(
-        target=_run_relay, args=(host, port), daemon=True
+        target=_run_relay, args=(host, port), kwargs={"socket_path": _socket_for(port)}, daemon=True
     )
     server_thread.start()
     time.sleep(0.5)
 
+    saved = _read_state(state) if state else None
+
     typer.echo(f"Launching Chrome with extension...")
-    proc = launch_chrome(INSTALL_DIR, chrome_path=chrome_path, url=url)
+    proc = launch_chrome(
+        INSTALL_DIR,
+        chrome_path=chrome_path,
+        url="about:blank" if saved else url,
+        ephemeral=ephemeral,
+        cache_size_mb=cache_mb,
+    )
     typer.echo(f"Chrome PID: {proc.pid}")
 
     typer.echo("Waiting for extension to connect...")
     if _wait_for_extension():
+        if saved:
+            _apply_state(saved)
+            if url != "about:blank":
+                _send_command("navigate", {"url": url}, quiet=True)
         typer.secho("Extension connected. Ready.", fg=typer.colors.GREEN)
     else:
         typer.secho("Extension did not connect within 15s. Check chrome://extensions", fg=typer.colors.YELLOW)
@@ -135,9 +313,49 @@ def _install_extension():
             shutil.copy2(f, INSTALL_DIR / f.name)
 
 
-def _run_relay(host: str, port: int):
-    """Run Flask relay in a thread."""
-    from browser_relay.relay.server import app as flask_app
+def _socket_for(port: int) -> Path:
+    """The Unix socket a relay on ``port`` listens on by default."""
+    return SOCKET_PATH if port == client.DEFAULT_PORT else client.socket_path_for(port)
+
+
+def _run_relay(
+    host: str,
+    port: int,
+    peers: list[str] | None = None,
+    advertise_url: str | None = None,
+    federation_token: str | None = None,
+    socket_path: Path | None = SOCKET_PATH,
+    result_ttl: float | None = None,
+    max_result_mb: int | None = None,
+    profile_dir: Path | None = None,
+):
+    """Run Flask relay in a thread, federated with ``peers`` if given.
+
+    Unless ``socket_path`` is None the relay also listens on that Unix socket,
+    which local CLI calls prefer; the extension always uses TCP. While the
+    process is being profiled the relay's locks are timed too.
+    """
+    from browser_relay.relay.server import app as flask_app, serve_unix_socket
+
+    relay = flask_app.extensions["browser_relay"]
+    profiler = profiling.start(profile_dir, "relay") if profile_dir is not None else profiling.active()
+    if profiler is not None:
+        relay.use_lock(profiler.timed_lock("relay"))
+        relay.federation.use_lock(profiler.timed_lock("federation"))
+    if socket_path is not None and hasattr(socket, "AF_UNIX"):
+        serve_unix_socket(flask_app, socket_path)
+    if result_ttl is not None:
+        relay.store.ttl = result_ttl
+    if max_result_mb is not None:
+        relay.store.max_bytes = max_result_mb * 1024 * 1024
+    if peers or advertise_url:
+        federation = relay.federation
+        federation.self_url = (advertise_url or f"http://{host}:{port}").rstrip("/")
+        if federation_token:
+            federation.token = federation_token
+        for peer in peers or []:
+            federation.add_peer(peer)
+        federation.start(relay.advertise)
     flask_app.run(host=host, port=port, debug=False, use_reloader=False)
 
 
@@ -161,19 +379,59 @@ def install():
 def server(
     host: str = typer.Option("127.0.0.1", help="Host to bind the relay server"),
     port: int = typer.Option(18321, help="Port for the relay server"),
+    peer: list[str] = typer.Option([], "--peer", help="Federate with the relay at this URL (repeatable)"),
+    advertise_url: Optional[str] = typer.Option(
+        None, help="URL peers use to reach this relay (default: http://HOST:PORT)"
+    ),
+    federation_token: Optional[str] = typer.Option(
+        None, envvar=TOKEN_ENV, help="Shared secret federation peers must present"
+    ),
+    socket_path: Optional[Path] = typer.Option(
+        None, "--socket", help="Unix socket for local clients (default: ~/.browser-relay/relay-PORT.sock)"
+    ),
+    no_socket: bool = typer.Option(False, "--no-socket", help="Listen on TCP only"),
+    result_ttl: float = typer.Option(300.0, help="Seconds an unclaimed result is kept"),
+    max_result_mb: int = typer.Option(512, help="Budget for unclaimed results, in memory and spilled to disk"),
+    profile: Optional[Path] = typer.Option(
+        None, "--profile", help="Sample stacks and time locks; write flamegraph and lock stats here on exit"
+    ),
 ):
     """Start only the relay server (without launching Chrome)."""
+    if socket_path is None:
+        socket_path = _socket_for(port)
+    if (peer or advertise_url) and not federation_token and not is_loopback(host):
+        typer.echo(
+            f"Refusing to federate on {host} without a token: set --federation-token or {TOKEN_ENV}.", err=True
+        )
+        raise typer.Exit(1)
     typer.echo(f"Starting relay server on {host}:{port}")
+    if not no_socket:
+        typer.echo(f"Local clients: {socket_path}")
+    for url in peer:
+        typer.echo(f"Federating with {url}")
+    if profile is not None:
+        typer.echo(f"Profiling to {profile}")
     typer.echo("Press Ctrl+C to stop.")
-    _run_relay(host=host, port=port)
+    _run_relay(
+        host=host,
+        port=port,
+        peers=peer,
+        advertise_url=advertise_url,
+        federation_token=federation_token,
+        socket_path=None if no_socket else socket_path,
+        result_ttl=result_ttl,
+        max_result_mb=max_result_mb,
+        profile_dir=profile,
+    )
 
 
 @app.command()
 def status():
     """Check relay server and extension connectivity."""
+    transport = client.SocketTransport(SOCKET_PATH) if client.socket_available(SOCKET_PATH) else None
     try:
-        with httpx.Client(base_url=RELAY_URL, timeout=3.0) as client:
-            resp = client.get("/status")
+        with client.connect(RELAY_URL, SOCKET_PATH, timeout=3.0, transport=transport) as http:
+            resp = http.get("/status")
             resp.raise_for_status()
             data = resp.json()
     except httpx.ConnectError:
@@ -187,8 +445,15 @@ def status():
     ext_ok = data.get("extension_connected", False)
 
     typer.echo(f"Server:    {'connected' if server_ok else 'down'}")
+    over_socket = transport is not None and transport.kind == "unix"
+    typer.echo(f"Transport: {f'unix {SOCKET_PATH}' if over_socket else f'tcp {RELAY_URL}'}")
     typer.echo(f"Extension: {'connected' if ext_ok else 'not connected'}")
 
+    peers = data.get("federation", {}).get("peers", [])
+    if peers:
+        reachable = sum(1 for p in peers if p.get("reachable"))
+        typer.echo(f"Peers:     {reachable}/{len(peers)} reachable")
+
     if not ext_ok:
         typer.echo("")
         typer.echo("Extension not polling. Make sure:")
@@ -196,13 +461,113 @@ def status():
         typer.echo("  - The extension is loaded (chrome://extensions)")
 
 
+@app.command()
+def browsers():
+    """List browsers reachable through this relay and its federation peers."""
+    try:
+        with _connect(timeout=5.0) as http:
+            resp = http.get("/federation/browsers")
+            resp.raise_for_status()
+    except httpx.ConnectError:
+        typer.secho("Relay server is not running.", fg=typer.colors.RED, err=True)
+        raise typer.Exit(1)
+    entries = resp.json()["browsers"]
+    if not entries:
+        typer.echo("No browsers connected.")
+        return
+    for entry in entries:
+        where = "local" if entry["local"] else entry.get("relay_url", entry["relay_id"])
+        typer.echo(f"{entry['browser']}\t{where}")
+
+
+@app.command()
+def events(
+    follow: bool = typer.Option(False, "--follow", "-f", help="Keep streaming new events instead of exiting"),
+    tab_id: Optional[int] = typer.Option(None, "--tab-id", help="Only events from this tab"),
+    types: Optional[str] = typer.Option(None, "--type", help=f"Comma-separated event types: {', '.join(EVENT_TYPES)}"),
+    since: Optional[int] = typer.Option(None, "--since", help="Resume after this event id"),
+):
+    """Print page events as JSON lines: navigations, loads, console, dialogs, DOM mutations."""
+    wanted = [t.strip() for t in types.split(",") if t.strip()] if types else None
+    unknown = set(wanted or ()) - set(EVENT_TYPES)
+    if unknown:
+        raise typer.BadParameter(f"unknown type(s): {', '.join(sorted(unknown))}", param_hint="--type")
+    try:
+        with client.RelayClient(RELAY_URL, SOCKET_PATH, browser=_options["browser"]) as relay:
+            for event in relay.events(tab_id, wanted, since, follow):
+                if event["type"] == "gap":
+                    typer.secho(f"Missed {event['missed']} events (dropped by the relay)", fg=typer.colors.YELLOW, err=True)
+                    continue
+                typer.echo(json.dumps(event, ensure_ascii=False))
+    except httpx.ConnectError:
+        typer.secho("Relay server is not running.", fg=typer.colors.RED, err=True)
+        raise typer.Exit(1)
+    except KeyboardInterrupt:
+        pass
+
+
+def _parse_types(value: str, param_hint: str) -> list[str]:
+    types = [t.strip() for t in value.split(",") if t.strip()]
+    unknown = [t for t in types if t not in BLOCKABLE_TYPES]
+    if unknown:
+        raise typer.BadParameter(
+            f"unknown resource type(s) {', '.join(unknown)}; choose from {', '.join(BLOCKABLE_TYPES)}",
+            param_hint=param_hint,
+        )
+    return types
+
+
+def _load_domains(path: Path) -> list[str]:
+    """Domains from a file, one per line; blank lines and # comments ignored."""
+    domains = []
+    for line in path.read_text().splitlines():
+        domain = line.split("#", 1)[0].strip().lower()
+        if domain.startswith("*."):
+            domain = domain[2:]
+        if domain:
+            domains.append(domain)
+    return domains
+
+
+@app.command()
+def block(
+    types: Optional[str] = typer.Option(None, "--types", help="Comma-separated resource types, e.g. image,font,media"),
+    domains: Optional[Path] = typer.Option(None, "--domains", help="File of domains to block, one per line"),
+    domain: list[str] = typer.Option([], "--domain", help="Domain to block (repeatable)"),
+    clear: bool = typer.Option(False, "--clear", help="Remove all blocking rules"),
+    stats: bool = typer.Option(False, "--stats", help="Show the active rules and blocked-request counters"),
+):
+    """Block resource types and domains in every tab, to make page loads lean."""
+    if stats:
+        _print_result(_send_command("block_stats"))
+        return
+    params = {"types": [], "domains": []}
+    if not clear:
+        if types:
+            params["types"] = _parse_types(types, "--types")
+        params["domains"] = (_load_domains(domains) if domains else []) + [d.lower() for d in domain]
+        if not params["types"] and not params["domains"]:
+            raise typer.BadParameter("give --types, --domains or --domain (or --clear)")
+    _print_result(_send_command("block", params))
+
+
 @app.command()
 def navigate(
     url: str = typer.Argument(help="URL to navigate to"),
     timeout: float = typer.Option(30.0, help="Navigation timeout in seconds"),
+    block: Optional[str] = typer.Option(
+        None, "--block", help="Block these resource types for this navigation instead of the global rules"
+    ),
+    no_block: bool = typer.Option(False, "--no-block", help="Load everything for this navigation"),
 ):
     """Navigate the active tab to a URL."""
-    result = _send_command("navigate", {"url": url, "timeout": int(timeout * 1000)}, timeout=timeout)
+    params = {"url": url, "timeout": int(timeout * 1000)}
+    if no_block:
+        params["block"] = False
+    elif block is not None:
+        params["block"] = {"types": _parse_types(block, "--block")}
+    result = _send_command("navigate", params, timeout=timeout)
+    _forget_snapshot(result)
     _print_result(result)
 
 
@@ -215,38 +580,317 @@ def click(
     _print_result(result)
 
 
+TYPE_MODES = ("keys", "fast", "human")
+
+
 @app.command()
 def type_text(
     selector_or_ref: str = typer.Argument(help="CSS selector or snapshot ref (e.g. e3)"),
     text: str = typer.Argument(help="Text to type"),
     clear: bool = typer.Option(False, "--clear", help="Clear field before typing"),
+    mode: str = typer.Option("keys", "--mode", help="keys (events per character), fast (one insert) or human (paced in page)"),
+    delay_ms: int = typer.Option(80, "--delay-ms", help="Mean delay between keys in human mode"),
+    jitter_ms: int = typer.Option(40, "--jitter-ms", help="Random +/- variation of the delay in human mode"),
 ):
     """Type text into an input element."""
+    if mode not in TYPE_MODES:
+        raise typer.BadParameter(f"must be one of: {', '.join(TYPE_MODES)}", param_hint="--mode")
     params = _target_params(selector_or_ref)
-    params.update({"text": text, "clear": clear})
-    result = _send_command("type", params)
+    params.update({"text": text, "clear": clear, "mode": mode})
+    if mode == "human":
+        params.update({"delay_ms": delay_ms, "jitter_ms": jitter_ms})
+        timeout = len(text) * (delay_ms + jitter_ms) / 1000 + 30.0
+        result = _send_command("type", params, timeout=timeout)
+    else:
+        result = _send_command("type", params)
     _print_result(result)
 
 
+def _navigation(tab_id: int | None = None) -> dict | None:
+    """The relay's navigation sequence numbers, or None if it cannot be asked."""
+    params = {"tab_id": tab_id} if tab_id is not None else {}
+    if _options["browser"]:
+        params["browser"] = _options["browser"]
+    try:
+        with _connect(timeout=2.0) as http:
+            resp = http.get("/navigation", params=params)
+            resp.raise_for_status()
+            return resp.json()
+    except (httpx.HTTPError, ValueError):
+        return None
+
+
+def _take_snapshot(params: dict, quiet: bool = False) -> dict:
+    """Snapshot a tab and index it locally for ``find``."""
+    nav = _navigation()
+    result = _send_command("snapshot", params, quiet=quiet)
+    if result.get("ok"):
+        result = _load_result(result)
+        if "tab_id" in result:
+            snapshot_index.SnapshotIndex(SNAPSHOT_DIR).save(result, nav["seq"] if nav else None, _options["browser"])
+    return result
+
+
+def _forget_snapshot(result: dict) -> None:
+    """Drop the indexed snapshot of a tab this CLI just navigated."""
+    if result.get("ok") and isinstance(result.get("tab_id"), int):
+        snapshot_index.SnapshotIndex(SNAPSHOT_DIR).invalidate(result["tab_id"], _options["browser"])
+
+
+SNAPSHOT_FORMATS = ("json", "text")
+
+
 @app.command()
 def snapshot(
     interactive_only: bool = typer.Option(True, "--all/--interactive", help="Show all elements or interactive only"),
-    limit: int = typer.Option(200, help="Max elements to return"),
+    limit: Optional[int] = typer.Option(None, help="Max elements to collect [default: 200, or 2000 with --budget-tokens]"),
+    budget_tokens: Optional[int] = typer.Option(
+        None, "--budget-tokens", min=1, help="Keep the best-ranked elements that fit this many tokens"
+    ),
+    output_format: str = typer.Option("json", "--format", help="json, or text: one compact line per element"),
 ):
-    """Get a DOM snapshot of the current page."""
-    result = _send_command("snapshot", {"interactive_only": interactive_only, "limit": limit})
-    _print_result(result)
+    """Get a DOM snapshot of the current page (and index it for 'find')."""
+    if output_format not in SNAPSHOT_FORMATS:
+        raise typer.BadParameter(f"must be one of: {', '.join(SNAPSHOT_FORMATS)}", param_hint="--format")
+    if limit is None:
+        # A budget ranks the whole page, not just its first elements.
+        limit = 2000 if budget_tokens else 200
+    result = _take_snapshot({"interactive_only": interactive_only, "limit": limit})
+    if not result.get("ok"):
+        _print_result(result)
+    if output_format == "text":
+        typer.echo(snapshot_text.render_text(result, budget_tokens))
+    elif budget_tokens:
+        # Printed exactly as it was measured, or the budget would not hold.
+        typer.echo(snapshot_text.compact_json(snapshot_text.trim_json(result, budget_tokens)))
+    else:
+        _print_result(result)
+
+
+@app.command()
+def find(
+    text: Optional[str] = typer.Argument(None, help="Text to look for; matched fuzzily"),
+    role: Optional[str] = typer.Option(None, "--role", help="ARIA role, explicit or implied by the tag"),
+    tag: Optional[str] = typer.Option(None, "--tag", help="Tag name"),
+    aria_label: Optional[str] = typer.Option(None, "--aria-label", help="Aria label; matched fuzzily"),
+    tab_id: Optional[int] = typer.Option(None, "--tab-id", help="Tab to search (default: last snapshotted)"),
+    limit: int = typer.Option(10, help="Max matches to print"),
+    min_score: float = typer.Option(snapshot_index.MIN_SCORE, help="Fuzzy match threshold, 0-1"),
+    refresh: bool = typer.Option(False, "--refresh", help="Snapshot again if the index is missing or stale"),
+    as_json: bool = typer.Option(False, "--json", help="Print matches as JSON"),
+):
+    """Find refs in the last snapshot without touching the browser."""
+    index = snapshot_index.SnapshotIndex(SNAPSHOT_DIR)
+    entry = index.load(tab_id, _options["browser"])
+    problem = None
+    if entry is None:
+        problem = "No snapshot indexed for this tab"
+    else:
+        nav = _navigation(entry["tab_id"])
+        try:
+            snapshot_index.check_fresh(entry, nav.get("tab_seq") if nav else None)
+        except snapshot_index.StaleIndex as e:
+            problem = str(e)
+    if problem:
+        if not refresh:
+            typer.secho(f"{problem}; run 'browser-relay snapshot' or pass --refresh.", fg=typer.colors.RED, err=True)
+            raise typer.Exit(1)
+        params = {"interactive_only": False, "limit": 2000}
+        if tab_id is not None:
+            params["tab_id"] = tab_id
+        result = _take_snapshot(params, quiet=True)
+        if not result.get("ok"):
+            _print_result(result)
+        entry = index.load(tab_id if tab_id is not None else result.get("tab_id"), _options["browser"])
+
+    matches = snapshot_index.find(entry["elements"], text, role, tag, aria_label, min_score)[:limit]
+    if not matches:
+        typer.secho("No matching elements.", fg=typer.colors.RED, err=True)
+        raise typer.Exit(1)
+    if as_json:
+        typer.echo(json.dumps([{**el, "score": round(score, 3)} for score, el in matches], indent=2, ensure_ascii=False))
+        return
+    for score, el in matches:
+        label = el.get("ariaLabel") or el.get("text") or el.get("placeholder") or ""
+        typer.echo(f"{el['ref']}\t{snapshot_index.role_of(el) or el['tag']}\t{json.dumps(label, ensure_ascii=False)}")
 
 
 @app.command()
 def evaluate(
-    expression: str = typer.Argument(help="JavaScript expression to evaluate"),
+    expression: Optional[str] = typer.Argument(None, help="JavaScript expression or function body to evaluate"),
+    script: Optional[str] = typer.Option(None, "--script", help="Run a registered script by name instead"),
+    args: Optional[str] = typer.Option(None, "--args", help="JSON value passed to the code as `args`"),
+    output: Optional[Path] = typer.Option(None, "--output", "-o", help="Write the result to a file"),
+    max_bytes: Optional[int] = typer.Option(None, "--max-bytes", help="Stop after this many bytes of output"),
+    raw: bool = typer.Option(False, "--raw", help="Print the result itself instead of JSON"),
 ):
-    """Evaluate JavaScript on the page."""
-    result = _send_command("evaluate", {"expression": expression})
+    """Evaluate JavaScript on the page.
+
+    Promises are awaited and the result comes back as JSON.
+    """
+    if (expression is None) == (script is None):
+        raise typer.BadParameter("give either an EXPRESSION or --script NAME")
+    params: dict = {"script": script} if script else {"expression": expression}
+    if args is not None:
+        try:
+            params["args"] = json.loads(args)
+        except ValueError as e:
+            raise typer.BadParameter(f"not valid JSON: {e}", param_hint="--args")
+    result = _send_command("evaluate", params)
+    _emit_result(result, "result", output, max_bytes, raw)
+
+
+script_app = typer.Typer(help="Register reusable scripts for `evaluate --script`.")
+app.add_typer(script_app, name="script")
+
+
+@script_app.command("register")
+def script_register(
+    name: str = typer.Argument(help="Name to invoke the script by"),
+    file: Path = typer.Argument(help="JavaScript file: an async function body that receives `args`"),
+):
+    """Upload a script once; tabs compile and cache it on first use."""
+    result = _send_command("register_script", {"name": name, "source": file.read_text(encoding="utf-8")})
     _print_result(result)
 
 
+@script_app.command("list")
+def script_list():
+    """List registered scripts."""
+    result = _send_command("list_scripts")
+    _print_result(result)
+
+
+@script_app.command("remove")
+def script_remove(
+    name: str = typer.Argument(help="Registered script name"),
+):
+    """Remove a registered script."""
+    result = _send_command("unregister_script", {"name": name})
+    _print_result(result)
+
+
+profile_app = typer.Typer(help="Manage the template that --ephemeral profiles are cloned from.")
+app.add_typer(profile_app, name="profile")
+
+
+@profile_app.command("template")
+def profile_template(
+    source: Optional[Path] = typer.Option(
+        None, "--from", help="Copy this profile (without caches and crash state); default: an empty profile"
+    ),
+):
+    """(Re)build the ephemeral profile template."""
+    from browser_relay.chrome import prepare_template
+
+    if source is not None and not source.is_dir():
+        raise typer.BadParameter(f"not a directory: {source}", param_hint="--from")
+    path = prepare_template(source)
+    typer.echo(f"Template ready: {path}")
+
+
+@profile_app.command("clean")
+def profile_clean():
+    """Delete ephemeral profiles left behind by processes that crashed."""
+    from browser_relay.chrome import remove_stale_profiles
+
+    removed = remove_stale_profiles()
+    for path in removed:
+        typer.echo(f"Removed {path}")
+    if not removed:
+        typer.echo("No stale profiles.")
+
+
+state_app = typer.Typer(help="Save and restore cookies, localStorage and sessionStorage.")
+app.add_typer(state_app, name="state")
+
+
+def _state_path(name: str) -> Path:
+    """A bare name lives in STATE_DIR; anything path-like is used as given."""
+    if os.sep in name or "/" in name or name.endswith(".json.gz"):
+        return Path(name).expanduser()
+    return STATE_DIR / f"{name}.json.gz"
+
+
+def _read_state(name: str) -> dict:
+    path = _state_path(name)
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        typer.secho(f"No saved state: {path}", fg=typer.colors.RED, err=True)
+        raise typer.Exit(1)
+    except (OSError, ValueError) as e:
+        typer.secho(f"Unreadable state file {path}: {e}", fg=typer.colors.RED, err=True)
+        raise typer.Exit(1)
+    if state.get("version") != STATE_VERSION:
+        typer.secho(f"Unsupported state version in {path}", fg=typer.colors.RED, err=True)
+        raise typer.Exit(1)
+    return state
+
+
+def _apply_state(state: dict, tab_id: int | None = None) -> dict:
+    params = {"cookies": state.get("cookies", []), "storage": state.get("storage", {})}
+    if tab_id is not None:
+        params["tab_id"] = tab_id
+    result = _send_command("state_import", params, timeout=60.0, quiet=True)
+    if not result.get("ok"):
+        _print_result(result)
+        raise typer.Exit(1)
+    # New cookies and storage change what every tab of the browser renders.
+    snapshot_index.SnapshotIndex(SNAPSHOT_DIR).invalidate(browser=_options["browser"])
+    typer.echo(f"Loaded {result['cookies']} cookies and storage for {result['origins']} origins", err=True)
+    for name in result.get("failed_cookies", []):
+        typer.secho(f"Could not set cookie {name}", fg=typer.colors.YELLOW, err=True)
+    for origin in result.get("failed_origins", []):
+        typer.secho(f"Could not write storage for {origin}: its page redirected away", fg=typer.colors.YELLOW, err=True)
+    return result
+
+
+@state_app.command("save")
+def state_save(
+    name: str = typer.Argument(help="State name (stored under ~/.browser-relay/state) or a .json.gz path"),
+    origin: Optional[list[str]] = typer.Option(None, "--origin", help="Origin to capture (repeatable; default: origins of open tabs)"),
+):
+    """Capture cookies and web storage from the browser into a compact file."""
+    result = _load_result(_send_command("state_export", {"origins": origin or []}, timeout=60.0))
+    if not result.get("ok"):
+        _print_result(result)
+        raise typer.Exit(1)
+    state = {
+        "version": STATE_VERSION,
+        "saved_at": time.time(),
+        "origins": result["origins"],
+        "cookies": result["cookies"],
+        "storage": result["storage"],
+    }
+    path = _state_path(name)
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    # Cookies are credentials: create the file private rather than chmod it afterwards.
+    fd = os.open(path.with_suffix(".tmp"), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as f:
+        f.write(json.dumps(state, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+    path.with_suffix(".tmp").replace(path)
+    keys = sum(len(s.get("local", {})) + len(s.get("session", {})) for s in state["storage"].values())
+    typer.echo(f"Saved {len(state['cookies'])} cookies and {keys} storage keys for {len(state['origins'])} origins to {path}")
+
+
+@state_app.command("load")
+def state_load(
+    name: str = typer.Argument(help="State name or .json.gz path"),
+    tab_id: Optional[int] = typer.Option(None, "--tab-id", help="Tab to receive sessionStorage (default: active tab)"),
+):
+    """Apply saved cookies and storage in bulk, before the first navigation."""
+    _apply_state(_read_state(name), tab_id)
+
+
+@state_app.command("list")
+def state_list():
+    """List saved states."""
+    for path in sorted(STATE_DIR.glob("*.json.gz")):
+        typer.echo(f"{path.name[:-len('.json.gz')]}\t{path.stat().st_size} bytes")
+
+
 @app.command()
 def scroll(
     selector_or_ref: Optional[str] = typer.Option(None, help="CSS selector or ref to scroll into view"),
@@ -274,10 +918,20 @@ def get_text(
 @app.command()
 def get_html(
     selector_or_ref: str = typer.Argument(help="CSS selector or snapshot ref (e.g. e3)"),
+    output: Optional[Path] = typer.Option(None, "--output", "-o", help="Write the HTML to a file"),
+    max_bytes: Optional[int] = typer.Option(None, "--max-bytes", help="Truncate the HTML to this many bytes"),
+    raw: bool = typer.Option(False, "--raw", help="Print the HTML itself instead of JSON"),
 ):
-    """Get HTML content of an element."""
-    result = _send_command("get_html", _target_params(selector_or_ref))
-    _print_result(result)
+    """Get HTML content of an element.
+
+    Large documents arrive in compressed chunks; with --raw or --output they
+    are streamed straight to stdout or the file.
+    """
+    params = _target_params(selector_or_ref)
+    if max_bytes is not None:
+        params["max_bytes"] = max_bytes
+    result = _send_command("get_html", params)
+    _emit_result(result, "html", output, max_bytes, raw)
 
 
 @app.command()
@@ -310,6 +964,175 @@ def count(
     _print_result(result)
 
 
+def _extract_pages(
+    spec: dict,
+    fmt: str = "rows",
+    page_size: int = 500,
+    max_rows: int | None = None,
+    tab_id: int | None = None,
+    quiet: bool = False,
+):
+    """Yield extraction pages until the rows (or max_rows) run out or a page fails."""
+    fetched = 0
+    offset = 0
+    while offset is not None and (max_rows is None or fetched < max_rows):
+        limit = page_size if max_rows is None else min(page_size, max_rows - fetched)
+        params = {"schema": spec, "offset": offset, "limit": limit, "format": fmt}
+        if tab_id is not None:
+            params["tab_id"] = tab_id
+        page = _load_result(_send_command("extract", params, quiet=quiet))
+        yield page
+        if not page.get("ok"):
+            return
+        fetched += page["count"]
+        offset = page["next_offset"]
+
+
+@app.command()
+def extract(
+    schema: str = typer.Argument(help="Schema as a JSON file path or inline JSON"),
+    fmt: str = typer.Option("ndjson", "--format", help="ndjson (one row per line) or columnar"),
+    page_size: int = typer.Option(500, "--page-size", help="Rows fetched per round trip"),
+    max_rows: Optional[int] = typer.Option(None, "--max-rows", help="Stop after this many rows"),
+):
+    """Extract structured rows in bulk, entirely inside the page.
+
+    Schema example: {"rows": "table tr", "fields": {"name": "td.name",
+    "url": {"selector": "a", "attr": "href"}, "tags": {"selector": ".tag", "all": true}}}
+    """
+    if fmt not in ("ndjson", "columnar"):
+        raise typer.BadParameter("must be 'ndjson' or 'columnar'", param_hint="--format")
+    spec = _load_schema(schema)
+
+    columns: dict[str, list] = {}
+    fetched = 0
+    for page in _extract_pages(spec, "columnar" if fmt == "columnar" else "rows", page_size, max_rows):
+        if not page.get("ok"):
+            _print_result(page)
+        if fmt == "ndjson":
+            for row in page["rows"]:
+                typer.echo(json.dumps(row, ensure_ascii=False))
+        else:
+            for name, values in page["columns"].items():
+                columns.setdefault(name, []).extend(values)
+        fetched += page["count"]
+
+    if fmt == "columnar":
+        typer.echo(json.dumps({"count": fetched, "columns": columns}, ensure_ascii=False))
+
+
+def _crawl_page(tab_id: int, url: str, spec: dict | None, timeout: float) -> dict:
+    """Navigate one crawl tab to a URL and run its extraction."""
+    nav = _send_command("navigate", {"url": url, "tab_id": tab_id, "timeout": int(timeout * 1000)}, timeout=timeout, quiet=True)
+    if not nav.get("ok"):
+        return {"url": url, "ok": False, "error": nav.get("error", "unknown")}
+
+    if spec is None:
+        snap = _load_result(_send_command("snapshot", {"tab_id": tab_id, "interactive_only": True, "limit": 200}, quiet=True))
+        if not snap.get("ok"):
+            return {"url": url, "ok": False, "error": snap.get("error", "unknown")}
+        return {"url": url, "ok": True, "title": snap.get("title"), "elements": snap.get("elements", [])}
+
+    rows = []
+    for page in _extract_pages(spec, tab_id=tab_id, quiet=True):
+        if not page.get("ok"):
+            return {"url": url, "ok": False, "error": page.get("error", "unknown")}
+        rows.extend(page["rows"])
+    return {"url": url, "ok": True, "rows": rows}
+
+
+def _crawl_worker(tab_id: int, pending: queue.Queue, spec: dict | None, timeout: float, emit):
+    """Drain the URL queue through one tab.
+
+    Whatever goes wrong with one URL -- a relay error, a malformed result --
+    is recorded as its failed row, and the worker moves on to the next.
+    """
+    while True:
+        try:
+            url = pending.get_nowait()
+        except queue.Empty:
+            return
+        try:
+            record = _crawl_page(tab_id, url, spec, timeout)
+        except Exception as e:
+            record = {"url": url, "ok": False, "error": str(e) or type(e).__name__}
+        emit(record)
+
+
+@app.command()
+def crawl(
+    urls_file: Path = typer.Argument(help="Text file with one URL per line"),
+    concurrency: int = typer.Option(4, "--concurrency", "-c", min=1, help="Number of tabs crawling in parallel"),
+    extract_schema: Optional[str] = typer.Option(None, "--extract", help="Extraction schema (file or inline JSON); defaults to a snapshot"),
+    output: Optional[Path] = typer.Option(None, "--output", "-o", help="Append JSONL to this file instead of stdout"),
+    checkpoint: Optional[Path] = typer.Option(None, "--checkpoint", help="File of finished URLs, skipped when resuming"),
+    timeout: float = typer.Option(30.0, help="Per-page navigation timeout in seconds"),
+):
+    """Crawl a list of URLs across parallel background tabs, streaming JSONL as pages finish."""
+    spec = _load_schema(extract_schema) if extract_schema else None
+    done = set()
+    if checkpoint and checkpoint.exists():
+        done = set(checkpoint.read_text(encoding="utf-8").splitlines())
+
+    pending: queue.Queue = queue.Queue()
+    seen = set()
+    for line in urls_file.read_text(encoding="utf-8").splitlines():
+        url = line.strip()
+        if url and not url.startswith("#") and url not in done and url not in seen:
+            seen.add(url)
+            pending.put(url)
+    if pending.empty():
+        typer.echo("Nothing to crawl.", err=True)
+        return
+
+    write_lock = threading.Lock()
+    counts = {"ok": 0, "failed": 0}
+    sink = output.open("a", encoding="utf-8") if output else None
+    done_log = checkpoint.open("a", encoding="utf-8") if checkpoint else None
+
+    def emit(record: dict):
+        line = json.dumps(record, ensure_ascii=False)
+        with write_lock:
+            if sink:
+                sink.write(line + "\n")
+                sink.flush()
+            else:
+                typer.echo(line)
+            counts["ok" if record["ok"] else "failed"] += 1
+            if done_log and record["ok"]:
+                done_log.write(record["url"] + "\n")
+                done_log.flush()
+
+    tab_ids = []
+    try:
+        for _ in range(min(concurrency, pending.qsize())):
+            result = _send_command("new_tab", {"url": "about:blank", "active": False}, quiet=True)
+            if not result.get("ok"):
+                _print_result(result)
+            tab_ids.append(result["tab"]["id"])
+
+        workers = [
+            threading.Thread(target=_crawl_worker, args=(tab_id, pending, spec, timeout, emit), daemon=True)
+            for tab_id in tab_ids
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    finally:
+        for tab_id in tab_ids:
+            try:
+                _send_command("close_tab", {"tab_id": tab_id}, timeout=5.0, quiet=True)
+            except httpx.HTTPError:
+                pass
+        if sink:
+            sink.close()
+        if done_log:
+            done_log.close()
+
+    typer.echo(f"Crawled {counts['ok']} pages, {counts['failed']} failed.", err=True)
+
+
 @app.command()
 def hover(
     selector_or_ref: str = typer.Argument(help="CSS selector or snapshot ref (e.g. e3)"),
@@ -406,6 +1229,8 @@ def screenshot(
     if not result.get("ok"):
         return
     data_url = result.get("data_url")
+    if "stream" in result:
+        data_url = b"".join(_iter_stream(result)).decode("ascii")
     if not data_url:
         return
     if path is None:
@@ -423,6 +1248,7 @@ def screenshot(
 def back():
     """Navigate back in tab history."""
     result = _send_command("back")
+    _forget_snapshot(result)
     _print_result(result)
 
 
@@ -430,6 +1256,7 @@ def back():
 def forward():
     """Navigate forward in tab history."""
     result = _send_command("forward")
+    _forget_snapshot(result)
     _print_result(result)
 
 
@@ -437,6 +1264,7 @@ def forward():
 def reload():
     """Reload the active tab."""
     result = _send_command("reload")
+    _forget_snapshot(result)
     _print_result(result)
 
 
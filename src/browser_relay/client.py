@@ -0,0 +1,231 @@
+"""Python client for the relay -- over its Unix socket when available, TCP otherwise.
+
+    from browser_relay.client import RelayClient
+
+    with RelayClient() as relay:
+        relay.run("navigate", {"url": "https://example.com"})
+        print(relay.run("get_text", {"selector": "h1"})["text"])
+"""
+
+import json
+import os
+import random
+import time
+import uuid
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+import httpx
+
+from browser_relay.relay.events import KEEPALIVE_INTERVAL
+
+DEFAULT_PORT = 18321
+RELAY_URL = f"http://127.0.0.1:{DEFAULT_PORT}"
+RETRY_ATTEMPTS = 5
+RETRY_BASE_DELAY = 0.25
+RETRY_MAX_DELAY = 8.0
+
+
+def socket_path_for(port: int) -> Path:
+    """The default Unix socket of the relay on ``port``: relays on different ports never share one."""
+    return Path.home() / ".browser-relay" / f"relay-{port}.sock"
+
+
+SOCKET_PATH = Path(os.environ.get("BROWSER_RELAY_SOCKET") or socket_path_for(DEFAULT_PORT))
+
+
+def retry_delay(attempt: int, retry_after: str | None) -> float:
+    """Exponential backoff with full jitter, never shorter than Retry-After."""
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+    if retry_after:
+        try:
+            delay = max(delay, float(retry_after))
+        except ValueError:
+            pass
+    return delay
+
+
+def iter_sse(lines: Iterable[str]) -> Iterator[tuple[str, str]]:
+    """(event, data) pairs from text/event-stream lines; comments are skipped."""
+    event, data = "message", []
+    for line in lines:
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+        elif line.startswith(":"):
+            continue
+        else:
+            field, _, value = line.partition(":")
+            value = value[1:] if value.startswith(" ") else value
+            if field == "event":
+                event = value
+            elif field == "data":
+                data.append(value)
+
+
+def socket_available(socket_path: Path | None = SOCKET_PATH) -> bool:
+    return socket_path is not None and Path(socket_path).is_socket()
+
+
+class SocketTransport(httpx.BaseTransport):
+    """Requests over the relay's Unix socket, or over TCP once the socket refuses.
+
+    A socket file left by a relay that did not exit cleanly refuses every
+    connection; the first refusal switches this transport to TCP for good.
+    Nothing was sent on a refused connection, so the request is simply retried.
+    """
+
+    def __init__(self, socket_path: Path, verify: bool = False):
+        self._uds = httpx.HTTPTransport(uds=str(socket_path), verify=verify)
+        self._tcp = httpx.HTTPTransport(verify=verify)
+        self.kind = "unix"
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self.kind == "unix":
+            try:
+                return self._uds.handle_request(request)
+            except httpx.ConnectError:
+                self.kind = "tcp"
+        return self._tcp.handle_request(request)
+
+    def close(self) -> None:
+        self._uds.close()
+        self._tcp.close()
+
+
+def connect(
+    base_url: str = RELAY_URL,
+    socket_path: Path | None = SOCKET_PATH,
+    timeout: float = 5.0,
+    transport: SocketTransport | None = None,
+) -> httpx.Client:
+    """An httpx client for the relay, using the Unix socket if it exists.
+
+    Requests keep ``base_url`` for their Host header either way, so callers
+    build URLs the same whatever the transport. A plain-HTTP relay needs no
+    CA bundle, and loading one costs more than the request itself.
+    """
+    verify = base_url.startswith("https://")
+    if transport is None and socket_available(socket_path):
+        transport = SocketTransport(socket_path, verify=verify)
+    return httpx.Client(base_url=base_url, timeout=timeout, transport=transport, verify=verify)
+
+
+class RelayClient:
+    """Send commands to the relay and wait for their results.
+
+    Each instance is its own client for the relay's fair sharing, under
+    ``client`` or a random id, so agents on one host do not share a quota.
+    """
+
+    def __init__(
+        self,
+        base_url: str = RELAY_URL,
+        socket_path: Path | None = SOCKET_PATH,
+        priority: str = "normal",
+        browser: str | None = None,
+        client: str | None = None,
+    ):
+        self.priority = priority
+        self.browser = browser
+        self.client = client or uuid.uuid4().hex[:12]
+        self._socket = None
+        if socket_available(socket_path):
+            self._socket = SocketTransport(socket_path, verify=base_url.startswith("https://"))
+        self._http = connect(base_url, socket_path, transport=self._socket)
+        self._http.headers["X-Relay-Client"] = self.client
+
+    def __enter__(self) -> "RelayClient":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @property
+    def transport(self) -> str:
+        """``unix`` or ``tcp``: how requests currently reach the relay."""
+        return self._socket.kind if self._socket is not None else "tcp"
+
+    def close(self) -> None:
+        self._http.close()
+
+    def submit(self, action: str, params: dict | None = None, timeout: float = 30.0) -> str:
+        """Queue a command, retrying while the relay answers 429. Returns its id."""
+        command = {"action": action, "params": params or {}, "priority": self.priority, "timeout": timeout}
+        if self.browser:
+            command["browser"] = self.browser
+        for attempt in range(RETRY_ATTEMPTS + 1):
+            resp = self._http.post("/command", json=command)
+            if resp.status_code != 429 or attempt == RETRY_ATTEMPTS:
+                break
+            time.sleep(retry_delay(attempt, resp.headers.get("Retry-After")))
+        resp.raise_for_status()
+        return resp.json()["id"]
+
+    def wait(self, cmd_id: str, timeout: float = 30.0) -> dict:
+        """Wait for a command's result.
+
+        If the wait times out or is interrupted the command is cancelled on
+        the relay; a relay-side timeout, or a result the relay evicted, is
+        returned as its error result.
+        """
+        try:
+            resp = self._http.get("/result", params={"id": cmd_id, "timeout": str(timeout)}, timeout=timeout + 5)
+        except (KeyboardInterrupt, httpx.TimeoutException):
+            self.cancel(cmd_id)
+            raise
+        if resp.status_code == 504:
+            self.cancel(cmd_id)
+            return resp.json()
+        if resp.status_code == 410:
+            return resp.json()
+        resp.raise_for_status()
+        return resp.json()
+
+    def run(self, action: str, params: dict | None = None, timeout: float = 30.0) -> dict:
+        """Submit a command and wait for its result."""
+        return self.wait(self.submit(action, params, timeout), timeout)
+
+    def cancel(self, cmd_id: str) -> None:
+        """Best-effort cancellation so the relay stops work nobody is waiting for."""
+        try:
+            self._http.delete(f"/command/{cmd_id}", timeout=2.0)
+        except httpx.HTTPError:
+            pass
+
+    def events(
+        self,
+        tab_id: int | None = None,
+        types: Iterable[str] | None = None,
+        since: int | None = None,
+        follow: bool = True,
+    ) -> Iterator[dict]:
+        """Page events as they happen (see ``GET /events``).
+
+        Yields event dicts; ``{"type": "gap", "missed": n}`` if the relay
+        dropped events since ``since``. With ``follow=False``, yields what the
+        relay has kept and stops.
+        """
+        params = {"follow": "1" if follow else "0"}
+        if tab_id is not None:
+            params["tab_id"] = str(tab_id)
+        if types:
+            params["type"] = ",".join(types)
+        if since is not None:
+            params["since"] = str(since)
+        if self.browser:
+            params["browser"] = self.browser
+        timeout = httpx.Timeout(5.0, read=KEEPALIVE_INTERVAL * 2)
+        with self._http.stream("GET", "/events", params=params, timeout=timeout) as resp:
+            if resp.status_code != 200:
+                resp.read()
+            resp.raise_for_status()
+            for event, data in iter_sse(resp.iter_lines()):
+                payload = json.loads(data)
+                yield {"type": "gap", **payload} if event == "gap" else payload
+
+    def status(self) -> dict:
+        resp = self._http.get("/status")
+        resp.raise_for_status()
+        return resp.json()
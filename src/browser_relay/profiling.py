@@ -0,0 +1,198 @@
+"""Built-in sampling profiler for the relay and the CLI.
+
+Every thread's Python stack is sampled at a fixed interval and counted in
+collapsed form, one ``frame;frame;frame count`` line per distinct stack,
+which flamegraph.pl, speedscope and inferno read directly. Locks created
+with ``timed_lock`` record how long threads waited for them and held them.
+Both are written when the process exits:
+
+    DIR/relay-<pid>.folded       sampled stacks
+    DIR/relay-<pid>-locks.json   sampling totals and per-lock wait/hold times
+"""
+
+import atexit
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+SAMPLE_INTERVAL = 0.005
+
+_active: "SamplingProfiler | None" = None
+
+
+class TimedLock:
+    """A drop-in ``threading.Lock`` that measures waits and holds.
+
+    Works as the lock of a ``threading.Condition``; the counters are only
+    updated while the lock is held, so they need no lock of their own.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._owner: int | None = None
+        self._acquired_at = 0.0
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.hold_total = 0.0
+        self.hold_max = 0.0
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        waited = 0.0
+        if not self._lock.acquire(False):
+            if not blocking:
+                return False
+            started = time.perf_counter()
+            if not self._lock.acquire(True, timeout):
+                return False
+            waited = time.perf_counter() - started
+            self.contended += 1
+        self.acquisitions += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        self._owner = threading.get_ident()
+        self._acquired_at = time.perf_counter()
+        return True
+
+    def release(self) -> None:
+        held = time.perf_counter() - self._acquired_at
+        self.hold_total += held
+        self.hold_max = max(self.hold_max, held)
+        self._owner = None
+        self._lock.release()
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    def _is_owned(self) -> bool:
+        # Used by threading.Condition; the default probe would count as an acquisition.
+        return self._owner == threading.get_ident()
+
+    def stats(self) -> dict:
+        return {
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "wait_total_ms": round(self.wait_total * 1000, 3),
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+            "wait_mean_ms": round(self.wait_total * 1000 / max(1, self.acquisitions), 4),
+            "hold_total_ms": round(self.hold_total * 1000, 3),
+            "hold_max_ms": round(self.hold_max * 1000, 3),
+        }
+
+
+class SamplingProfiler:
+    """Samples every other thread's stack every ``interval`` seconds from a daemon thread."""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self.locks: list[TimedLock] = []
+        self.started_at: float | None = None
+        self.stopped_at: float | None = None
+        self._labels: dict = {}
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="browser-relay-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.stopped_at is None:
+            self.stopped_at = time.time()
+
+    def timed_lock(self, name: str) -> TimedLock:
+        """A new lock whose wait and hold times are written with the profile."""
+        lock = TimedLock(name)
+        self.locks.append(lock)
+        return lock
+
+    def sample(self) -> None:
+        """Count the current stack of every thread but the profiler's own."""
+        names = {t.ident: t.name for t in threading.enumerate()}
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident != own:
+                self.stacks[self._collapse(names.get(ident, f"thread-{ident}"), frame)] += 1
+        self.samples += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def _collapse(self, thread: str, frame) -> str:
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                path = Path(code.co_filename)
+                label = self._labels[code] = f"{code.co_qualname} ({path.parent.name}/{path.name}:{code.co_firstlineno})"
+            frames.append(label)
+            frame = frame.f_back
+        frames.append(thread.replace(";", ":"))
+        return ";".join(reversed(frames))
+
+    def write(self, directory: str | os.PathLike, name: str) -> list[Path]:
+        """Write the folded stacks and the lock statistics; returns the two paths."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        stem = f"{name}-{os.getpid()}"
+        folded = directory / f"{stem}.folded"
+        folded.write_text("".join(f"{stack} {n}\n" for stack, n in sorted(self.stacks.items())))
+        locks = directory / f"{stem}-locks.json"
+        ended = self.stopped_at or time.time()
+        locks.write_text(json.dumps({
+            "pid": os.getpid(),
+            "duration_s": round(ended - (self.started_at or ended), 3),
+            "interval_s": self.interval,
+            "samples": self.samples,
+            "locks": {lock.name: lock.stats() for lock in self.locks},
+        }, indent=2))
+        return [folded, locks]
+
+
+def active() -> SamplingProfiler | None:
+    """The process-wide profiler, if one was started."""
+    return _active
+
+
+def start(directory: str | os.PathLike, name: str) -> SamplingProfiler:
+    """Start the process-wide profiler, once, and write its files to ``directory`` at exit.
+
+    A later call returns the running profiler; its files keep the first name.
+    SIGTERM is turned into a normal exit so a stopped server still writes them.
+    """
+    global _active
+    if _active is None:
+        _active = SamplingProfiler()
+        _active.start()
+        atexit.register(_finish, _active, Path(directory), name)
+        if threading.current_thread() is threading.main_thread() and signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+    return _active
+
+
+def _finish(profiler: SamplingProfiler, directory: Path, name: str) -> None:
+    profiler.stop()
+    for path in profiler.write(directory, name):
+        print(f"Profile written: {path}", file=sys.stderr)
@@ -0,0 +1,183 @@
+"""Single-flight for read-only commands: identical reads in flight share one dispatch."""
+
+import json
+from collections import OrderedDict
+
+# Actions that only observe the page or the browser. Repeating one while an
+# identical one is in flight cannot return anything the first will not.
+# ``ping`` is left out: its point is a round trip of its own.
+READ_ONLY_ACTIONS = frozenset({
+    "snapshot", "get_text", "get_html", "get_attr", "get_value", "count", "extract",
+    "tabs", "tab_info", "screenshot", "fingerprint", "list_scripts", "block_stats",
+})
+# Everything else may change the page, so later reads must observe it.
+NON_MUTATING_ACTIONS = READ_ONLY_ACTIONS | {"ping"}
+WRITE_MEMORY = 4096
+
+
+def coalesce_key(command: dict, priority: str) -> tuple | None:
+    """What makes two commands interchangeable, or None if this one must run itself.
+
+    Priority is part of it: a follower must not wait in a slower lane than
+    it asked for.
+    """
+    if command.get("action") not in READ_ONLY_ACTIONS:
+        return None
+    params = json.dumps(command.get("params") or {}, sort_keys=True, separators=(",", ":"))
+    return command["action"], params, command.get("browser"), priority
+
+
+def _outlives(deadline_ms: int | None, other_ms: int | None) -> bool:
+    """Whether a deadline is no earlier than another; None is no deadline at all."""
+    return deadline_ms is None or (other_ms is not None and deadline_ms >= other_ms)
+
+
+class Flight:
+    """One dispatched read and the commands waiting on its result."""
+
+    __slots__ = ("key", "leader", "deadline_ms", "followers", "detached", "started")
+
+    def __init__(self, key: tuple, leader: str, deadline_ms: int | None = None):
+        self.key = key
+        self.leader = leader
+        self.deadline_ms = deadline_ms  # the leader's; the flight ends with it
+        self.followers: list[tuple[str, int | None]] = []  # (id, deadline_ms)
+        self.detached = False  # the leader's own caller went away
+        self.started: int | None = None  # sequence number of its dispatch
+
+
+class InFlightReads:
+    """Read-only commands that are queued or running, by what they ask for.
+
+    A command identical to one in flight becomes a follower of it instead of
+    being queued; the leader's result is copied to every follower.
+    Not thread-safe on its own -- callers hold the relay lock.
+    """
+
+    def __init__(self):
+        self._by_key: dict[tuple, Flight] = {}
+        self._by_id: dict[str, Flight] = {}
+        # Dispatches and writes are numbered in one sequence, so a flight can
+        # be ordered against a client's last write to the same browser.
+        self._seq = 0
+        self._last_write: OrderedDict[tuple[str, str | None], int] = OrderedDict()
+        # Writes not yet answered, by id and by (client, browser).
+        self._pending: dict[str, tuple[str, str | None]] = {}
+        self._writing: dict[tuple[str, str | None], int] = {}
+        self.hits = 0
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+    def get(self, cmd_id: str) -> Flight | None:
+        return self._by_id.get(cmd_id)
+
+    def wrote(self, command: dict, client: str) -> None:
+        """Note a queued command from ``client`` that may change its browser's pages.
+
+        It counts as pending until :meth:`done` is called with its id.
+        """
+        if command.get("action") in NON_MUTATING_ACTIONS:
+            return
+        self._seq += 1
+        writer = (client, command.get("browser"))
+        self._last_write[writer] = self._seq
+        self._last_write.move_to_end(writer)
+        while len(self._last_write) > WRITE_MEMORY:
+            self._last_write.popitem(last=False)
+        self._pending[command["id"]] = writer
+        self._writing[writer] = self._writing.get(writer, 0) + 1
+
+    def done(self, cmd_id: str) -> None:
+        """Note that ``cmd_id`` answered, was cancelled or expired; no-op for reads."""
+        writer = self._pending.pop(cmd_id, None)
+        if writer is None:
+            return
+        if self._writing[writer] > 1:
+            self._writing[writer] -= 1
+        else:
+            del self._writing[writer]
+
+    def started(self, cmd_id: str) -> None:
+        """Note that ``cmd_id`` was handed to a browser."""
+        flight = self._by_id.get(cmd_id)
+        if flight is not None and flight.leader == cmd_id:
+            self._seq += 1
+            flight.started = self._seq
+
+    def follow(self, command: dict, priority: str, client: str, now_ms: float) -> str | None:
+        """Attach ``command`` to an identical flight. Returns the leader's id, or None.
+
+        The flight must see ``client``'s writes to the same browser: none may
+        still be pending, and it must not have gone out before the last one.
+        It must also last as long as ``command`` may wait; a flight whose
+        deadline has passed is dropped.
+        """
+        key = coalesce_key(command, priority)
+        flight = self._by_key.get(key) if key is not None else None
+        if flight is None:
+            return None
+        if flight.deadline_ms is not None and flight.deadline_ms <= now_ms:
+            self._drop(flight)
+            return None
+        if not _outlives(flight.deadline_ms, command.get("deadline_ms")):
+            return None
+        writer = (client, command.get("browser"))
+        if self._writing.get(writer):
+            return None
+        if flight.started is not None and flight.started < self._last_write.get(writer, 0):
+            return None
+        flight.followers.append((command["id"], command.get("deadline_ms")))
+        self._by_id[command["id"]] = flight
+        self.hits += 1
+        return flight.leader
+
+    def lead(self, command: dict, priority: str) -> None:
+        """Record a newly queued read so identical ones can follow it.
+
+        It takes over from an identical read that is already running, which
+        later reads are likelier to find fresh enough, or that ends sooner.
+        """
+        key = coalesce_key(command, priority)
+        if key is None:
+            return
+        current = self._by_key.get(key)
+        deadline_ms = command.get("deadline_ms")
+        if current is None or current.started is not None or not _outlives(current.deadline_ms, deadline_ms):
+            self._by_key[key] = self._by_id[command["id"]] = Flight(key, command["id"], deadline_ms)
+
+    def finish(self, leader: str) -> Flight | None:
+        """End the flight ``leader`` leads, if any, and return it."""
+        flight = self._by_id.get(leader)
+        if flight is None or flight.leader != leader:
+            return None
+        self._drop(flight)
+        del self._by_id[leader]
+        for follower, _ in flight.followers:
+            self._by_id.pop(follower, None)
+        return flight
+
+    def expire(self, now_ms: float) -> None:
+        """Stop offering flights whose deadline has passed; end those already running.
+
+        Their followers' deadlines are no later, so nobody is left to wait.
+        Queued ones end when their queue drops them.
+        """
+        for flight in list(self._by_key.values()):
+            if flight.deadline_ms is not None and flight.deadline_ms <= now_ms:
+                self._drop(flight)
+                if flight.started is not None:
+                    self.finish(flight.leader)
+
+    def _drop(self, flight: Flight) -> None:
+        if self._by_key.get(flight.key) is flight:
+            del self._by_key[flight.key]
+
+    def leave(self, follower: str) -> Flight | None:
+        """Detach a follower from its flight; returns the flight it left."""
+        flight = self._by_id.get(follower)
+        if flight is None or flight.leader == follower:
+            return None
+        del self._by_id[follower]
+        flight.followers = [f for f in flight.followers if f[0] != follower]
+        return flight
@@ -0,0 +1,144 @@
+"""A relay hosted inside an application, for orchestrators that own it.
+
+    from browser_relay.relay.embedded import EmbeddedRelay
+
+    with EmbeddedRelay(port=18321) as relay:
+        relay.run("navigate", {"url": "https://example.com"})
+        print(relay.run("get_text", {"selector": "h1"})["text"])
+
+The extension still polls it over HTTP, but the application queues
+commands and waits for results directly on the relay's queue and result
+store: no loopback request and no JSON round trip for the command, and a
+result is decoded once, from the bytes the extension posted. The methods
+mirror ``RelayClient``, so code written for one runs on the other.
+Commands are not forwarded to federation peers.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from collections.abc import Iterable
+
+from werkzeug.serving import BaseWSGIServer, make_server
+
+from browser_relay.relay.queue import DEFAULT_PRIORITY, PRIORITIES
+from browser_relay.relay.server import DEFAULT_RESULT_TIMEOUT, Relay, create_app, serve_unix_socket
+from browser_relay.relay.store import ResultEvicted
+
+
+class EmbeddedRelay:
+    """A relay server on a background thread, driven from this process.
+
+    Submitting raises ``QueueFull`` when admission control refuses the
+    command; there is no HTTP client here to back off and retry.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 18321,
+        socket_path: str | os.PathLike | None = None,
+        priority: str = DEFAULT_PRIORITY,
+        browser: str | None = None,
+        client: str = "embedded",
+        relay: Relay | None = None,
+    ):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        self.relay = relay or Relay()
+        self.priority = priority
+        self.browser = browser
+        self.client = client
+        self.app = create_app(self.relay)
+        self._host, self._port, self._socket_path = host, port, socket_path
+        self._servers: list[BaseWSGIServer] = []
+
+    def __enter__(self) -> "EmbeddedRelay":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @property
+    def url(self) -> str:
+        """Where the extension reaches this relay (the bound port once started)."""
+        port = self._servers[0].server_port if self._servers else self._port
+        return f"http://{self._host}:{port}"
+
+    def start(self) -> None:
+        """Start serving the extension; a ``port`` of 0 picks a free one."""
+        if self._servers:
+            return
+        server = make_server(self._host, self._port, self.app, threaded=True)
+        threading.Thread(target=server.serve_forever, name="relay-embedded", daemon=True).start()
+        self._servers.append(server)
+        if self._socket_path is not None:
+            self._servers.append(serve_unix_socket(self.app, self._socket_path))
+
+    def close(self) -> None:
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        self._servers = []
+
+    def submit(self, action: str, params: dict | None = None, timeout: float | None = 30.0) -> str:
+        """Queue a command for the extension. Returns its id."""
+        command = {"id": str(uuid.uuid4()), "action": action, "params": params or {}}
+        if self.browser:
+            command["browser"] = self.browser
+        if timeout is not None:
+            command["deadline_ms"] = int((time.time() + timeout) * 1000)
+        with self.relay.lock:
+            self.relay.submit(command, priority=self.priority, client=self.client)
+        return command["id"]
+
+    def wait(self, cmd_id: str, timeout: float = DEFAULT_RESULT_TIMEOUT) -> dict:
+        """Wait for a command's result.
+
+        On timeout or interruption the command is cancelled and, like the
+        HTTP API, a timeout or an evicted result comes back as an error result.
+        """
+        try:
+            with self.relay.result_ready:
+                parts = self.relay.wait_result(cmd_id, timeout)
+        except ResultEvicted as e:
+            return {"ok": False, "error": str(e), "evicted": e.reason}
+        except KeyboardInterrupt:
+            self.cancel(cmd_id)
+            raise
+        if parts is None:
+            self.cancel(cmd_id)
+            return {"ok": False, "error": "Timeout waiting for result"}
+        return json.loads(b"".join(parts))
+
+    def run(self, action: str, params: dict | None = None, timeout: float = 30.0) -> dict:
+        """Submit a command and wait for its result."""
+        return self.wait(self.submit(action, params, timeout), timeout)
+
+    async def arun(self, action: str, params: dict | None = None, timeout: float = 30.0) -> dict:
+        """``run`` for asyncio applications; the wait happens on a worker thread."""
+        cmd_id = self.submit(action, params, timeout)
+        try:
+            return await asyncio.to_thread(self.wait, cmd_id, timeout)
+        except asyncio.CancelledError:
+            self.cancel(cmd_id)
+            raise
+
+    def cancel(self, cmd_id: str) -> str | None:
+        """Cancel a queued or running command. Returns its state, or None if unknown."""
+        with self.relay.lock:
+            return self.relay.cancel(cmd_id)
+
+    def stream(self, cmd_id: str) -> Iterable[bytes] | None:
+        """The uploaded chunks of a result that came back with ``stream``, once."""
+        with self.relay.lock:
+            return self.relay.store.take_chunks(cmd_id)
+
+    def status(self) -> dict:
+        with self.relay.lock:
+            self.relay.expire()
+            return self.relay.status()
@@ -0,0 +1,66 @@
+"""Page events pushed by extensions, kept in a bounded log for stream subscribers."""
+
+import json
+import time
+from collections import deque
+
+EVENT_MEMORY = 4096
+EVENT_TYPES = ("navigation", "load", "console", "dialog", "mutation")
+KEEPALIVE_INTERVAL = 15.0
+
+
+class EventLog:
+    """The most recent page events, numbered in arrival order.
+
+    Ids increase by one per event, so a subscriber resuming from an id can
+    tell how many events it missed when older ones have been dropped.
+    Not thread-safe on its own -- callers hold the relay lock.
+    """
+
+    def __init__(self, capacity: int = EVENT_MEMORY):
+        self._events: deque[dict] = deque(maxlen=capacity)
+        self.last_id = 0
+        self.subscribers = 0
+
+    def append(self, browser: str, event: dict) -> dict:
+        self.last_id += 1
+        stored = {"ts": time.time(), **event, "id": self.last_id, "browser": browser}
+        self._events.append(stored)
+        return stored
+
+    def missed(self, after_id: int) -> int:
+        """How many events after ``after_id`` are no longer kept."""
+        oldest = self._events[0]["id"] if self._events else self.last_id + 1
+        return max(0, oldest - 1 - after_id)
+
+    def since(
+        self,
+        after_id: int,
+        tab_id: int | None = None,
+        types: set[str] | None = None,
+        browser: str | None = None,
+    ) -> list[dict]:
+        """Kept events newer than ``after_id`` that match every filter, oldest first."""
+        newer = []
+        # Followers are nearly caught up, so walk back from the newest.
+        for event in reversed(self._events):
+            if event["id"] <= after_id:
+                break
+            if tab_id is not None and event.get("tab_id") != tab_id:
+                continue
+            if types and event["type"] not in types:
+                continue
+            if browser is not None and event["browser"] != browser:
+                continue
+            newer.append(event)
+        newer.reverse()
+        return newer
+
+    def stats(self) -> dict:
+        return {"kept": len(self._events), "last_id": self.last_id, "subscribers": self.subscribers}
+
+
+def sse(event: dict) -> bytes:
+    """One event in text/event-stream framing."""
+    data = json.dumps(event, ensure_ascii=False, separators=(",", ":"))
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n".encode("utf-8")
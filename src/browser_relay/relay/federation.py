@@ -0,0 +1,246 @@
+"""Relay federation -- peers advertise their browsers and forward commands to each other.
+
+Each relay keeps the latest advertisement from every peer: the browsers
+polling it and how much queue headroom it has. A command for a browser
+that is not connected locally (or any command, when no local browser is
+connected) is forwarded to the peer that can take it, and follow-up calls
+for that command id are proxied to the same peer. Forwarded commands carry
+``X-Relay-Forwarded`` so they are never forwarded a second time.
+
+Peers prove membership with a shared secret, sent as ``X-Relay-Token``
+(``BROWSER_RELAY_FEDERATION_TOKEN``). Without one, only relays on the same
+host can federate.
+"""
+
+import hmac
+import ipaddress
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import httpx
+
+FORWARDED_HEADER = "X-Relay-Forwarded"
+TOKEN_HEADER = "X-Relay-Token"
+TOKEN_ENV = "BROWSER_RELAY_FEDERATION_TOKEN"
+GOSSIP_INTERVAL = 2.0
+PEER_TIMEOUT = 2.0
+STREAM_READ_TIMEOUT = 30.0
+FORWARDED_MEMORY = 4096
+
+
+def is_loopback(host: str | None) -> bool:
+    """Whether a bind address or caller is on this host only.
+
+    Unix socket callers have no address and count as local.
+    """
+    if not host or host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class Federation:
+    """Peer list, cached advertisements and the ids of forwarded commands."""
+
+    def __init__(
+        self,
+        self_url: str | None = None,
+        peers: list[str] | None = None,
+        relay_id: str | None = None,
+        token: str | None = None,
+    ):
+        self.relay_id = relay_id or uuid.uuid4().hex[:12]
+        self.self_url = _normalize(self_url) if self_url else None
+        self.token = token or os.environ.get(TOKEN_ENV) or None
+        self.peers: set[str] = set()
+        self.forwarded: OrderedDict[str, str] = OrderedDict()
+        self._ads: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._http: httpx.Client | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        for url in peers or []:
+            self.add_peer(url)
+
+    def use_lock(self, lock) -> None:
+        """Guard peer state with another lock, e.g. an instrumented one. Call before starting."""
+        self._lock = lock
+
+    def authorized(self, presented: str | None) -> bool:
+        """Whether a request carried this federation's token."""
+        return self.token is not None and presented is not None and hmac.compare_digest(presented, self.token)
+
+    def _headers(self, extra: dict | None = None) -> dict:
+        headers = dict(extra or {})
+        if self.token is not None:
+            headers[TOKEN_HEADER] = self.token
+        return headers
+
+    def _client(self) -> httpx.Client:
+        with self._lock:
+            if self._http is None:
+                self._http = httpx.Client(timeout=PEER_TIMEOUT)
+            return self._http
+
+    def add_peer(self, url: str, advertisement: dict | None = None) -> bool:
+        """Add a peer by base URL. Returns False for ourselves or a known peer."""
+        url = _normalize(url)
+        with self._lock:
+            if url == self.self_url or (advertisement or {}).get("relay_id") == self.relay_id:
+                return False
+            if advertisement:
+                self._ads[url] = advertisement
+            if url in self.peers:
+                return False
+            self.peers.add(url)
+            return True
+
+    def advertisements(self) -> dict[str, dict]:
+        with self._lock:
+            return dict(self._ads)
+
+    def refresh(self, own: dict | None = None) -> None:
+        """Fetch every peer's advertisement, learning about their peers too.
+
+        With ``own`` (this relay's advertisement) peers are joined rather than
+        polled, so they learn about this relay as well.
+        """
+        seen: set[str] = set()
+        while pending := (self.peers - seen):
+            for url in pending:
+                seen.add(url)
+                try:
+                    if own is not None and self.self_url:
+                        resp = self._client().post(f"{url}/federation/join", json=own, headers=self._headers())
+                    else:
+                        resp = self._client().get(f"{url}/federation/advertisement", headers=self._headers())
+                    resp.raise_for_status()
+                    ad = resp.json()
+                except (httpx.HTTPError, ValueError):
+                    with self._lock:
+                        self._ads.pop(url, None)
+                    continue
+                with self._lock:
+                    self._ads[url] = ad
+                for other in ad.get("peers", []):
+                    self.add_peer(other)
+
+    def route(self, browser: str | None) -> str | None:
+        """Pick the peer to forward to: the one with ``browser``, or the one
+        with the most spare capacity among peers with any browser.
+
+        Only the advertisements gossip has cached are consulted, so a dead
+        peer never holds up a submission.
+        """
+        candidates = [
+            (url, ad)
+            for url, ad in self.advertisements().items()
+            if (browser in ad.get("browsers", []) if browser else ad.get("browsers"))
+        ]
+        if not candidates:
+            return None
+        url, _ = max(candidates, key=lambda item: _spare(item[1]))
+        return url
+
+    def forward_command(self, peer: str, body: dict, client: str) -> httpx.Response:
+        """Submit a command to a peer and remember where it went."""
+        headers = {FORWARDED_HEADER: self.relay_id, "X-Relay-Client": client}
+        resp = self.request(peer, "POST", "/command", json=body, headers=headers)
+        if resp.status_code == 200:
+            with self._lock:
+                self.forwarded[body["id"]] = peer
+                while len(self.forwarded) > FORWARDED_MEMORY:
+                    self.forwarded.popitem(last=False)
+        return resp
+
+    def peer_for(self, cmd_id: str) -> str | None:
+        """The peer a command was forwarded to, if it was."""
+        with self._lock:
+            return self.forwarded.get(cmd_id)
+
+    def take_peer(self, cmd_id: str) -> str | None:
+        """Like ``peer_for``, forgetting the command: nothing more will be proxied for it."""
+        with self._lock:
+            return self.forwarded.pop(cmd_id, None)
+
+    def request(
+        self, peer: str, method: str, path: str, timeout: float = PEER_TIMEOUT, headers: dict | None = None, **kwargs
+    ) -> httpx.Response:
+        """Call a peer; an unreachable peer becomes a 502 response."""
+        try:
+            return self._client().request(method, f"{peer}{path}", timeout=timeout, headers=self._headers(headers), **kwargs)
+        except httpx.HTTPError as e:
+            return self._unreachable(peer, e)
+
+    def open_stream(self, peer: str, path: str) -> httpx.Response:
+        """Start a streamed GET to a peer; the caller iterates and closes the response.
+
+        The body comes back unencoded; re-encoding is the calling relay's business.
+        """
+        client = self._client()
+        timeout = httpx.Timeout(PEER_TIMEOUT, read=STREAM_READ_TIMEOUT)
+        request = client.build_request(
+            "GET", f"{peer}{path}", timeout=timeout, headers=self._headers({"Accept-Encoding": "identity"})
+        )
+        try:
+            return client.send(request, stream=True)
+        except httpx.HTTPError as e:
+            return self._unreachable(peer, e)
+
+    def _unreachable(self, peer: str, error: Exception) -> httpx.Response:
+        with self._lock:
+            self._ads.pop(peer, None)
+        return httpx.Response(502, json={"ok": False, "error": f"Peer relay {peer} unreachable: {error}"})
+
+    def summary(self) -> dict:
+        ads = self.advertisements()
+        return {
+            "relay_id": self.relay_id,
+            "url": self.self_url,
+            "peers": [
+                {
+                    "url": url,
+                    "relay_id": ads.get(url, {}).get("relay_id"),
+                    "reachable": url in ads,
+                    "browsers": ads.get(url, {}).get("browsers", []),
+                }
+                for url in sorted(self.peers)
+            ],
+        }
+
+    def start(self, advertise) -> None:
+        """Gossip in the background; ``advertise`` returns this relay's advertisement."""
+        if self._thread is not None:
+            return
+
+        def loop():
+            while not self._stop.is_set():
+                self.refresh(advertise())
+                self._stop.wait(GOSSIP_INTERVAL)
+
+        self._thread = threading.Thread(target=loop, name="relay-federation", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=PEER_TIMEOUT + 1)
+            self._thread = None
+        with self._lock:
+            if self._http is not None:
+                self._http.close()
+                self._http = None
+
+
+def _normalize(url: str) -> str:
+    url = url.rstrip("/")
+    return url if "://" in url else f"http://{url}"
+
+
+def _spare(ad: dict) -> int:
+    return ad.get("capacity", 0) - ad.get("depth", 0) - ad.get("in_flight", 0)
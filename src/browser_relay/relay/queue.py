@@ -0,0 +1,125 @@
+"""Bounded command queue with priority classes and per-client fair sharing."""
+
+from collections import OrderedDict, deque
+
+PRIORITIES = ("interactive", "normal", "background")
+DEFAULT_PRIORITY = "normal"
+
+# Fraction of total capacity each class may fill. Lower classes are refused
+# earlier so interactive traffic always finds headroom under a burst.
+ADMISSION_LIMITS = {
+    "interactive": 1.0,
+    "normal": 0.8,
+    "background": 0.5,
+}
+
+
+class QueueFull(Exception):
+    """Raised when a command is refused by admission control."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CommandQueue:
+    """Priority lanes, each round-robin across clients.
+
+    The per-client limit applies within each lane, so a client's background
+    burst never refuses its own, or anyone's, interactive commands.
+
+    Not thread-safe on its own -- callers hold the relay lock.
+    """
+
+    def __init__(self, capacity: int = 256, per_client_limit: int = 64):
+        self.capacity = capacity
+        self.per_client_limit = per_client_limit
+        self._lanes: dict[str, OrderedDict[str, deque]] = {p: OrderedDict() for p in PRIORITIES}
+        self._per_client: dict[tuple[str, str], int] = {}  # (client, priority) -> queued
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def put(self, command: dict, priority: str = DEFAULT_PRIORITY, client: str = "") -> None:
+        """Enqueue a command or raise QueueFull."""
+        if priority not in self._lanes:
+            raise ValueError(f"Unknown priority: {priority}")
+        if self._size >= int(self.capacity * ADMISSION_LIMITS[priority]):
+            raise QueueFull(f"Queue full for priority '{priority}'")
+        if self._per_client.get((client, priority), 0) >= self.per_client_limit:
+            raise QueueFull(f"Too many queued {priority} commands for client '{client}'")
+
+        lane = self._lanes[priority]
+        lane.setdefault(client, deque()).append(command)
+        self._per_client[(client, priority)] = self._per_client.get((client, priority), 0) + 1
+        self._size += 1
+
+    def pop(self) -> dict | None:
+        """Take the next command: highest priority first, clients in turn."""
+        for priority in PRIORITIES:
+            lane = self._lanes[priority]
+            if not lane:
+                continue
+            client, commands = next(iter(lane.items()))
+            command = commands.popleft()
+            if commands:
+                lane.move_to_end(client)
+            else:
+                del lane[client]
+            self._release(client, priority)
+            return command
+        return None
+
+    def remove(self, command_id: str) -> dict | None:
+        """Drop a queued command by id. Returns it if it was still queued."""
+        for priority, lane in self._lanes.items():
+            for client, commands in lane.items():
+                for command in commands:
+                    if command.get("id") == command_id:
+                        commands.remove(command)
+                        if not commands:
+                            del lane[client]
+                        self._release(client, priority)
+                        return command
+        return None
+
+    def expire(self, now_ms: float) -> list[dict]:
+        """Drop commands whose deadline has passed, and return them."""
+        dropped = []
+        for priority, lane in self._lanes.items():
+            for client in list(lane):
+                kept = deque()
+                for command in lane[client]:
+                    deadline_ms = command.get("deadline_ms")
+                    if deadline_ms is not None and deadline_ms <= now_ms:
+                        dropped.append(command)
+                        self._release(client, priority)
+                    else:
+                        kept.append(command)
+                if kept:
+                    lane[client] = kept
+                else:
+                    del lane[client]
+        return dropped
+
+    def clear(self) -> None:
+        for lane in self._lanes.values():
+            lane.clear()
+        self._per_client.clear()
+        self._size = 0
+
+    def depth_by_priority(self) -> dict[str, int]:
+        return {
+            priority: sum(len(commands) for commands in lane.values())
+            for priority, lane in self._lanes.items()
+        }
+
+    def _release(self, client: str, priority: str) -> None:
+        self._size -= 1
+        key = (client, priority)
+        remaining = self._per_client.get(key, 1) - 1
+        if remaining:
+            self._per_client[key] = remaining
+        else:
+            self._per_client.pop(key, None)
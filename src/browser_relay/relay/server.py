@@ -1,101 +1,774 @@
 """Relay server -- bridges CLI commands to the Chrome extension via HTTP polling."""
 
+import atexit
+import json
+import math
+import os
 import threading
 import time
 import uuid
+import zlib
+from collections import OrderedDict, deque
+from collections.abc import Iterable
 
-from flask import Flask, Response, jsonify, request
+import httpx
+from flask import Blueprint, Flask, Response, current_app, jsonify, request
 from flask_cors import CORS
+from werkzeug.serving import BaseWSGIServer, make_server
 
-app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})
+from browser_relay.relay.coalesce import InFlightReads
+from browser_relay.relay.events import EVENT_TYPES, KEEPALIVE_INTERVAL, EventLog, sse
+from browser_relay.relay.federation import FORWARDED_HEADER, TOKEN_HEADER, Federation, is_loopback
+from browser_relay.relay.queue import DEFAULT_PRIORITY, PRIORITIES, CommandQueue, QueueFull
+from browser_relay.relay.store import ResultEvicted, ResultStore
 
-_lock = threading.Lock()
-_pending_command: dict | None = None
-_pending_result: dict | None = None
-_last_poll_ts: float = 0.0
+try:
+    import zstandard
+except ImportError:  # optional: pip install browser-relay[zstd]
+    zstandard = None
 
 DEFAULT_RESULT_TIMEOUT = 30.0
 EXTENSION_ALIVE_THRESHOLD = 3.0
+MAX_QUEUED_COMMANDS = 256
+MAX_QUEUED_PER_CLIENT = 64
+SERVICE_TIME_ALPHA = 0.2
+CANCELLED_MEMORY = 1024
+NAVIGATION_MEMORY = 4096
+# How long past its deadline a dispatched command may still report back.
+DISPATCH_GRACE = 5.0
+DEFAULT_BROWSER = "default"
+PEER_PATHS = frozenset({"/federation/join", "/federation/advertisement"})
 
+bp = Blueprint("relay", __name__)
 
-@app.get("/command")
+
+class Relay:
+    """Queues, results and connected browsers behind one relay server.
+
+    Commands without a ``browser`` go to a shared queue any browser may take;
+    commands naming a browser wait in that browser's own queue. A read-only
+    command identical to one already in flight is not queued at all; it
+    gets a copy of that command's result.
+    Not thread-safe on its own -- callers hold ``lock``.
+    """
+
+    def __init__(self, federation: Federation | None = None):
+        self.lock = threading.Lock()
+        self.result_ready = threading.Condition(self.lock)
+        self.event_ready = threading.Condition(self.lock)
+        self.queue = CommandQueue(MAX_QUEUED_COMMANDS, MAX_QUEUED_PER_CLIENT)
+        self.targeted: dict[str, CommandQueue] = {}
+        self.store = ResultStore()
+        self.dispatched: dict[str, tuple[float, str, int | None]] = {}  # id -> (started, browser, deadline_ms)
+        self.cancel_notices: dict[str, deque[str]] = {}
+        self.cancelled: OrderedDict[str, None] = OrderedDict()
+        self.browsers: dict[str, float] = {}
+        self.nav_counter = 0
+        self.nav_floor = 0
+        self.navigations: OrderedDict[tuple[str, int], int] = OrderedDict()
+        self.events = EventLog()
+        self.reads = InFlightReads()
+        self.expired_count = 0
+        self.service_time = 0.5
+        self.federation = federation or Federation()
+
+    def use_lock(self, lock) -> None:
+        """Guard the relay with another lock, e.g. an instrumented one. Call before serving."""
+        self.lock = lock
+        self.result_ready = threading.Condition(lock)
+        self.event_ready = threading.Condition(lock)
+
+    def _queues(self):
+        yield self.queue
+        yield from self.targeted.values()
+
+    def queue_depth(self) -> int:
+        return sum(len(q) for q in self._queues())
+
+    def retry_after(self) -> int:
+        """Seconds until the queue has likely drained enough to admit more work."""
+        return max(1, math.ceil(self.queue_depth() * self.service_time))
+
+    def live_browsers(self) -> list[str]:
+        now = time.time()
+        return [b for b, ts in self.browsers.items() if now - ts < EXTENSION_ALIVE_THRESHOLD]
+
+    def submit(self, command: dict, priority: str, client: str) -> str | None:
+        """Queue a command for its browser, or for any browser. Raises QueueFull.
+
+        Returns the id of the identical read the command joined instead, if any.
+        """
+        leader = self.reads.follow(command, priority, client, time.time() * 1000)
+        if leader is not None:
+            return leader
+        browser = command.get("browser")
+        if browser:
+            target = self.targeted.get(browser)
+            if target is None:
+                target = self.targeted[browser] = CommandQueue(MAX_QUEUED_COMMANDS, MAX_QUEUED_PER_CLIENT)
+        else:
+            target = self.queue
+        target.put(command, priority=priority, client=client)
+        self.reads.wrote(command, client)
+        self.reads.lead(command, priority)
+        return None
+
+    def next_command(self, browser: str, cancel_only: bool = False) -> dict | None:
+        """A cancel notice or the next live command for a polling browser."""
+        now = time.time()
+        self.browsers[browser] = now
+        notices = self.cancel_notices.get(browser)
+        if notices:
+            return {"action": "cancel", "params": {"id": notices.popleft()}}
+        if cancel_only:
+            return None
+        for q in (self.targeted.get(browser), self.queue):
+            if q is None:
+                continue
+            while (cmd := q.pop()) is not None:
+                if _expired(cmd, now):
+                    self.expired_count += 1
+                    self._retire(cmd["id"])
+                    continue
+                self.dispatched[cmd["id"]] = (now, browser, cmd.get("deadline_ms"))
+                self.reads.started(cmd["id"])
+                return cmd
+        return None
+
+    def _retire(self, cmd_id: str) -> None:
+        """Forget a command that expired. A read's followers expire no later than it."""
+        self.reads.done(cmd_id)
+        self.reads.finish(cmd_id)
+
+    def cancel(self, cmd_id: str) -> str | None:
+        """Cancel a queued or running command. Returns its state, or None if unknown.
+
+        A read others are waiting on keeps running for them; only this
+        caller's copy of the result is dropped.
+        """
+        flight = self.reads.get(cmd_id)
+        if flight is not None and flight.leader != cmd_id:
+            self.reads.leave(cmd_id)
+            if flight.detached and not flight.followers:
+                self.reads.finish(flight.leader)
+                self._cancel(flight.leader)
+            return "coalesced"
+        if flight is not None and flight.followers:
+            flight.detached = True
+            return "running" if cmd_id in self.dispatched else "queued"
+        self.reads.finish(cmd_id)
+        return self._cancel(cmd_id)
+
+    def _cancel(self, cmd_id: str) -> str | None:
+        self.reads.done(cmd_id)
+        if any(q.remove(cmd_id) is not None for q in self._queues()):
+            state = "queued"
+        elif cmd_id in self.dispatched:
+            _, browser, _ = self.dispatched.pop(cmd_id)
+            self.cancel_notices.setdefault(browser, deque()).append(cmd_id)
+            state = "running"
+        else:
+            return None
+        self._remember_cancelled(cmd_id)
+        self.store.discard(cmd_id)
+        return state
+
+    def _remember_cancelled(self, cmd_id: str) -> None:
+        """Track cancelled ids so late results for them are discarded."""
+        self.cancelled[cmd_id] = None
+        while len(self.cancelled) > CANCELLED_MEMORY:
+            self.cancelled.popitem(last=False)
+
+    def store_result(self, result: dict, raw: bytes) -> bool:
+        """Record a result (parsed and as posted). False if its command was cancelled."""
+        cmd_id = str(result.get("id", ""))
+        self.reads.done(cmd_id)
+        if cmd_id in self.cancelled:
+            del self.cancelled[cmd_id]
+            self.store.discard(cmd_id)
+            return False
+        started = self.dispatched.pop(cmd_id, None)
+        if started is not None:
+            elapsed = time.time() - started[0]
+            self.service_time += SERVICE_TIME_ALPHA * (elapsed - self.service_time)
+        flight = self.reads.finish(cmd_id)
+        if flight is not None:
+            for follower, _ in flight.followers:
+                self.store.copy_chunks(cmd_id, follower)
+                self.store.put_result(follower, json.dumps({**result, "id": follower}).encode("utf-8"))
+        if flight is not None and flight.detached:
+            self.store.discard(cmd_id)
+        else:
+            self.store.put_result(cmd_id, raw)
+        self.result_ready.notify_all()
+        return True
+
+    def wait_result(self, cmd_id: str | None, timeout: float) -> Iterable[bytes] | None:
+        """Wait on ``result_ready`` (which the caller holds) for a result's JSON body.
+
+        Raises ResultEvicted if the result expired before it was claimed.
+        """
+        deadline = time.time() + timeout
+        while True:
+            result = self.store.take_result(cmd_id)
+            if result is not None:
+                return result
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            self.result_ready.wait(remaining)
+
+    def record_navigation(self, browser: str, tab_id: int) -> int:
+        """Note that a tab navigated; returns the navigation's sequence number."""
+        self.nav_counter += 1
+        key = (browser, tab_id)
+        self.navigations.pop(key, None)
+        self.navigations[key] = self.nav_counter
+        while len(self.navigations) > NAVIGATION_MEMORY:
+            _, seq = self.navigations.popitem(last=False)
+            self.nav_floor = max(self.nav_floor, seq)
+        return self.nav_counter
+
+    def publish(self, browser: str, events: list[dict]) -> None:
+        """Add page events to the log and wake stream subscribers."""
+        for event in events:
+            self.events.append(browser, event)
+        if events:
+            self.event_ready.notify_all()
+
+    def navigation_seq(self, tab_id: int, browser: str | None = None) -> int:
+        """Sequence number of the tab's last navigation.
+
+        Tabs forgotten to keep the table bounded report the newest forgotten
+        number, so anything older than that is treated as stale.
+        """
+        seqs = [
+            seq for (b, t), seq in self.navigations.items()
+            if t == tab_id and (browser is None or b == browser)
+        ]
+        return max(seqs) if seqs else self.nav_floor
+
+    def expire(self) -> None:
+        """Drop what outlived its deadline, wherever it is.
+
+        Queued commands expire in every queue, not just those of browsers
+        that poll; dispatched commands whose result never came (the worker
+        restarted, say) stop counting as in flight; reads stop taking
+        followers once their deadline passes; empty per-browser queues go
+        away. Unclaimed results expire too.
+        """
+        now = time.time()
+        for q in self._queues():
+            for cmd in q.expire(now * 1000):
+                self.expired_count += 1
+                self._retire(cmd["id"])
+        self.reads.expire(now * 1000)
+        cutoff_ms = (now - DISPATCH_GRACE) * 1000
+        for cmd_id, (_, _, deadline_ms) in list(self.dispatched.items()):
+            if deadline_ms is not None and deadline_ms <= cutoff_ms:
+                del self.dispatched[cmd_id]
+                self.reads.done(cmd_id)
+        for browser in [b for b, q in self.targeted.items() if not q]:
+            del self.targeted[browser]
+        for browser in [b for b, notices in self.cancel_notices.items() if not notices]:
+            del self.cancel_notices[browser]
+        self.store.expire()
+
+    def status(self) -> dict:
+        depth = self.queue_depth()
+        by_priority = dict.fromkeys(PRIORITIES, 0)
+        for q in self._queues():
+            for priority, n in q.depth_by_priority().items():
+                by_priority[priority] += n
+        browsers = self.live_browsers()
+        return {
+            "server": "ok",
+            "extension_connected": bool(browsers),
+            "pending_command": depth > 0,
+            "browsers": browsers,
+            "queue": {
+                "depth": depth,
+                "capacity": self.queue.capacity,
+                "by_priority": by_priority,
+                "in_flight": len(self.dispatched),
+                "expired": self.expired_count,
+                "coalesced": self.reads.hits,
+            },
+            "results": self.store.stats(),
+            "events": self.events.stats(),
+        }
+
+    def advertisement(self) -> dict:
+        """What peers need to route commands here."""
+        return {
+            "relay_id": self.federation.relay_id,
+            "url": self.federation.self_url,
+            "browsers": self.live_browsers(),
+            "depth": self.queue_depth(),
+            "capacity": self.queue.capacity,
+            "in_flight": len(self.dispatched),
+            "peers": sorted(self.federation.peers),
+        }
+
+    def advertise(self) -> dict:
+        with self.lock:
+            self.expire()
+            return self.advertisement()
+
+
+def _expired(cmd: dict, now: float) -> bool:
+    deadline_ms = cmd.get("deadline_ms")
+    return deadline_ms is not None and deadline_ms <= now * 1000
+
+
+def _relay() -> Relay:
+    return current_app.extensions["browser_relay"]
+
+
+def _client_id(body: dict) -> str:
+    """Identify the submitting client for fair sharing."""
+    return str(body.get("client") or request.headers.get("X-Relay-Client") or request.remote_addr or "")
+
+
+def _proxied(resp: httpx.Response) -> Response:
+    proxied = Response(resp.content, status=resp.status_code, mimetype="application/json")
+    if "Retry-After" in resp.headers:
+        proxied.headers["Retry-After"] = resp.headers["Retry-After"]
+    return proxied
+
+
+@bp.get("/command")
 def get_command():
-    """Extension polls this to get the next command."""
-    global _pending_command, _last_poll_ts
+    """Extension polls this to get the next command.
 
-    with _lock:
-        _last_poll_ts = time.time()
-        if _pending_command is None:
-            return Response(status=204)
-        cmd = _pending_command
-        _pending_command = None
-    return jsonify(cmd)
+    Cancellation notices for running commands are served ahead of new work;
+    ``cancel_only=1`` asks for nothing else. Commands whose deadline has
+    passed are dropped instead of dispatched. ``browser`` names the polling
+    extension; it defaults to ``default``. ``X-Relay-Subscribers`` tells it
+    how many clients follow the event stream, so it collects page events
+    only while someone does.
+    """
+    relay = _relay()
+    browser = request.args.get("browser") or DEFAULT_BROWSER
+    with relay.lock:
+        cmd = relay.next_command(browser, cancel_only=bool(request.args.get("cancel_only")))
+        subscribers = relay.events.subscribers
+    resp = Response(status=204) if cmd is None else jsonify(cmd)
+    resp.headers["X-Relay-Subscribers"] = str(subscribers)
+    return resp
 
 
-@app.post("/command")
+@bp.post("/command")
 def post_command():
-    """CLI pushes a command here."""
-    global _pending_command, _pending_result
+    """CLI pushes a command here.
 
+    An optional ``timeout`` (seconds) becomes an absolute ``deadline_ms``
+    that the relay and the extension both enforce. A command for a browser
+    this relay does not have is forwarded to a federation peer that does.
+    A read-only command identical to one in flight shares that command's
+    result; ``coalesced_with`` in the reply names it.
+    """
+    relay = _relay()
     body = request.get_json(force=True)
     if not body or "action" not in body:
         return jsonify({"error": "Missing 'action' field"}), 400
 
+    priority = body.get("priority") or DEFAULT_PRIORITY
+    if priority not in PRIORITIES:
+        return jsonify({"error": f"Unknown priority '{priority}'", "priorities": list(PRIORITIES)}), 400
     body.setdefault("id", str(uuid.uuid4()))
+
+    if relay.federation.peers and not request.headers.get(FORWARDED_HEADER):
+        with relay.lock:
+            local = relay.live_browsers()
+        browser = body.get("browser")
+        if (browser and browser not in local) or (not browser and not local):
+            peer = relay.federation.route(browser)
+            if peer is not None:
+                return _proxied(relay.federation.forward_command(peer, body, _client_id(body)))
+
+    body.pop("priority", None)
+    client = _client_id(body)
+    body.pop("client", None)
+
+    timeout = body.pop("timeout", None)
+    if timeout is not None:
+        try:
+            body["deadline_ms"] = int((time.time() + float(timeout)) * 1000)
+        except (TypeError, ValueError):
+            return jsonify({"error": "Invalid 'timeout' field"}), 400
     body.setdefault("params", {})
 
-    with _lock:
-        _pending_command = body
-        _pending_result = None
+    with relay.lock:
+        try:
+            try:
+                leader = relay.submit(body, priority=priority, client=client)
+            except QueueFull:
+                # Dead commands may be holding the room; sweep them and retry once.
+                relay.expire()
+                leader = relay.submit(body, priority=priority, client=client)
+        except QueueFull as e:
+            retry_after = relay.retry_after()
+            resp = jsonify({"error": e.reason, "retry_after": retry_after})
+            resp.status_code = 429
+            resp.headers["Retry-After"] = str(retry_after)
+            return resp
+
+    accepted = {"id": body["id"], "queued": True, "priority": priority}
+    if leader is not None:
+        accepted["coalesced_with"] = leader
+    return jsonify(accepted)
 
-    return jsonify({"id": body["id"], "queued": True})
 
+@bp.delete("/command/<cmd_id>")
+def cancel_command(cmd_id: str):
+    """Cancel a queued or running command."""
+    relay = _relay()
+    peer = relay.federation.take_peer(cmd_id)
+    if peer is not None:
+        return _proxied(relay.federation.request(peer, "DELETE", f"/command/{cmd_id}"))
 
-@app.post("/result")
+    with relay.lock:
+        state = relay.cancel(cmd_id)
+    if state is None:
+        return jsonify({"id": cmd_id, "cancelled": False, "error": "Unknown or finished command"}), 404
+    return jsonify({"id": cmd_id, "cancelled": True, "state": state})
+
+
+@bp.post("/result")
 def post_result():
     """Extension pushes command results here."""
-    global _pending_result
-
+    relay = _relay()
     body = request.get_json(force=True)
-    with _lock:
-        _pending_result = body
+    with relay.lock:
+        stored = relay.store_result(body, request.get_data())
+    if not stored:
+        return jsonify({"received": False, "cancelled": True})
     return jsonify({"received": True})
 
 
-@app.get("/result")
+@bp.get("/result")
 def get_result():
-    """CLI polls this to get the result of a command."""
-    global _pending_result
+    """CLI polls this to get the result of a command.
 
+    With ``id`` the call waits for that command's result; without it the
+    oldest unclaimed result is returned.
+    """
+    relay = _relay()
     timeout = float(request.args.get("timeout", DEFAULT_RESULT_TIMEOUT))
-    deadline = time.time() + timeout
+    cmd_id = request.args.get("id")
+
+    peer = relay.federation.peer_for(cmd_id) if cmd_id else None
+    if peer is not None:
+        resp = relay.federation.request(peer, "GET", "/result", params=dict(request.args), timeout=timeout + 5)
+        if resp.status_code == 200 and not resp.json().get("stream"):
+            relay.federation.take_peer(cmd_id)
+        return _proxied(resp)
+
+    try:
+        with relay.result_ready:
+            result = relay.wait_result(cmd_id, timeout)
+    except ResultEvicted as e:
+        return jsonify({"ok": False, "error": str(e), "evicted": e.reason}), 410
+    if result is None:
+        return jsonify({"ok": False, "error": "Timeout waiting for result"}), 504
+    return Response(result, mimetype="application/json")
+
+
+@bp.post("/result/<cmd_id>/chunk")
+def post_result_chunk(cmd_id: str):
+    """Extension uploads one piece of a large result before posting the result itself."""
+    relay = _relay()
+    seq = request.args.get("seq", type=int)
+    data = request.get_data()
+    with relay.lock:
+        if cmd_id in relay.cancelled:
+            return jsonify({"received": False, "cancelled": True})
+        expected = relay.store.next_seq(cmd_id)
+        if seq != expected:
+            return jsonify({"error": f"Expected chunk {expected}, got {seq}"}), 409
+        relay.store.add_chunk(cmd_id, data)
+    return jsonify({"received": True, "seq": seq})
+
+
+def _pick_encoding(accept: str) -> str | None:
+    accepted = {part.split(";")[0].strip().lower() for part in accept.split(",")}
+    if zstandard is not None and "zstd" in accepted:
+        return "zstd"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def _encode_chunks(chunks: Iterable[bytes], encoding: str | None):
+    """Yield the chunks, compressed as one continuous stream."""
+    if encoding is None:
+        yield from chunks
+        return
+    if encoding == "zstd":
+        compressor = zstandard.ZstdCompressor().compressobj()
+    else:
+        compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def _peer_chunks(resp: httpx.Response):
+    """Relay a peer's streamed body as it arrives, closing it when done."""
+    try:
+        yield from resp.iter_bytes()
+    finally:
+        resp.close()
+
+
+@bp.get("/result/<cmd_id>/stream")
+def get_result_stream(cmd_id: str):
+    """Serve the chunks of a large result once, compressed if the client accepts it."""
+    relay = _relay()
+    peer = relay.federation.take_peer(cmd_id)
+    if peer is not None:
+        # Peers hand back the raw chunks; encoding is this relay's business.
+        resp = relay.federation.open_stream(peer, f"/result/{cmd_id}/stream")
+        if resp.status_code != 200:
+            resp.read()
+            resp.close()
+            return _proxied(resp)
+        chunks = _peer_chunks(resp)
+    else:
+        with relay.lock:
+            chunks = relay.store.take_chunks(cmd_id)
+    if chunks is None:
+        return jsonify({"ok": False, "error": f"No streamed result for {cmd_id}"}), 404
+
+    encoding = _pick_encoding(request.headers.get("Accept-Encoding", ""))
+    resp = Response(_encode_chunks(chunks, encoding), mimetype="application/octet-stream")
+    if encoding:
+        resp.headers["Content-Encoding"] = encoding
+    return resp
+
+
+@bp.post("/navigation")
+def post_navigation():
+    """Extension reports that a tab started loading a new page."""
+    relay = _relay()
+    body = request.get_json(force=True) or {}
+    if not isinstance(body.get("tab_id"), int):
+        return jsonify({"error": "Missing or invalid 'tab_id'"}), 400
+    browser = request.args.get("browser") or DEFAULT_BROWSER
+    with relay.lock:
+        seq = relay.record_navigation(browser, body["tab_id"])
+        relay.publish(browser, [{"type": "navigation", "tab_id": body["tab_id"], "url": body.get("url"), "seq": seq}])
+    return jsonify({"seq": seq})
+
+
+@bp.get("/navigation")
+def get_navigation():
+    """Navigation sequence numbers: the latest overall and, with ``tab_id``, the tab's."""
+    relay = _relay()
+    tab_id = request.args.get("tab_id", type=int)
+    browser = request.args.get("browser")
+    with relay.lock:
+        data = {"seq": relay.nav_counter}
+        if tab_id is not None:
+            data["tab_seq"] = relay.navigation_seq(tab_id, browser)
+    return jsonify(data)
+
+
+@bp.post("/events")
+def post_events():
+    """Extension pushes a batch of page events: ``{"events": [{"type": ..., "tab_id": ...}, ...]}``."""
+    relay = _relay()
+    body = request.get_json(force=True) or {}
+    events = body.get("events")
+    if not isinstance(events, list) or not all(
+        isinstance(e, dict) and e.get("type") in EVENT_TYPES for e in events
+    ):
+        return jsonify({"error": f"'events' must be a list of objects with a type in {', '.join(EVENT_TYPES)}"}), 400
+    browser = request.args.get("browser") or DEFAULT_BROWSER
+    with relay.lock:
+        relay.publish(browser, events)
+        return jsonify({"last_id": relay.events.last_id, "subscribers": relay.events.subscribers})
 
-    while time.time() < deadline:
-        with _lock:
-            if _pending_result is not None:
-                result = _pending_result
-                _pending_result = None
-                return jsonify(result)
-        time.sleep(0.1)
 
-    return jsonify({"ok": False, "error": "Timeout waiting for result"}), 504
+@bp.get("/events")
+def get_events():
+    """Server-sent event stream of page events.
 
+    Filters: ``tab_id``, ``type`` (comma-separated) and ``browser``. A stream
+    resumes after ``since`` or the ``Last-Event-ID`` header; without either
+    it starts with the next event, or with everything kept if ``follow=0``,
+    which returns what is kept and ends instead of waiting for more. If
+    events were dropped since the resume point, a ``gap`` event says how many.
+    """
+    relay = _relay()
+    types = {t for t in request.args.get("type", "").split(",") if t}
+    unknown = types - set(EVENT_TYPES)
+    if unknown:
+        return jsonify({"error": f"Unknown event type(s): {', '.join(sorted(unknown))}"}), 400
+    filters = {
+        "tab_id": request.args.get("tab_id", type=int),
+        "types": types or None,
+        "browser": request.args.get("browser"),
+    }
+    follow = request.args.get("follow", "1") not in ("0", "false")
+    since = request.args.get("since", type=int)
+    if since is None:
+        since = request.headers.get("Last-Event-ID", type=int)
+    with relay.lock:
+        after = since if since is not None else (relay.events.last_id if follow else 0)
+    resp = Response(_event_stream(relay, after, filters, follow, since is not None), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
 
-@app.get("/status")
+
+def _event_stream(relay: Relay, after: int, filters: dict, follow: bool, check_gap: bool):
+    with relay.lock:
+        relay.events.subscribers += 1
+    try:
+        # Something to send at once, so the client sees the response start.
+        yield b": ok\n\n"
+        while True:
+            with relay.lock:
+                deadline = time.time() + KEEPALIVE_INTERVAL
+                # Events for other tabs or types wake us too; keep waiting for a match.
+                while True:
+                    missed = relay.events.missed(after) if check_gap else 0
+                    batch = relay.events.since(after, **filters)
+                    after = relay.events.last_id
+                    check_gap = True
+                    remaining = deadline - time.time()
+                    if batch or missed or not follow or remaining <= 0:
+                        break
+                    relay.event_ready.wait(remaining)
+            if missed:
+                yield f"event: gap\ndata: {{\"missed\":{missed}}}\n\n".encode()
+            for event in batch:
+                yield sse(event)
+            if not follow:
+                return
+            if not batch and not missed:
+                yield b": keepalive\n\n"
+    finally:
+        with relay.lock:
+            relay.events.subscribers -= 1
+
+
+@bp.get("/status")
 def status():
     """Health check -- reports if the extension has polled recently."""
-    with _lock:
-        extension_alive = (time.time() - _last_poll_ts) < EXTENSION_ALIVE_THRESHOLD if _last_poll_ts else False
-        has_pending = _pending_command is not None
+    relay = _relay()
+    with relay.lock:
+        relay.expire()
+        data = relay.status()
+    data["federation"] = relay.federation.summary()
+    return jsonify(data)
+
+
+@bp.before_request
+def _authenticate_peers():
+    """Peer calls -- joins, advertisement polls and forwarded commands --
+    must carry the federation token. Without a token configured, only
+    relays on this host may federate."""
+    if request.path not in PEER_PATHS and not request.headers.get(FORWARDED_HEADER):
+        return None
+    federation = _relay().federation
+    if federation.token is None:
+        if is_loopback(request.remote_addr):
+            return None
+        return jsonify({"error": "Federation with remote relays requires a federation token"}), 403
+    if not federation.authorized(request.headers.get(TOKEN_HEADER)):
+        return jsonify({"error": "Missing or wrong federation token"}), 401
+    return None
+
+
+@bp.get("/federation/advertisement")
+def federation_advertisement():
+    """Connected browsers and spare capacity, polled by peers."""
+    relay = _relay()
+    with relay.lock:
+        return jsonify(relay.advertisement())
+
+
+@bp.post("/federation/join")
+def federation_join():
+    """A relay announces itself; it becomes a peer and learns about us."""
+    relay = _relay()
+    body = request.get_json(force=True) or {}
+    if not body.get("url"):
+        return jsonify({"error": "Missing 'url' field"}), 400
+    relay.federation.add_peer(body["url"], advertisement=body)
+    with relay.lock:
+        return jsonify(relay.advertisement())
+
+
+@bp.get("/federation/browsers")
+def federation_browsers():
+    """Every browser reachable from this relay, local or through a peer."""
+    relay = _relay()
+    with relay.lock:
+        own = relay.advertisement()
+    browsers = [{"browser": b, "relay_id": own["relay_id"], "local": True} for b in own["browsers"]]
+    for url, ad in relay.federation.advertisements().items():
+        browsers += [{"browser": b, "relay_id": ad["relay_id"], "relay_url": url, "local": False} for b in ad["browsers"]]
+    return jsonify({"browsers": browsers})
+
+
+def create_app(relay: Relay | None = None) -> Flask:
+    """Build a Flask app serving one relay."""
+    flask_app = Flask(__name__)
+    CORS(flask_app, resources={r"/*": {"origins": "*"}}, expose_headers=["X-Relay-Subscribers"])
+    flask_app.extensions["browser_relay"] = relay or Relay()
+    flask_app.register_blueprint(bp)
+    return flask_app
+
+
+app = create_app()
+
+
+def serve_unix_socket(flask_app: Flask, path: str | os.PathLike) -> BaseWSGIServer:
+    """Also serve ``flask_app`` on a Unix socket, from a background thread.
+
+    Local clients skip TCP setup and loopback, and the socket is only
+    accessible to its owner from the moment it exists. A leftover socket
+    file is replaced; the socket is removed when the server is closed or
+    the process exits.
+    """
+    path = os.fspath(path)
+    os.makedirs(os.path.dirname(path) or ".", mode=0o700, exist_ok=True)
+    umask = os.umask(0o177)
+    try:
+        server = make_server(f"unix://{path}", 0, flask_app, threaded=True)
+    finally:
+        os.umask(umask)
+    inode = os.stat(path).st_ino
+    close = server.server_close
+
+    def server_close():
+        close()
+        _remove_socket(path, inode)
+
+    server.server_close = server_close
+    atexit.register(_remove_socket, path, inode)
+    threading.Thread(target=server.serve_forever, name="relay-unix-socket", daemon=True).start()
+    return server
+
 
-    return jsonify({
-        "server": "ok",
-        "extension_connected": extension_alive,
-        "pending_command": has_pending,
-    })
+def _remove_socket(path: str, inode: int) -> None:
+    """Unlink our socket file, unless another relay has since replaced it."""
+    try:
+        if os.stat(path).st_ino == inode:
+            os.unlink(path)
+    except OSError:
+        pass
 
 
-def run_server(host: str = "127.0.0.1", port: int = 18321):
-    """Start the relay server (blocking)."""
+def run_server(host: str = "127.0.0.1", port: int = 18321, socket_path: str | os.PathLike | None = None):
+    """Start the relay server (blocking), optionally on a Unix socket as well."""
+    if socket_path:
+        serve_unix_socket(app, socket_path)
     app.run(host=host, port=port, debug=False)
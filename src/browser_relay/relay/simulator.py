@@ -0,0 +1,71 @@
+"""Simulated extension -- polls a relay like the real one does, without Chrome.
+
+Used by the tests and benchmarks to exercise relays (and federations of
+relays) end to end.
+"""
+
+import threading
+from collections.abc import Callable
+
+import httpx
+
+
+def echo(browser: str, command: dict) -> dict:
+    """Default handler: report which browser ran which action."""
+    return {"ok": True, "browser": browser, "action": command["action"], "params": command.get("params", {})}
+
+
+class SimulatedExtension:
+    """Polls ``GET /command`` on a background thread and posts results."""
+
+    def __init__(
+        self,
+        relay_url: str,
+        browser: str = "default",
+        handler: Callable[[str, dict], dict] = echo,
+        poll_interval: float = 0.02,
+    ):
+        self.relay_url = relay_url.rstrip("/")
+        self.browser = browser
+        self.handler = handler
+        self.poll_interval = poll_interval
+        self.executed: list[dict] = []
+        self.cancelled: list[str] = []
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def __enter__(self) -> "SimulatedExtension":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name=f"sim-{self.browser}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self) -> None:
+        with httpx.Client(base_url=self.relay_url, timeout=5) as client:
+            while not self._stop.is_set():
+                try:
+                    resp = client.get("/command", params={"browser": self.browser})
+                except httpx.HTTPError:
+                    self._stop.wait(self.poll_interval)
+                    continue
+                if resp.status_code != 200:
+                    self._stop.wait(self.poll_interval)
+                    continue
+                command = resp.json()
+                if command["action"] == "cancel":
+                    self.cancelled.append(command["params"]["id"])
+                    continue
+                self.executed.append(command)
+                result = self.handler(self.browser, command)
+                client.post("/result", json={"id": command["id"], **result})
@@ -0,0 +1,233 @@
+"""Result storage with a TTL, a byte budget and spill-to-disk for large payloads."""
+
+import os
+import shutil
+import tempfile
+import time
+import weakref
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator
+
+RESULT_TTL = 300.0
+MAX_STORED_BYTES = 512 * 1024 * 1024
+SPILL_THRESHOLD = 1024 * 1024
+EVICTED_MEMORY = 1024
+READ_SIZE = 256 * 1024
+
+
+class ResultEvicted(Exception):
+    """Raised when a result was dropped before anyone claimed it."""
+
+    def __init__(self, cmd_id: str, reason: str):
+        super().__init__(f"Result for {cmd_id} was evicted ({reason})")
+        self.reason = reason
+
+
+class _Entry:
+    __slots__ = ("created", "size", "count", "parts", "path")
+
+    def __init__(self, created: float):
+        self.created = created
+        self.size = 0
+        self.count = 0
+        self.parts: list[bytes] = []
+        self.path: str | None = None
+
+
+class ResultStore:
+    """Unclaimed results and uploaded result chunks, keyed by command id.
+
+    Payloads above ``spill_threshold`` are written to temp files and read
+    back as a stream. Entries older than ``ttl`` seconds, and the oldest
+    entries whenever the total passes ``max_bytes``, are evicted.
+    Not thread-safe on its own -- callers hold the relay lock.
+    """
+
+    def __init__(
+        self,
+        ttl: float = RESULT_TTL,
+        max_bytes: int = MAX_STORED_BYTES,
+        spill_threshold: int = SPILL_THRESHOLD,
+    ):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.spill_threshold = spill_threshold
+        self._results: OrderedDict[str, _Entry] = OrderedDict()
+        self._chunks: OrderedDict[str, _Entry] = OrderedDict()
+        self._evicted: OrderedDict[str, str] = OrderedDict()
+        self._memory_bytes = 0
+        self._spilled_bytes = 0
+        self._spills = 0
+        self._evictions = {"ttl": 0, "budget": 0}
+        self._dir: str | None = None
+
+    # -- results ---------------------------------------------------------
+
+    def put_result(self, cmd_id: str, data: bytes) -> None:
+        """Store a result's JSON body."""
+        self._drop(self._results, cmd_id)
+        entry = _Entry(time.time())
+        self._results[cmd_id] = entry
+        self._append(cmd_id, entry, data)
+        self.expire()
+
+    def take_result(self, cmd_id: str | None = None) -> Iterable[bytes] | None:
+        """Remove and return a result (the oldest if no id).
+
+        Raises ResultEvicted if the result was evicted before being claimed.
+        """
+        if cmd_id is None:
+            if not self._results:
+                return None
+            cmd_id = next(iter(self._results))
+        elif cmd_id not in self._results:
+            reason = self._evicted.pop(cmd_id, None)
+            if reason is not None:
+                raise ResultEvicted(cmd_id, reason)
+            return None
+        return self._release(self._results.pop(cmd_id))
+
+    def __contains__(self, cmd_id: str) -> bool:
+        return cmd_id in self._results
+
+    # -- chunks ----------------------------------------------------------
+
+    def next_seq(self, cmd_id: str) -> int:
+        entry = self._chunks.get(cmd_id)
+        return 0 if entry is None else entry.count
+
+    def add_chunk(self, cmd_id: str, data: bytes) -> None:
+        entry = self._chunks.get(cmd_id)
+        if entry is None:
+            entry = self._chunks[cmd_id] = _Entry(time.time())
+        self._append(cmd_id, entry, data)
+        self.expire()
+
+    def take_chunks(self, cmd_id: str) -> Iterable[bytes] | None:
+        entry = self._chunks.pop(cmd_id, None)
+        return None if entry is None else self._release(entry)
+
+    def copy_chunks(self, cmd_id: str, to_id: str) -> None:
+        """Upload ``cmd_id``'s chunks again under ``to_id``."""
+        entry = self._chunks.get(cmd_id)
+        if entry is None:
+            return
+        copy = self._chunks[to_id] = _Entry(entry.created)
+        if entry.path is None:
+            for part in entry.parts:
+                self._append(to_id, copy, part)
+        else:
+            with open(entry.path, "rb") as f:
+                while data := f.read(READ_SIZE):
+                    self._append(to_id, copy, data)
+        self.expire()
+
+    def has_chunks(self, cmd_id: str) -> bool:
+        return cmd_id in self._chunks
+
+    # -- housekeeping ----------------------------------------------------
+
+    def discard(self, cmd_id: str) -> None:
+        """Forget everything stored for a command, e.g. after cancellation."""
+        self._drop(self._results, cmd_id)
+        self._drop(self._chunks, cmd_id)
+
+    def expire(self, now: float | None = None) -> None:
+        """Evict entries past the TTL, then the oldest until under budget."""
+        cutoff = (now or time.time()) - self.ttl
+        for store in (self._results, self._chunks):
+            while store:
+                cmd_id, entry = next(iter(store.items()))
+                if entry.created > cutoff:
+                    break
+                self._evict(store, cmd_id, "ttl")
+        while self._memory_bytes + self._spilled_bytes > self.max_bytes and (self._results or self._chunks):
+            oldest = min(
+                (s for s in (self._results, self._chunks) if s),
+                key=lambda s: next(iter(s.values())).created,
+            )
+            self._evict(oldest, next(iter(oldest)), "budget")
+
+    def stats(self) -> dict:
+        return {
+            "results": len(self._results),
+            "uploads": len(self._chunks),
+            "memory_bytes": self._memory_bytes,
+            "spilled_bytes": self._spilled_bytes,
+            "spilled_files": sum(1 for s in (self._results, self._chunks) for e in s.values() if e.path),
+            "spills": self._spills,
+            "evicted": dict(self._evictions),
+            "ttl": self.ttl,
+            "max_bytes": self.max_bytes,
+        }
+
+    # -- internals -------------------------------------------------------
+
+    def _append(self, cmd_id: str, entry: _Entry, data: bytes) -> None:
+        entry.size += len(data)
+        entry.count += 1
+        if entry.path is None and entry.size <= self.spill_threshold:
+            entry.parts.append(data)
+            self._memory_bytes += len(data)
+            return
+        if entry.path is None:
+            entry.path = self._spill_path(cmd_id)
+            with open(entry.path, "wb") as f:
+                f.writelines(entry.parts)
+            self._memory_bytes -= entry.size - len(data)
+            self._spilled_bytes += entry.size - len(data)
+            entry.parts = []
+            self._spills += 1
+        with open(entry.path, "ab") as f:
+            f.write(data)
+        self._spilled_bytes += len(data)
+
+    def _release(self, entry: _Entry) -> Iterable[bytes]:
+        if entry.path is None:
+            self._memory_bytes -= entry.size
+            return entry.parts
+        self._spilled_bytes -= entry.size
+        return _read_and_delete(entry.path)
+
+    def _drop(self, store: OrderedDict[str, _Entry], cmd_id: str) -> bool:
+        entry = store.pop(cmd_id, None)
+        if entry is None:
+            return False
+        if entry.path is None:
+            self._memory_bytes -= entry.size
+        else:
+            self._spilled_bytes -= entry.size
+            _unlink(entry.path)
+        return True
+
+    def _evict(self, store: OrderedDict[str, _Entry], cmd_id: str, reason: str) -> None:
+        self._drop(store, cmd_id)
+        self._evictions[reason] += 1
+        if store is self._results:
+            self._evicted[cmd_id] = reason
+            while len(self._evicted) > EVICTED_MEMORY:
+                self._evicted.popitem(last=False)
+
+    def _spill_path(self, cmd_id: str) -> str:
+        if self._dir is None:
+            self._dir = tempfile.mkdtemp(prefix="browser-relay-")
+            weakref.finalize(self, shutil.rmtree, self._dir, ignore_errors=True)
+        fd, path = tempfile.mkstemp(dir=self._dir, prefix=f"{cmd_id[:32]}-".replace("/", "_"))
+        os.close(fd)
+        return path
+
+
+def _read_and_delete(path: str) -> Iterator[bytes]:
+    try:
+        with open(path, "rb") as f:
+            while data := f.read(READ_SIZE):
+                yield data
+    finally:
+        _unlink(path)
+
+
+def _unlink(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,199 @@
+"""Local index of the last snapshot per tab, for finding refs without the browser.
+
+``snapshot`` saves its elements here together with the relay's navigation
+sequence number from just before the snapshot was taken. A lookup is only
+trusted while the relay has seen no navigation in that tab since.
+"""
+
+import json
+import os
+import re
+import time
+from difflib import SequenceMatcher
+from pathlib import Path
+
+INDEX_DIR = Path.home() / ".browser-relay" / "snapshots"
+LAST_FILE = "last.json"
+MIN_SCORE = 0.6
+# Inputs whose values are secrets or page internals, never written to disk.
+UNSAVED_VALUE_TYPES = frozenset({"password", "hidden"})
+
+# Roles elements have without an explicit role attribute (a subset of HTML-AAM).
+IMPLICIT_ROLES = {
+    "a": "link",
+    "button": "button",
+    "select": "combobox",
+    "textarea": "textbox",
+    "summary": "button",
+    "option": "option",
+    "nav": "navigation",
+    "main": "main",
+    "form": "form",
+    "img": "img",
+    "h1": "heading", "h2": "heading", "h3": "heading", "h4": "heading", "h5": "heading", "h6": "heading",
+    "ul": "list", "ol": "list", "li": "listitem",
+    "table": "table", "tr": "row", "td": "cell", "th": "columnheader",
+}
+INPUT_ROLES = {
+    "button": "button",
+    "submit": "button",
+    "reset": "button",
+    "image": "button",
+    "checkbox": "checkbox",
+    "radio": "radio",
+    "range": "slider",
+    "number": "spinbutton",
+    "search": "searchbox",
+}
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+class StaleIndex(Exception):
+    """The tab navigated after its snapshot was indexed."""
+
+
+def role_of(element: dict) -> str | None:
+    """Explicit role, or the implicit one for its tag."""
+    if element.get("role"):
+        return element["role"]
+    tag = element.get("tag")
+    if tag == "input":
+        return INPUT_ROLES.get(element.get("type") or "text", "textbox")
+    if tag == "a" and not element.get("href"):
+        return None
+    return IMPLICIT_ROLES.get(tag)
+
+
+def _normalize(text: str) -> str:
+    return " ".join(_WORD.findall(text.lower()))
+
+
+def fuzzy_score(query: str, text: str) -> float:
+    """1.0 for an exact match, 0.9 for containment, else the best similarity
+    of the query against same-length word windows of the text."""
+    q, t = _normalize(query), _normalize(text)
+    if not q or not t:
+        return 0.0
+    if q == t:
+        return 1.0
+    if q in t:
+        return 0.9
+    words = t.split()
+    width = len(q.split())
+    windows = {" ".join(words[i:i + width]) for i in range(max(1, len(words) - width + 1))}
+    return max(SequenceMatcher(None, q, w).ratio() for w in windows) * 0.85
+
+
+class SnapshotIndex:
+    """Snapshots on disk, one file per (browser, tab)."""
+
+    def __init__(self, directory: Path = INDEX_DIR):
+        self.directory = Path(directory)
+
+    def _path(self, browser: str | None, tab_id: int) -> Path:
+        return self.directory / f"{browser or 'default'}-{tab_id}.json"
+
+    def _write(self, path: Path, data: dict) -> None:
+        """Replace ``path`` atomically; the file is private from the moment it exists."""
+        tmp = path.with_suffix(".tmp")
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(json.dumps(data, ensure_ascii=False))
+        tmp.replace(path)
+
+    def save(self, snapshot: dict, nav_seq: int | None, browser: str | None = None) -> Path:
+        """Store a snapshot result (which must carry ``tab_id``) and mark it as the latest.
+
+        Values of password and hidden inputs are left out.
+        """
+        self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+        entry = {
+            "tab_id": snapshot["tab_id"],
+            "browser": browser,
+            "url": snapshot.get("url"),
+            "title": snapshot.get("title"),
+            "nav_seq": nav_seq,
+            "taken_at": time.time(),
+            "elements": [_without_secrets(el) for el in snapshot.get("elements", [])],
+        }
+        path = self._path(browser, snapshot["tab_id"])
+        self._write(path, entry)
+        self._write(self.directory / LAST_FILE, {"browser": browser, "tab_id": snapshot["tab_id"]})
+        return path
+
+    def load(self, tab_id: int | None = None, browser: str | None = None) -> dict | None:
+        """The indexed snapshot for a tab, or for the most recently snapshotted tab."""
+        if tab_id is None:
+            try:
+                last = json.loads((self.directory / LAST_FILE).read_text())
+            except (OSError, ValueError):
+                return None
+            tab_id, browser = last["tab_id"], last.get("browser")
+        try:
+            return json.loads(self._path(browser, tab_id).read_text())
+        except (OSError, ValueError):
+            return None
+
+    def invalidate(self, tab_id: int | None = None, browser: str | None = None) -> None:
+        """Forget a tab's snapshot, or with no ``tab_id`` every snapshot of ``browser``."""
+        if tab_id is not None:
+            self._path(browser, tab_id).unlink(missing_ok=True)
+            return
+        pattern = re.compile(re.escape(browser or "default") + r"-\d+\.json")
+        for path in self.directory.glob("*.json"):
+            if pattern.fullmatch(path.name):
+                path.unlink(missing_ok=True)
+
+
+def _without_secrets(element: dict) -> dict:
+    if element.get("tag") == "input" and element.get("type") in UNSAVED_VALUE_TYPES and "value" in element:
+        return {k: v for k, v in element.items() if k != "value"}
+    return element
+
+
+def check_fresh(entry: dict, tab_seq: int | None) -> None:
+    """Raise StaleIndex if the relay saw a navigation in the tab after the snapshot.
+
+    ``tab_seq`` is None when the relay could not be asked; the index is then trusted.
+    """
+    if tab_seq is None or entry.get("nav_seq") is None:
+        return
+    if tab_seq > entry["nav_seq"]:
+        raise StaleIndex(f"Tab {entry['tab_id']} navigated since its snapshot")
+
+
+def find(
+    elements: list[dict],
+    text: str | None = None,
+    role: str | None = None,
+    tag: str | None = None,
+    aria_label: str | None = None,
+    min_score: float = MIN_SCORE,
+) -> list[tuple[float, dict]]:
+    """Elements matching every given criterion, best match first.
+
+    ``text`` is matched fuzzily against the visible text, aria label,
+    placeholder and value; ``aria_label`` against the aria label only.
+    """
+    matches = []
+    for element in elements:
+        if tag and element.get("tag") != tag.lower():
+            continue
+        if role and role_of(element) != role:
+            continue
+        score = 1.0
+        if aria_label:
+            score = fuzzy_score(aria_label, element.get("ariaLabel") or "")
+            if score < min_score:
+                continue
+        if text:
+            fields = (element.get(k) or "" for k in ("text", "ariaLabel", "placeholder", "value"))
+            text_score = max(fuzzy_score(text, f) for f in fields)
+            if text_score < min_score:
+                continue
+            score = min(score, text_score)
+        matches.append((score, element))
+    # Stable sort keeps document order among equal scores.
+    matches.sort(key=lambda m: -m[0])
+    return matches
@@ -0,0 +1,175 @@
+"""Compact, token-budgeted renderings of a snapshot for LLM prompts.
+
+    e12 button "Sign in"
+    e13 textbox "Email" value="a@b.c"
+    … 47 more link like "Item 4" (e20 … e311)
+
+Elements are ranked by how interactive they are, how close they are to the
+viewport and how well they are labelled; the best that fit the budget are
+kept and printed in document order. Runs of look-alike elements (list
+items, table rows) collapse to a few examples and a summary line.
+"""
+
+import json
+import math
+import re
+
+from browser_relay.snapshot_index import role_of
+
+COLLAPSE_AFTER = 3
+LABEL_LENGTH = 80
+DEFAULT_VIEWPORT = {"w": 1280, "h": 800}
+
+# Roles an agent acts on, by how often they are the point of a page.
+ROLE_WEIGHTS = {
+    "textbox": 1.0, "searchbox": 1.0, "combobox": 1.0, "button": 0.95,
+    "checkbox": 0.9, "radio": 0.9, "slider": 0.85, "spinbutton": 0.85,
+    "link": 0.8, "option": 0.7, "tab": 0.8, "menuitem": 0.8, "switch": 0.9,
+    "heading": 0.5, "img": 0.25,
+}
+OTHER_WEIGHT = 0.15
+
+_NTH = re.compile(r":nth-of-type\(\d+\)")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: about four characters per token for English and markup."""
+    return math.ceil(len(text) / 4)
+
+
+def label_of(element: dict) -> str:
+    return " ".join(
+        (element.get("ariaLabel") or element.get("text") or element.get("placeholder") or "").split()
+    )
+
+
+def score(element: dict, viewport: dict | None = None) -> float:
+    """Interactivity x viewport proximity x label quality, in (0, 1]."""
+    viewport = viewport or DEFAULT_VIEWPORT
+    interactive = ROLE_WEIGHTS.get(role_of(element) or "", OTHER_WEIGHT)
+    if element.get("tag") in ("input", "textarea", "select") or element.get("contenteditable"):
+        interactive = max(interactive, 0.9)
+
+    rect = element.get("rect") or {}
+    if not rect.get("w") or not rect.get("h"):
+        proximity = 0.3
+    else:
+        top, bottom = rect.get("y", 0), rect.get("y", 0) + rect["h"]
+        left, right = rect.get("x", 0), rect.get("x", 0) + rect["w"]
+        off_y = max(0, top - viewport["h"], -bottom)
+        off_x = max(0, left - viewport["w"], -right)
+        # One screen away halves the score.
+        proximity = 1 / (1 + off_y / viewport["h"] + off_x / viewport["w"])
+
+    label = label_of(element)
+    if not label:
+        quality = 0.3
+    elif len(label) > LABEL_LENGTH:
+        quality = 0.7
+    else:
+        quality = 1.0
+    return interactive * proximity * quality
+
+
+def line_for(element: dict) -> str:
+    """One-line rendering: ref, role (or tag), label and the state worth acting on."""
+    parts = [element["ref"], role_of(element) or element.get("tag", "?")]
+    label = label_of(element)
+    if len(label) > LABEL_LENGTH:
+        label = label[:LABEL_LENGTH - 1] + "…"
+    if label:
+        parts.append(json.dumps(label, ensure_ascii=False))
+    value = element.get("value")
+    if value and element.get("tag") in ("input", "textarea", "select") and value != label:
+        parts.append(f"value={json.dumps(value[:LABEL_LENGTH], ensure_ascii=False)}")
+    if not label and element.get("href"):
+        parts.append(f"href={json.dumps(element['href'], ensure_ascii=False)}")
+    return " ".join(parts)
+
+
+def _signature(element: dict) -> tuple:
+    """Elements with the same shape -- tag path with positions erased, and role -- are repeats."""
+    return _NTH.sub("", element.get("selector") or ""), role_of(element) or element.get("tag")
+
+
+def _entries(elements: list[dict], viewport: dict | None, collapse: bool = True) -> list[dict]:
+    """Elements, and summaries of collapsed repeats, in document order, each with a score and a line."""
+    summaries: dict[int, list[dict]] = {}  # first hidden member's index -> hidden members
+    hidden: set[int] = set()
+    if collapse:
+        groups: dict[tuple, list[int]] = {}
+        for i, element in enumerate(elements):
+            groups.setdefault(_signature(element), []).append(i)
+        for members in groups.values():
+            # Hiding a single element would not save a line.
+            if len(members) > COLLAPSE_AFTER + 1:
+                tail = members[COLLAPSE_AFTER:]
+                summaries[tail[0]] = [elements[i] for i in tail]
+                hidden.update(tail)
+
+    entries = []
+    for i, element in enumerate(elements):
+        if i in summaries:
+            rest = summaries[i]
+            kind = role_of(rest[0]) or rest[0].get("tag", "element")
+            like = label_of(rest[0])[:40]
+            line = f"… {len(rest)} more {kind}" + (f" like {json.dumps(like, ensure_ascii=False)}" if like else "")
+            line += f" ({rest[0]['ref']} … {rest[-1]['ref']})"
+            entries.append({"score": max(score(e, viewport) for e in rest) * 0.9, "line": line, "count": len(rest)})
+        elif i not in hidden:
+            entries.append({"score": score(element, viewport), "line": line_for(element), "element": element, "count": 1})
+    return entries
+
+
+def select(
+    elements: list[dict],
+    budget_tokens: int | None,
+    viewport: dict | None = None,
+    cost=lambda entry: estimate_tokens(entry["line"]) + 1,
+    reserve: int = 0,
+    collapse: bool = True,
+) -> tuple[list[dict], int]:
+    """The best-ranked entries that fit the budget, in document order, and how many elements were left out."""
+    entries = _entries(elements, viewport, collapse)
+    if budget_tokens is not None:
+        remaining = budget_tokens - reserve
+        keep = set()
+        for i in sorted(range(len(entries)), key=lambda i: -entries[i]["score"]):
+            c = cost(entries[i])
+            if c <= remaining:
+                keep.add(i)
+                remaining -= c
+        entries = [e for i, e in enumerate(entries) if i in keep]
+    return entries, len(elements) - sum(e["count"] for e in entries)
+
+
+def render_text(snapshot: dict, budget_tokens: int | None = None) -> str:
+    """The snapshot as compact text lines, within ``budget_tokens`` if given."""
+    header = f"# {snapshot.get('title') or ''} {snapshot.get('url') or ''}".rstrip()
+    footer = "# {} more elements not shown; use find or a larger budget"
+    reserve = estimate_tokens(header) + 1 + estimate_tokens(footer.format(99999)) + 1
+    chosen, omitted = select(snapshot.get("elements", []), budget_tokens, snapshot.get("viewport"), reserve=reserve)
+    lines = [header] + [entry["line"] for entry in chosen]
+    if omitted:
+        lines.append(footer.format(omitted))
+    return "\n".join(lines)
+
+
+def compact_json(data) -> str:
+    """The serialization ``trim_json`` budgets for; print budgeted output with it."""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def trim_json(snapshot: dict, budget_tokens: int) -> dict:
+    """The snapshot with only the best-ranked elements whose compact JSON fits the budget."""
+    base = {k: v for k, v in snapshot.items() if k != "elements"}
+    reserve = estimate_tokens(compact_json({**base, "elements": [], "omitted": 99999})) + 1
+    chosen, omitted = select(
+        snapshot.get("elements", []),
+        budget_tokens,
+        snapshot.get("viewport"),
+        cost=lambda entry: estimate_tokens(compact_json(entry["element"])) + 1,
+        reserve=reserve,
+        collapse=False,
+    )
+    return {**base, "elements": [entry["element"] for entry in chosen], "omitted": omitted}
@@ -1,6 +1,10 @@
 """Tests for Chrome discovery and launcher."""
 
+import json
+import os
+import subprocess
 import sys
+import time
 from pathlib import Path
 from unittest.mock import patch
 
@@ -25,3 +29,75 @@ class TestFindChrome:
     def test_profile_dir_is_under_home(self):
         assert str(Path.home()) in str(PROFILE_DIR)
         assert ".browser-relay" in str(PROFILE_DIR)
+
+
+class TestEphemeralProfiles:
+    def test_template_from_profile_skips_caches_and_marks_clean_exit(self, tmp_path):
+        from browser_relay.chrome import prepare_template
+
+        source = tmp_path / "used"
+        (source / "Default" / "Cache").mkdir(parents=True)
+        (source / "Default" / "Cache" / "data_0").write_bytes(b"x" * 100)
+        (source / "Default" / "Preferences").write_text(json.dumps({"profile": {"exit_type": "Crashed"}}))
+        (source / "Default" / "Cookies").write_bytes(b"cookies")
+        (source / "SingletonLock").symlink_to("host-123")
+
+        template = prepare_template(source, tmp_path / "template")
+        assert (template / "Default" / "Cookies").read_bytes() == b"cookies"
+        assert not (template / "Default" / "Cache").exists()
+        assert not (template / "SingletonLock").is_symlink()
+        prefs = json.loads((template / "Default" / "Preferences").read_text())
+        assert prefs["profile"]["exit_type"] == "Normal"
+
+    def test_profile_is_cloned_and_removed(self, tmp_path):
+        from browser_relay.chrome import EphemeralProfile, prepare_template
+
+        template = prepare_template(template_dir=tmp_path / "template")
+        profile = EphemeralProfile(template, root=tmp_path / "ram")
+        assert profile.path.parent == tmp_path / "ram"
+        assert (profile.path / "Default" / "Preferences").exists()
+        profile.cleanup()
+        assert not profile.path.exists()
+
+    def test_stale_profiles_of_dead_processes_are_removed(self, tmp_path):
+        from browser_relay.chrome import EPHEMERAL_PREFIX, remove_stale_profiles
+
+        dead = subprocess.Popen([sys.executable, "-c", "pass"])
+        dead.wait()
+        stale = tmp_path / f"{EPHEMERAL_PREFIX}{dead.pid}-abc"
+        live = tmp_path / f"{EPHEMERAL_PREFIX}{os.getpid()}-def"
+        stale.mkdir()
+        live.mkdir()
+        assert remove_stale_profiles(tmp_path) == [stale]
+        assert live.exists()
+
+    def test_launch_uses_ram_profile_with_cache_cap_and_cleans_up(self, tmp_path, monkeypatch):
+        from browser_relay import chrome
+
+        monkeypatch.setenv("BROWSER_RELAY_EPHEMERAL_DIR", str(tmp_path / "ram"))
+        monkeypatch.setattr(chrome, "TEMPLATE_DIR", tmp_path / "template")
+        (tmp_path / "ram").mkdir()
+        launched = []
+
+        class FakePopen:
+            def __init__(self, args, **kwargs):
+                launched.append(args)
+
+            def wait(self, timeout=None):
+                return 0
+
+            def poll(self):
+                return 0
+
+        monkeypatch.setattr(chrome.subprocess, "Popen", FakePopen)
+        monkeypatch.setattr(chrome.atexit, "register", lambda *a: None)
+        chrome.launch_chrome(tmp_path / "ext", chrome_path=Path("/bin/chrome"), ephemeral=True)
+        [args] = launched
+        user_data = next(a for a in args if a.startswith("--user-data-dir="))
+        assert user_data.startswith(f"--user-data-dir={tmp_path / 'ram'}")
+        assert f"--disk-cache-size={64 * 1024 * 1024}" in args
+        for _ in range(100):
+            if not list((tmp_path / "ram").iterdir()):
+                break
+            time.sleep(0.01)
+        assert list((tmp_path / "ram").iterdir()) == []
@@ -1,6 +1,8 @@
 """Tests for the CLI app (Typer commands)."""
 
 import base64
+import gzip
+import json
 import shutil
 from pathlib import Path
 from unittest.mock import patch
@@ -9,10 +11,19 @@ import pytest
 from typer.testing import CliRunner
 
 from browser_relay.cli.app import INSTALL_DIR, app
+from browser_relay.snapshot_text import estimate_tokens
 
 runner = CliRunner()
 
 
+@pytest.fixture(autouse=True)
+def no_local_socket(tmp_path, monkeypatch):
+    """Keep tests off a relay socket, snapshot index and saved state that may exist on this machine."""
+    monkeypatch.setattr("browser_relay.cli.app.SOCKET_PATH", tmp_path / "absent.sock")
+    monkeypatch.setattr("browser_relay.cli.app.SNAPSHOT_DIR", tmp_path / "snapshots")
+    monkeypatch.setattr("browser_relay.cli.app.STATE_DIR", tmp_path / "state")
+
+
 class TestInstall:
     def test_install_copies_files(self, tmp_path):
         target = tmp_path / "ext"
@@ -77,3 +88,574 @@ class TestRichCommands:
             result = runner.invoke(app, ["screenshot", str(out_file)])
         assert result.exit_code == 0
         assert out_file.read_bytes() == b"png-bytes"
+
+
+class TestBackpressure:
+    def test_send_command_retries_on_429(self, httpx_mock, monkeypatch):
+        from browser_relay.cli import app as cli
+
+        monkeypatch.setattr(cli.time, "sleep", lambda _s: None)
+        httpx_mock.add_response(method="POST", url=f"{cli.RELAY_URL}/command", status_code=429, headers={"Retry-After": "1"})
+        httpx_mock.add_response(method="POST", url=f"{cli.RELAY_URL}/command", json={"id": "c1", "queued": True})
+        httpx_mock.add_response(method="GET", json={"id": "c1", "ok": True})
+        assert cli._send_command("ping") == {"id": "c1", "ok": True}
+
+    def test_priority_option_is_sent(self, httpx_mock, monkeypatch):
+        from browser_relay.cli import app as cli
+
+        monkeypatch.setitem(cli._options, "priority", "normal")
+        httpx_mock.add_response(method="POST", url=f"{cli.RELAY_URL}/command", json={"id": "c1", "queued": True})
+        httpx_mock.add_response(method="GET", json={"id": "c1", "ok": True})
+        result = runner.invoke(app, ["--priority", "background", "ping"])
+        assert result.exit_code == 0
+        sent = json.loads(httpx_mock.get_requests(method="POST")[0].content)
+        assert sent["priority"] == "background"
+
+    def test_unknown_priority_rejected(self):
+        result = runner.invoke(app, ["--priority", "urgent", "ping"])
+        assert result.exit_code != 0
+
+
+class TestFederation:
+    def test_browser_option_is_sent(self, httpx_mock, monkeypatch):
+        from browser_relay.cli import app as cli
+
+        monkeypatch.setitem(cli._options, "browser", None)
+        httpx_mock.add_response(method="POST", url=f"{cli.RELAY_URL}/command", json={"id": "c1", "queued": True})
+        httpx_mock.add_response(method="GET", json={"id": "c1", "ok": True})
+        result = runner.invoke(app, ["--browser", "laptop", "ping"])
+        assert result.exit_code == 0
+        sent = json.loads(httpx_mock.get_requests(method="POST")[0].content)
+        assert sent["browser"] == "laptop"
+
+    def test_each_invocation_is_its_own_client(self, httpx_mock):
+        from browser_relay.cli import app as cli
+
+        for _ in range(2):
+            httpx_mock.add_response(method="POST", url=f"{cli.RELAY_URL}/command", json={"id": "c1", "queued": True})
+            httpx_mock.add_response(method="GET", json={"id": "c1", "ok": True})
+            assert runner.invoke(app, ["ping"]).exit_code == 0
+        ids = [r.headers["X-Relay-Client"] for r in httpx_mock.get_requests(method="POST")]
+        assert len(ids) == 2 and all(ids) and ids[0] != ids[1]
+
+    def test_browsers_lists_local_and_remote(self, httpx_mock):
+        from browser_relay.cli import app as cli
+
+        httpx_mock.add_response(
+            url=f"{cli.RELAY_URL}/federation/browsers",
+            json={"browsers": [
+                {"browser": "near", "relay_id": "a", "local": True},
+                {"browser": "far", "relay_id": "b", "relay_url": "http://10.0.0.2:18321", "local": False},
+            ]},
+        )
+        result = runner.invoke(app, ["browsers"])
+        assert result.exit_code == 0
+        assert "near\tlocal" in result.output
+        assert "far\thttp://10.0.0.2:18321" in result.output
+
+    def test_refuses_remote_federation_without_token(self, monkeypatch):
+        from browser_relay.cli import app as cli
+
+        monkeypatch.delenv("BROWSER_RELAY_FEDERATION_TOKEN", raising=False)
+        with patch.object(cli, "_run_relay") as run_relay:
+            result = runner.invoke(app, ["server", "--host", "0.0.0.0", "--peer", "http://10.0.0.2:18321"])
+        assert result.exit_code == 1
+        assert "without a token" in result.output
+        run_relay.assert_not_called()
+
+    def test_default_socket_follows_the_port(self):
+        from browser_relay.cli import app as cli
+
+        with patch.object(cli, "_run_relay") as run_relay:
+            result = runner.invoke(app, ["server", "--port", "18400"])
+        assert result.exit_code == 0
+        assert run_relay.call_args.kwargs["socket_path"].name == "relay-18400.sock"
+
+    def test_start_socket_follows_the_port(self):
+        from browser_relay.cli import app as cli
+
+        with (
+            patch.object(cli.threading, "Thread") as thread,
+            patch.object(cli, "_install_extension"),
+            patch.object(cli, "_wait_for_extension", return_value=True),
+            patch("browser_relay.chrome.find_chrome_for_testing", return_value="/opt/chrome"),
+            patch("browser_relay.chrome.launch_chrome"),
+            patch.object(cli.time, "sleep"),
+        ):
+            result = runner.invoke(app, ["start", "--port", "18400"])
+        assert result.exit_code == 0
+        assert thread.call_args.kwargs["kwargs"]["socket_path"].name == "relay-18400.sock"
+
+    def test_token_is_passed_to_the_relay(self, monkeypatch):
+        from browser_relay.cli import app as cli
+
+        monkeypatch.setenv("BROWSER_RELAY_FEDERATION_TOKEN", "s3cret")
+        with patch.object(cli, "_run_relay") as run_relay:
+            result = runner.invoke(app, ["server", "--host", "0.0.0.0", "--peer", "http://10.0.0.2:18321"])
+        assert result.exit_code == 0
+        assert run_relay.call_args.kwargs["federation_token"] == "s3cret"
+
+
+class TestCancellation:
+    def test_timed_out_command_is_cancelled(self, httpx_mock):
+        from browser_relay.cli import app as cli
+
+        httpx_mock.add_response(method="POST", url=f"{cli.RELAY_URL}/command", json={"id": "c1", "queued": True})
+        httpx_mock.add_response(method="GET", status_code=504, json={"ok": False, "error": "Timeout waiting for result"})
+        httpx_mock.add_response(method="DELETE", url=f"{cli.RELAY_URL}/command/c1", json={"cancelled": True})
+        result = cli._send_command("wait", {"ms": 100}, timeout=1.0)
+        assert result["ok"] is False
+        assert len(httpx_mock.get_requests(method="DELETE")) == 1
+
+    def test_command_carries_timeout(self, httpx_mock):
+        from browser_relay.cli import app as cli
+
+        httpx_mock.add_response(method="POST", url=f"{cli.RELAY_URL}/command", json={"id": "c1", "queued": True})
+        httpx_mock.add_response(method="GET", json={"id": "c1", "ok": True})
+        cli._send_command("ping", timeout=7.0)
+        sent = json.loads(httpx_mock.get_requests(method="POST")[0].content)
+        assert sent["timeout"] == 7.0
+
+
+class TestStreamedResults:
+    def test_get_html_streams_to_file(self, httpx_mock, tmp_path):
+        from browser_relay.cli import app as cli
+
+        html = "<p>" + "x" * 5000 + "</p>"
+        httpx_mock.add_response(url=f"{cli.RELAY_URL}/result/c1/stream", content=html.encode())
+        out = tmp_path / "page.html"
+        streamed = {"id": "c1", "ok": True, "stream": {"field": "html", "chunks": 1, "format": "text"}}
+        with patch("browser_relay.cli.app._send_command", return_value=streamed):
+            result = runner.invoke(app, ["get-html", "body", "--output", str(out)])
+        assert result.exit_code == 0
+        assert out.read_text() == html
+
+    def test_get_html_max_bytes_caps_stream(self, httpx_mock):
+        from browser_relay.cli import app as cli
+
+        httpx_mock.add_response(url=f"{cli.RELAY_URL}/result/c1/stream", content=b"0123456789")
+        streamed = {"id": "c1", "ok": True, "stream": {"field": "html", "chunks": 1, "format": "text"}}
+        with patch("browser_relay.cli.app._send_command", return_value=streamed) as mocked_send:
+            result = runner.invoke(app, ["get-html", "body", "--max-bytes", "4", "--raw"])
+        assert result.exit_code == 0
+        assert result.stdout == "0123"
+        assert mocked_send.call_args.args[1]["max_bytes"] == 4
+
+    def test_streamed_get_html_prints_json_like_a_small_one(self, httpx_mock):
+        from browser_relay.cli import app as cli
+
+        httpx_mock.add_response(url=f"{cli.RELAY_URL}/result/c1/stream", content=b"<p>big</p>")
+        streamed = {"id": "c1", "ok": True, "stream": {"field": "html", "chunks": 1, "format": "text"}}
+        with patch("browser_relay.cli.app._send_command", return_value=streamed):
+            result = runner.invoke(app, ["get-html", "body"])
+        assert json.loads(result.stdout) == {"id": "c1", "html": "<p>big</p>"}
+
+    def test_max_bytes_never_splits_a_character(self, httpx_mock):
+        from browser_relay.cli import app as cli
+
+        # "é" is two bytes and "€" three, so five bytes would end inside the "€".
+        httpx_mock.add_response(url=f"{cli.RELAY_URL}/result/c1/stream", content="aé€".encode())
+        streamed = {"id": "c1", "ok": True, "stream": {"field": "html", "chunks": 1, "format": "text"}}
+        with patch("browser_relay.cli.app._send_command", return_value=streamed):
+            result = runner.invoke(app, ["get-html", "body", "--max-bytes", "5", "--raw"])
+        assert result.stdout_bytes == "aé".encode()
+        with patch("browser_relay.cli.app._send_command", return_value={"ok": True, "html": "aé€"}):
+            result = runner.invoke(app, ["get-html", "body", "--max-bytes", "2"])
+        assert json.loads(result.stdout) == {"html": "a"}
+
+    def test_utf8_limit_across_chunks(self):
+        from browser_relay.cli.app import _limit_utf8
+
+        euro = "€".encode()
+        chunks = [b"a" + euro[:1], euro[1:] + b"b"]
+        assert b"".join(_limit_utf8(iter(chunks), 3)) == b"a"
+        assert b"".join(_limit_utf8(iter(chunks), 4)) == b"a" + euro
+        assert b"".join(_limit_utf8(iter(chunks), None)) == b"a" + euro + b"b"
+
+    def test_small_get_html_written_to_file(self, tmp_path):
+        out = tmp_path / "frag.html"
+        with patch("browser_relay.cli.app._send_command", return_value={"id": "c1", "ok": True, "html": "<b>hi</b>"}):
+            result = runner.invoke(app, ["get-html", "#x", "-o", str(out)])
+        assert result.exit_code == 0
+        assert out.read_text() == "<b>hi</b>"
+
+    def test_small_get_html_still_prints_json(self):
+        with patch("browser_relay.cli.app._send_command", return_value={"ok": True, "html": "<b>hi</b>"}):
+            result = runner.invoke(app, ["get-html", "#x"])
+        assert json.loads(result.stdout) == {"html": "<b>hi</b>"}
+
+
+class TestExtract:
+    SCHEMA = '{"rows": "tr", "fields": {"name": "td"}}'
+
+    def test_ndjson_pages_through_results(self):
+        pages = [
+            {"ok": True, "count": 2, "next_offset": 2, "rows": [{"name": "a"}, {"name": "b"}]},
+            {"ok": True, "count": 1, "next_offset": None, "rows": [{"name": "c"}]},
+        ]
+        with patch("browser_relay.cli.app._send_command", side_effect=pages) as mocked_send:
+            result = runner.invoke(app, ["extract", self.SCHEMA, "--page-size", "2"])
+        assert result.exit_code == 0
+        assert [json.loads(line) for line in result.stdout.splitlines()] == [{"name": "a"}, {"name": "b"}, {"name": "c"}]
+        offsets = [call.args[1]["offset"] for call in mocked_send.call_args_list]
+        assert offsets == [0, 2]
+
+    def test_columnar_merges_pages(self):
+        pages = [
+            {"ok": True, "count": 1, "next_offset": 1, "columns": {"name": ["a"]}},
+            {"ok": True, "count": 1, "next_offset": None, "columns": {"name": ["b"]}},
+        ]
+        with patch("browser_relay.cli.app._send_command", side_effect=pages):
+            result = runner.invoke(app, ["extract", self.SCHEMA, "--format", "columnar", "--page-size", "1"])
+        assert json.loads(result.stdout) == {"count": 2, "columns": {"name": ["a", "b"]}}
+
+    def test_max_rows_limits_request(self):
+        page = {"ok": True, "count": 3, "next_offset": 3, "rows": [{}, {}, {}]}
+        with patch("browser_relay.cli.app._send_command", return_value=page) as mocked_send:
+            result = runner.invoke(app, ["extract", self.SCHEMA, "--max-rows", "3"])
+        assert result.exit_code == 0
+        mocked_send.assert_called_once()
+        assert mocked_send.call_args.args[1]["limit"] == 3
+
+    def test_schema_from_file(self, tmp_path):
+        schema_file = tmp_path / "schema.json"
+        schema_file.write_text(self.SCHEMA)
+        page = {"ok": True, "count": 0, "next_offset": None, "rows": []}
+        with patch("browser_relay.cli.app._send_command", return_value=page) as mocked_send:
+            result = runner.invoke(app, ["extract", str(schema_file)])
+        assert result.exit_code == 0
+        assert mocked_send.call_args.args[1]["schema"]["rows"] == "tr"
+
+    def test_invalid_schema_rejected(self):
+        result = runner.invoke(app, ["extract", '{"fields": {}}'])
+        assert result.exit_code != 0
+
+
+class TestCrawl:
+    def _fake_browser(self, fail=(), broken=()):
+        next_tab = iter(range(100, 200))
+
+        def send(action, params=None, timeout=30.0, quiet=False):
+            if action == "new_tab":
+                return {"ok": True, "tab": {"id": next(next_tab)}}
+            if action == "navigate":
+                if params["url"] in fail:
+                    return {"ok": False, "error": "Navigation timeout"}
+                if params["url"] in broken:
+                    raise ValueError("Malformed result")
+                return {"ok": True, "url": params["url"]}
+            if action == "extract":
+                return {"ok": True, "count": 1, "next_offset": None, "rows": [{"tab": params["tab_id"]}]}
+            return {"ok": True}
+        return send
+
+    def test_streams_one_line_per_url(self, tmp_path):
+        urls = tmp_path / "urls.txt"
+        urls.write_text("https://a.test\nhttps://b.test\n\nhttps://c.test\n")
+        with patch("browser_relay.cli.app._send_command", side_effect=self._fake_browser()) as mocked_send:
+            result = runner.invoke(app, ["crawl", str(urls), "-c", "2", "--extract", '{"rows": "tr"}'])
+        assert result.exit_code == 0
+        records = [json.loads(line) for line in result.stdout.splitlines()]
+        assert sorted(r["url"] for r in records) == ["https://a.test", "https://b.test", "https://c.test"]
+        assert all(r["ok"] and r["rows"][0]["tab"] in (100, 101) for r in records)
+        actions = [call.args[0] for call in mocked_send.call_args_list]
+        assert actions.count("new_tab") == 2
+        assert actions.count("close_tab") == 2
+
+    def test_checkpoint_skips_finished_urls(self, tmp_path):
+        urls = tmp_path / "urls.txt"
+        urls.write_text("https://a.test\nhttps://b.test\nhttps://c.test\n")
+        checkpoint = tmp_path / "done.txt"
+        checkpoint.write_text("https://a.test\n")
+        out = tmp_path / "out.jsonl"
+        with patch("browser_relay.cli.app._send_command", side_effect=self._fake_browser(fail={"https://c.test"})):
+            result = runner.invoke(app, ["crawl", str(urls), "--extract", '{"rows": "tr"}', "--checkpoint", str(checkpoint), "-o", str(out)])
+        assert result.exit_code == 0
+        records = [json.loads(line) for line in out.read_text().splitlines()]
+        assert {r["url"] for r in records} == {"https://b.test", "https://c.test"}
+        assert checkpoint.read_text().splitlines() == ["https://a.test", "https://b.test"]
+
+    def test_unexpected_error_fails_only_its_url(self, tmp_path):
+        urls = tmp_path / "urls.txt"
+        urls.write_text("https://a.test\nhttps://b.test\nhttps://c.test\n")
+        fake = self._fake_browser(broken={"https://a.test"})
+        with patch("browser_relay.cli.app._send_command", side_effect=fake):
+            result = runner.invoke(app, ["crawl", str(urls), "-c", "1", "--extract", '{"rows": "tr"}'])
+        assert result.exit_code == 0
+        records = {r["url"]: r for r in map(json.loads, result.stdout.splitlines())}
+        assert records["https://a.test"] == {"url": "https://a.test", "ok": False, "error": "Malformed result"}
+        assert records["https://b.test"]["ok"] and records["https://c.test"]["ok"]
+
+    def test_nothing_left_to_crawl(self, tmp_path):
+        urls = tmp_path / "urls.txt"
+        urls.write_text("https://a.test\n")
+        checkpoint = tmp_path / "done.txt"
+        checkpoint.write_text("https://a.test\n")
+        with patch("browser_relay.cli.app._send_command") as mocked_send:
+            result = runner.invoke(app, ["crawl", str(urls), "--checkpoint", str(checkpoint)])
+        assert result.exit_code == 0
+        mocked_send.assert_not_called()
+
+
+class TestScripts:
+    def test_register_uploads_source(self, tmp_path):
+        js = tmp_path / "rows.js"
+        js.write_text("return document.querySelectorAll(args.sel).length;")
+        with patch("browser_relay.cli.app._send_command", return_value={"ok": True}) as mocked_send:
+            result = runner.invoke(app, ["script", "register", "rows", str(js)])
+        assert result.exit_code == 0
+        mocked_send.assert_called_once_with(
+            "register_script", {"name": "rows", "source": "return document.querySelectorAll(args.sel).length;"}
+        )
+
+    def test_evaluate_by_handle_sends_args_not_source(self):
+        with patch("browser_relay.cli.app._send_command", return_value={"ok": True, "result": 3}) as mocked_send:
+            result = runner.invoke(app, ["evaluate", "--script", "rows", "--args", '{"sel": "tr"}'])
+        assert result.exit_code == 0
+        mocked_send.assert_called_once_with("evaluate", {"script": "rows", "args": {"sel": "tr"}})
+        assert json.loads(result.stdout) == {"result": 3}
+
+    def test_evaluate_needs_expression_or_script(self):
+        assert runner.invoke(app, ["evaluate"]).exit_code != 0
+        assert runner.invoke(app, ["evaluate", "1", "--script", "rows"]).exit_code != 0
+
+    def test_evaluate_rejects_bad_args(self):
+        result = runner.invoke(app, ["evaluate", "args.x", "--args", "{nope"])
+        assert result.exit_code != 0
+
+
+class TestTypeModes:
+    def test_default_mode_is_keys(self):
+        with patch("browser_relay.cli.app._send_command", return_value={"ok": True}) as mocked_send:
+            result = runner.invoke(app, ["type-text", "#q", "hello"])
+        assert result.exit_code == 0
+        mocked_send.assert_called_once_with("type", {"selector": "#q", "text": "hello", "clear": False, "mode": "keys"})
+
+    def test_fast_mode(self):
+        with patch("browser_relay.cli.app._send_command", return_value={"ok": True}) as mocked_send:
+            runner.invoke(app, ["type-text", "e4", "x" * 5000, "--mode", "fast"])
+        assert mocked_send.call_args.args[1]["mode"] == "fast"
+
+    def test_human_mode_paces_in_page_with_longer_timeout(self):
+        with patch("browser_relay.cli.app._send_command", return_value={"ok": True}) as mocked_send:
+            runner.invoke(app, ["type-text", "e4", "a" * 100, "--mode", "human", "--delay-ms", "200", "--jitter-ms", "50"])
+        mocked_send.assert_called_once()
+        params = mocked_send.call_args.args[1]
+        assert params["delay_ms"] == 200 and params["jitter_ms"] == 50
+        assert mocked_send.call_args.kwargs["timeout"] == 100 * 0.25 + 30.0
+
+    def test_unknown_mode_rejected(self):
+        assert runner.invoke(app, ["type-text", "e4", "x", "--mode", "turbo"]).exit_code != 0
+
+
+class TestBlock:
+    def test_types_and_domains_file(self, tmp_path):
+        domains = tmp_path / "list.txt"
+        domains.write_text("# trackers\nads.example.com\n*.Tracker.net  # wildcard\n\n")
+        with patch("browser_relay.cli.app._send_command", return_value={"ok": True}) as mocked_send:
+            result = runner.invoke(app, ["block", "--types", "image,font,media", "--domains", str(domains)])
+        assert result.exit_code == 0
+        mocked_send.assert_called_once_with(
+            "block", {"types": ["image", "font", "media"], "domains": ["ads.example.com", "tracker.net"]}
+        )
+
+    def test_unknown_type_rejected(self):
+        with patch("browser_relay.cli.app._send_command") as mocked_send:
+            result = runner.invoke(app, ["block", "--types", "main_frame"])
+        assert result.exit_code != 0
+        mocked_send.assert_not_called()
+
+    def test_clear_sends_empty_rules(self):
+        with patch("browser_relay.cli.app._send_command", return_value={"ok": True}) as mocked_send:
+            runner.invoke(app, ["block", "--clear"])
+        mocked_send.assert_called_once_with("block", {"types": [], "domains": []})
+
+    def test_stats(self):
+        with patch("browser_relay.cli.app._send_command", return_value={"ok": True, "blocked": 12}) as mocked_send:
+            result = runner.invoke(app, ["block", "--stats"])
+        mocked_send.assert_called_once_with("block_stats")
+        assert '"blocked": 12' in result.output
+
+    def test_navigate_overrides(self):
+        with patch("browser_relay.cli.app._send_command", return_value={"ok": True}) as mocked_send:
+            runner.invoke(app, ["navigate", "https://example.com", "--block", "image"])
+            runner.invoke(app, ["navigate", "https://example.com", "--no-block"])
+            runner.invoke(app, ["navigate", "https://example.com"])
+        overrides = [call.args[1].get("block", "global") for call in mocked_send.call_args_list]
+        assert overrides == [{"types": ["image"]}, False, "global"]
+
+
+class TestState:
+    EXPORT = {
+        "ok": True,
+        "origins": ["https://example.com"],
+        "cookies": [{"name": "sid", "value": "abc", "domain": "example.com", "path": "/", "secure": True, "hostOnly": True}],
+        "storage": {"https://example.com": {"local": {"theme": "dark"}, "session": {"step": "2"}}},
+    }
+
+    def test_save_writes_private_compressed_file(self, tmp_path):
+        with patch("browser_relay.cli.app._send_command", return_value=self.EXPORT) as mocked_send:
+            result = runner.invoke(app, ["state", "save", "work", "--origin", "https://example.com/login"])
+        assert result.exit_code == 0, result.output
+        mocked_send.assert_called_once_with("state_export", {"origins": ["https://example.com/login"]}, timeout=60.0)
+        path = tmp_path / "state" / "work.json.gz"
+        assert path.stat().st_mode & 0o777 == 0o600
+        state = json.loads(gzip.decompress(path.read_bytes()))
+        assert state["version"] == 1
+        assert state["cookies"] == self.EXPORT["cookies"]
+        assert "1 cookies and 2 storage keys" in result.output
+
+    def test_load_applies_saved_state(self):
+        with patch("browser_relay.cli.app._send_command", return_value=self.EXPORT):
+            runner.invoke(app, ["state", "save", "work"])
+        imported = {"ok": True, "cookies": 1, "failed_cookies": [], "origins": 1}
+        with patch("browser_relay.cli.app._send_command", return_value=imported) as mocked_send:
+            result = runner.invoke(app, ["state", "load", "work", "--tab-id", "7"])
+        assert result.exit_code == 0, result.output
+        action, params = mocked_send.call_args.args
+        assert action == "state_import"
+        assert params == {"cookies": self.EXPORT["cookies"], "storage": self.EXPORT["storage"], "tab_id": 7}
+
+    def test_load_warns_about_redirected_origins(self):
+        with patch("browser_relay.cli.app._send_command", return_value=self.EXPORT):
+            runner.invoke(app, ["state", "save", "work"])
+        imported = {"ok": True, "cookies": 1, "failed_cookies": [], "origins": 0, "failed_origins": ["https://example.com"]}
+        with patch("browser_relay.cli.app._send_command", return_value=imported):
+            result = runner.invoke(app, ["state", "load", "work"])
+        assert result.exit_code == 0
+        assert "Could not write storage for https://example.com" in result.output
+
+    def test_load_path(self, tmp_path):
+        path = tmp_path / "elsewhere" / "s.json.gz"
+        with patch("browser_relay.cli.app._send_command", return_value=self.EXPORT):
+            runner.invoke(app, ["state", "save", str(path)])
+        assert path.exists()
+        with patch("browser_relay.cli.app._send_command", return_value={"ok": True, "cookies": 1, "origins": 1}):
+            result = runner.invoke(app, ["state", "load", str(path)])
+        assert result.exit_code == 0
+
+    def test_load_missing(self):
+        with patch("browser_relay.cli.app._send_command") as mocked_send:
+            result = runner.invoke(app, ["state", "load", "nope"])
+        assert result.exit_code == 1
+        mocked_send.assert_not_called()
+
+    def test_list(self):
+        with patch("browser_relay.cli.app._send_command", return_value=self.EXPORT):
+            runner.invoke(app, ["state", "save", "a"])
+            runner.invoke(app, ["state", "save", "b"])
+        result = runner.invoke(app, ["state", "list"])
+        assert [line.split("\t")[0] for line in result.output.splitlines()] == ["a", "b"]
+
+
+class TestEvents:
+    def test_prints_json_lines_and_warns_on_gap(self, httpx_mock):
+        from browser_relay.cli import app as cli
+
+        body = (
+            ': ok\n\nevent: gap\ndata: {"missed":3}\n\n'
+            'id: 4\nevent: console\ndata: {"id":4,"type":"console","tab_id":2,"text":"hi"}\n\n'
+        )
+        httpx_mock.add_response(
+            url=f"{cli.RELAY_URL}/events?follow=0&tab_id=2&type=console%2Cdialog",
+            text=body,
+            headers={"Content-Type": "text/event-stream"},
+        )
+        result = runner.invoke(app, ["events", "--tab-id", "2", "--type", "console,dialog"])
+        assert result.exit_code == 0
+        assert json.loads(result.stdout.strip()) == {"id": 4, "type": "console", "tab_id": 2, "text": "hi"}
+        assert "Missed 3 events" in result.output
+
+    def test_unknown_type_rejected(self):
+        result = runner.invoke(app, ["events", "--type", "network"])
+        assert result.exit_code != 0
+
+
+class TestFind:
+    SNAPSHOT = {
+        "id": "s1",
+        "ok": True,
+        "tab_id": 3,
+        "url": "https://x.test/",
+        "elements": [
+            {"ref": "e0", "tag": "a", "text": "Sign in", "href": "https://x.test/login"},
+            {"ref": "e1", "tag": "button", "text": "Sign in"},
+        ],
+    }
+
+    def _snapshot(self, httpx_mock, seq=4):
+        from browser_relay.cli import app as cli
+
+        httpx_mock.add_response(url=f"{cli.RELAY_URL}/navigation", json={"seq": seq})
+        with patch("browser_relay.cli.app._send_command", return_value=dict(self.SNAPSHOT)):
+            assert runner.invoke(app, ["snapshot"]).exit_code == 0
+
+    def test_snapshot_then_find(self, httpx_mock):
+        from browser_relay.cli import app as cli
+
+        self._snapshot(httpx_mock)
+        httpx_mock.add_response(url=f"{cli.RELAY_URL}/navigation?tab_id=3", json={"seq": 4, "tab_seq": 2})
+        with patch("browser_relay.cli.app._send_command") as mocked_send:
+            result = runner.invoke(app, ["find", "sign in", "--role", "button"])
+        mocked_send.assert_not_called()
+        assert result.exit_code == 0
+        assert result.stdout == 'e1\tbutton\t"Sign in"\n'
+
+    def test_text_format_with_budget(self, httpx_mock):
+        from browser_relay.cli import app as cli
+
+        httpx_mock.add_response(url=f"{cli.RELAY_URL}/navigation", json={"seq": 1})
+        with patch("browser_relay.cli.app._send_command", return_value=dict(self.SNAPSHOT)) as mocked_send:
+            result = runner.invoke(app, ["snapshot", "--format", "text", "--budget-tokens", "100"])
+        assert result.exit_code == 0
+        assert mocked_send.call_args.args[1]["limit"] == 2000
+        assert result.output.splitlines()[1:] == ['e0 link "Sign in"', 'e1 button "Sign in"']
+
+    def test_json_output_fits_the_budget(self, httpx_mock):
+        from browser_relay.cli import app as cli
+
+        httpx_mock.add_response(url=f"{cli.RELAY_URL}/navigation", json={"seq": 1})
+        elements = [
+            {"ref": f"e{i}", "tag": "a", "text": f"Item number {i}", "href": f"https://x.test/{i}"}
+            for i in range(200)
+        ]
+        with patch("browser_relay.cli.app._send_command", return_value={**self.SNAPSHOT, "elements": elements}):
+            result = runner.invoke(app, ["snapshot", "--budget-tokens", "300"])
+        assert result.exit_code == 0
+        assert estimate_tokens(result.stdout) <= 300
+        printed = json.loads(result.stdout)
+        assert printed["omitted"] == 200 - len(printed["elements"]) > 0
+
+    def test_stale_after_navigation(self, httpx_mock):
+        from browser_relay.cli import app as cli
+
+        self._snapshot(httpx_mock)
+        httpx_mock.add_response(url=f"{cli.RELAY_URL}/navigation?tab_id=3", json={"seq": 5, "tab_seq": 5})
+        result = runner.invoke(app, ["find", "sign in"])
+        assert result.exit_code == 1
+        assert "navigated" in result.output
+
+    def test_navigating_forgets_the_snapshot(self, httpx_mock):
+        from browser_relay.cli import app as cli
+
+        self._snapshot(httpx_mock)
+        with patch("browser_relay.cli.app._send_command", return_value={"id": "n1", "ok": True, "tab_id": 3}):
+            assert runner.invoke(app, ["navigate", "https://x.test/next"]).exit_code == 0
+        assert cli.snapshot_index.SnapshotIndex(cli.SNAPSHOT_DIR).load(3) is None
+
+    def test_refresh_resnapshots(self, httpx_mock):
+        from browser_relay.cli import app as cli
+
+        httpx_mock.add_response(url=f"{cli.RELAY_URL}/navigation", json={"seq": 9})
+        with patch("browser_relay.cli.app._send_command", return_value=dict(self.SNAPSHOT)) as mocked_send:
+            result = runner.invoke(app, ["find", "sign in", "--tag", "a", "--refresh"])
+        assert mocked_send.call_args.args[0] == "snapshot"
+        assert result.stdout.startswith("e0\tlink")
+
+    def test_no_match(self, httpx_mock):
+        from browser_relay.cli import app as cli
+
+        self._snapshot(httpx_mock)
+        httpx_mock.add_response(url=f"{cli.RELAY_URL}/navigation?tab_id=3", json={"seq": 4, "tab_seq": 0})
+        assert runner.invoke(app, ["find", "checkout"]).exit_code == 1
+
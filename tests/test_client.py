@@ -0,0 +1,117 @@
+"""Tests for the Python client library and the relay's Unix-socket transport."""
+
+import socket
+import threading
+import time
+
+import pytest
+from werkzeug.serving import make_server
+
+from browser_relay.client import RelayClient, connect, iter_sse, retry_delay, socket_path_for
+from browser_relay.relay.server import create_app, serve_unix_socket
+from browser_relay.relay.simulator import SimulatedExtension
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix sockets")
+
+
+@pytest.fixture()
+def relay(tmp_path):
+    """One relay app served on both TCP (for the extension) and a Unix socket."""
+    flask_app = create_app()
+    tcp = make_server("127.0.0.1", 0, flask_app, threaded=True)
+    threading.Thread(target=tcp.serve_forever, args=(0.05,), daemon=True).start()
+    sock_path = tmp_path / "relay.sock"
+    uds = serve_unix_socket(flask_app, sock_path)
+    yield f"http://127.0.0.1:{tcp.server_port}", sock_path
+    uds.shutdown()
+    tcp.shutdown()
+
+
+def test_retry_delay_honours_retry_after():
+    assert retry_delay(0, "3") >= 3.0
+    assert 0 <= retry_delay(10, None) <= 8.0
+
+
+def test_iter_sse_parses_frames():
+    lines = [": ok", "", "id: 1", "event: load", "data: {\"a\":", "data: 1}", "", "data:x", ""]
+    assert list(iter_sse(lines)) == [("load", '{"a":\n1}'), ("message", "x")]
+
+
+def test_follow_events(relay):
+    url, sock_path = relay
+    with RelayClient(url, sock_path) as client, RelayClient(url, None) as extension:
+        stream = client.events(types=["console"])
+
+        def publish():
+            time.sleep(0.1)
+            extension._http.post("/events", json={"events": [{"type": "load"}, {"type": "console", "text": "hi"}]})
+
+        publisher = threading.Thread(target=publish)
+        publisher.start()
+        event = next(stream)
+        stream.close()
+        publisher.join()
+    assert event["text"] == "hi"
+    assert event["type"] == "console"
+
+
+def test_socket_is_owner_only(relay):
+    _, sock_path = relay
+    assert sock_path.stat().st_mode & 0o777 == 0o600
+
+
+def test_uses_socket_when_present(relay):
+    _, sock_path = relay
+    with RelayClient("http://127.0.0.1:1", sock_path) as client:
+        assert client.transport == "unix"
+        assert client.status()["server"] == "ok"
+
+
+def test_falls_back_to_tcp(relay, tmp_path):
+    url, _ = relay
+    with RelayClient(url, tmp_path / "absent.sock") as client:
+        assert client.transport == "tcp"
+        assert client.status()["server"] == "ok"
+
+
+def test_stale_socket_falls_back_to_tcp(relay, tmp_path):
+    url, _ = relay
+    stale = tmp_path / "stale.sock"
+    leftover = socket.socket(socket.AF_UNIX)
+    leftover.bind(str(stale))
+    leftover.close()
+    with RelayClient(url, stale) as client:
+        assert client.status()["server"] == "ok"
+        assert client.transport == "tcp"
+
+
+def test_socket_is_removed_on_close(tmp_path):
+    sock_path = tmp_path / "relay.sock"
+    uds = serve_unix_socket(create_app(), sock_path)
+    assert sock_path.is_socket()
+    uds.shutdown()
+    uds.server_close()
+    assert not sock_path.exists()
+
+
+def test_default_socket_depends_on_port():
+    assert socket_path_for(18321) != socket_path_for(18322)
+    assert socket_path_for(18322).name == "relay-18322.sock"
+
+
+def test_run_over_socket(relay):
+    url, sock_path = relay
+    with SimulatedExtension(url, browser="b1"), RelayClient("http://127.0.0.1:1", sock_path) as client:
+        result = client.run("ping", timeout=5)
+    assert result["ok"] is True
+    assert result["browser"] == "b1"
+
+
+def test_wait_timeout_cancels_command(relay):
+    _, sock_path = relay
+    with RelayClient("http://127.0.0.1:1", sock_path) as client:
+        cmd_id = client.submit("ping")
+        result = client.wait(cmd_id, timeout=0.2)
+        assert result["ok"] is False
+        with connect("http://127.0.0.1:1", sock_path) as http:
+            assert http.delete(f"/command/{cmd_id}").status_code == 404
@@ -0,0 +1,61 @@
+"""Tests for the in-process relay: commands queued directly, extension over HTTP."""
+
+import asyncio
+import time
+
+import pytest
+
+from browser_relay.relay.embedded import EmbeddedRelay
+from browser_relay.relay.queue import QueueFull
+from browser_relay.relay.simulator import SimulatedExtension
+
+
+@pytest.fixture()
+def embedded():
+    with EmbeddedRelay(port=0) as relay:
+        yield relay
+
+
+class TestEmbeddedRelay:
+    def test_run_round_trips_through_the_extension(self, embedded):
+        with SimulatedExtension(embedded.url) as ext:
+            result = embedded.run("get_text", {"selector": "h1"}, timeout=5)
+        assert result["ok"] is True
+        assert result["params"] == {"selector": "h1"}
+        assert ext.executed[0]["deadline_ms"] > 0
+
+    def test_arun_awaits_the_result(self, embedded):
+        with SimulatedExtension(embedded.url):
+            result = asyncio.run(embedded.arun("count", {"selector": "li"}, timeout=5))
+        assert result["action"] == "count"
+
+    def test_timeout_cancels_the_command(self, embedded):
+        cmd_id = embedded.submit("click", {"selector": "#b"}, timeout=5)
+        assert embedded.wait(cmd_id, timeout=0.05) == {"ok": False, "error": "Timeout waiting for result"}
+        assert embedded.status()["queue"]["depth"] == 0
+
+    def test_commands_are_visible_over_http(self, embedded):
+        embedded.submit("click", {"selector": "#b"})
+        with SimulatedExtension(embedded.url) as ext:
+            for _ in range(100):
+                if ext.executed:
+                    break
+                time.sleep(0.01)
+        assert ext.executed[0]["action"] == "click"
+
+    def test_browser_and_priority_are_applied(self):
+        relay = EmbeddedRelay(port=0, priority="interactive", browser="work")
+        relay.submit("click")
+        assert relay.status()["queue"]["by_priority"]["interactive"] == 1
+        assert "work" in relay.relay.targeted
+
+    def test_full_queue_raises(self, monkeypatch):
+        relay = EmbeddedRelay(port=0)
+        monkeypatch.setattr(relay.relay.queue, "capacity", 2)
+        relay.submit("click")
+        with pytest.raises(QueueFull):
+            relay.submit("click")
+
+    def test_unknown_priority_rejected(self):
+        with pytest.raises(ValueError):
+            EmbeddedRelay(priority="urgent")
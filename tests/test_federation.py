@@ -0,0 +1,223 @@
+"""Tests for relay federation: several relays on local ports with simulated extensions."""
+
+import threading
+import time
+
+import httpx
+import pytest
+from werkzeug.serving import make_server
+
+from browser_relay.relay.federation import TOKEN_HEADER, Federation
+from browser_relay.relay.server import Relay, create_app
+from browser_relay.relay.simulator import SimulatedExtension
+
+
+class RunningRelay:
+    def __init__(self, token: str | None = None):
+        self.relay = Relay(Federation(token=token))
+        self.server = make_server("127.0.0.1", 0, create_app(self.relay), threaded=True)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.relay.federation.self_url = self.url
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+
+    def shutdown(self):
+        self.relay.federation.stop()
+        self.server.shutdown()
+
+
+@pytest.fixture()
+def relays():
+    running: list[RunningRelay] = []
+
+    def spawn(n: int, token: str | None = None) -> list[RunningRelay]:
+        new = [RunningRelay(token) for _ in range(n)]
+        running.extend(new)
+        return new
+
+    yield spawn
+    for r in running:
+        r.shutdown()
+
+
+def federate(*relays: RunningRelay, chain: bool = False) -> None:
+    """Peer the relays (all with the first, or each with the next) and gossip once."""
+    for i, r in enumerate(relays[1:], start=1):
+        r.relay.federation.add_peer(relays[i - 1].url if chain else relays[0].url)
+    for _ in range(2):
+        for r in relays:
+            r.relay.federation.refresh(r.relay.advertise())
+
+
+def run(url: str, command: dict, timeout: float = 5.0) -> dict:
+    with httpx.Client(base_url=url, timeout=timeout + 5) as client:
+        resp = client.post("/command", json=command)
+        resp.raise_for_status()
+        cmd_id = resp.json()["id"]
+        return client.get("/result", params={"id": cmd_id, "timeout": timeout}).json()
+
+
+def wait_connected(relay: RunningRelay, browser: str) -> None:
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        with relay.relay.lock:
+            if browser in relay.relay.live_browsers():
+                return
+        time.sleep(0.02)
+    raise AssertionError(f"{browser} never polled {relay.url}")
+
+
+class TestRouting:
+    def test_command_reaches_browser_on_peer(self, relays):
+        a, b = relays(2)
+        with SimulatedExtension(b.url, browser="far"):
+            wait_connected(b, "far")
+            federate(a, b)
+            result = run(a.url, {"action": "ping", "browser": "far"})
+        assert result["ok"] is True
+        assert result["browser"] == "far"
+
+    def test_local_browser_preferred(self, relays):
+        a, b = relays(2)
+        with SimulatedExtension(a.url, browser="near") as near, SimulatedExtension(b.url, browser="far") as far:
+            wait_connected(a, "near")
+            wait_connected(b, "far")
+            federate(a, b)
+            assert run(a.url, {"action": "ping"})["browser"] == "near"
+        assert far.executed == []
+        assert len(near.executed) == 1
+
+    def test_untargeted_command_goes_to_peer_without_local_browser(self, relays):
+        a, b = relays(2)
+        with SimulatedExtension(b.url, browser="far"):
+            wait_connected(b, "far")
+            federate(a, b)
+            assert run(a.url, {"action": "ping"})["browser"] == "far"
+
+    def test_reaches_browser_two_hops_away(self, relays):
+        a, b, c = relays(3)
+        with SimulatedExtension(c.url, browser="edge"):
+            wait_connected(c, "edge")
+            federate(a, b, c, chain=True)
+            assert c.url in a.relay.federation.peers
+            assert run(a.url, {"action": "ping", "browser": "edge"})["browser"] == "edge"
+
+    def test_picks_peer_with_most_spare_capacity(self, relays):
+        a, busy, idle = relays(3)
+        for r, name in ((busy, "shared"), (idle, "shared")):
+            with r.relay.lock:
+                r.relay.next_command(name)
+        with busy.relay.lock:
+            for i in range(10):
+                busy.relay.submit({"id": f"q{i}", "action": "ping", "browser": "other"}, "normal", "x")
+        federate(a, busy, idle)
+        assert a.relay.federation.route("shared") == idle.url
+
+    def test_forwarded_command_is_not_forwarded_again(self, relays):
+        a, b = relays(2)
+        federate(a, b)
+        with httpx.Client(base_url=b.url) as client:
+            resp = client.post(
+                "/command",
+                json={"action": "ping", "id": "loop", "browser": "nowhere"},
+                headers={"X-Relay-Forwarded": a.relay.federation.relay_id},
+            )
+        assert resp.status_code == 200
+        with b.relay.lock:
+            assert b.relay.queue_depth() == 1
+
+    def test_cancel_is_proxied_to_peer(self, relays):
+        a, b = relays(2)
+        with b.relay.lock:
+            b.relay.next_command("far")
+        federate(a, b)
+        with httpx.Client(base_url=a.url) as client:
+            client.post("/command", json={"action": "ping", "id": "c1", "browser": "far"})
+            resp = client.delete("/command/c1")
+        assert resp.json()["state"] == "queued"
+        with b.relay.lock:
+            assert b.relay.queue_depth() == 0
+
+    def test_streamed_result_is_relayed_from_peer(self, relays):
+        a, b = relays(2)
+        with b.relay.lock:
+            b.relay.next_command("far")
+        federate(a, b)
+        with httpx.Client(base_url=a.url) as client:
+            client.post("/command", json={"action": "snapshot", "id": "s1", "browser": "far"})
+            with b.relay.lock:
+                b.relay.store.add_chunk("s1", b"x" * 70000)
+                b.relay.store.add_chunk("s1", b"y")
+            resp = client.get("/result/s1/stream", headers={"Accept-Encoding": "identity"})
+        assert resp.content == b"x" * 70000 + b"y"
+        assert a.relay.federation.peer_for("s1") is None
+
+    def test_routing_never_waits_for_gossip(self, monkeypatch):
+        federation = Federation(peers=["127.0.0.1:1"])
+        monkeypatch.setattr(federation, "refresh", lambda *a: pytest.fail("route() refreshed"))
+        assert federation.route(None) is None
+
+
+class TestAuthentication:
+    def test_peers_with_the_token_federate(self, relays):
+        a, b = relays(2, token="s3cret")
+        with SimulatedExtension(b.url, browser="far"):
+            wait_connected(b, "far")
+            federate(a, b)
+            assert run(a.url, {"action": "ping", "browser": "far"})["browser"] == "far"
+
+    def test_wrong_token_is_refused(self, relays):
+        (a,) = relays(1, token="s3cret")
+        resp = httpx.post(f"{a.url}/federation/join", json={"url": "http://evil:1"}, headers={TOKEN_HEADER: "guess"})
+        assert resp.status_code == 401
+        assert httpx.get(f"{a.url}/federation/advertisement").status_code == 401
+        resp = httpx.post(f"{a.url}/command", json={"action": "ping"}, headers={"X-Relay-Forwarded": "x"})
+        assert resp.status_code == 401
+        assert a.relay.federation.peers == set()
+
+    def test_peer_with_wrong_token_learns_nothing(self, relays):
+        (a,) = relays(1, token="s3cret")
+        (b,) = relays(1, token="other")
+        federate(a, b)
+        assert b.relay.federation.advertisements() == {}
+        assert a.relay.federation.peers == set()
+
+    def test_remote_peers_need_a_token(self):
+        relay = Relay()
+        remote = {"REMOTE_ADDR": "203.0.113.7"}
+        with create_app(relay).test_client() as client:
+            assert client.post("/federation/join", json={"url": "http://x:1"}, environ_base=remote).status_code == 403
+            resp = client.post(
+                "/command", json={"action": "ping"}, headers={"X-Relay-Forwarded": "x"}, environ_base=remote
+            )
+            assert resp.status_code == 403
+            assert client.post("/command", json={"action": "ping"}, environ_base=remote).status_code == 200
+            assert client.get("/federation/advertisement").status_code == 200
+
+
+class TestDiscovery:
+    def test_join_makes_peers_mutual(self, relays):
+        a, b = relays(2)
+        federate(a, b)
+        assert a.url in b.relay.federation.peers
+        assert b.url in a.relay.federation.peers
+
+    def test_browsers_lists_federation(self, relays):
+        a, b = relays(2)
+        with SimulatedExtension(a.url, browser="near"), SimulatedExtension(b.url, browser="far"):
+            wait_connected(a, "near")
+            wait_connected(b, "far")
+            federate(a, b)
+            entries = httpx.get(f"{a.url}/federation/browsers").json()["browsers"]
+        assert {(e["browser"], e["local"]) for e in entries} == {("near", True), ("far", False)}
+
+    def test_unreachable_peer_is_reported(self):
+        federation = Federation(peers=["127.0.0.1:1"])
+        federation.refresh()
+        assert federation.route(None) is None
+        assert federation.summary()["peers"][0]["reachable"] is False
+
+    def test_ignores_itself_as_peer(self):
+        federation = Federation(self_url="http://127.0.0.1:18321")
+        assert federation.add_peer("127.0.0.1:18321/") is False
+        assert federation.peers == set()
@@ -0,0 +1,87 @@
+"""Tests for the page-event channel between page_events.js and content.js, under the harness."""
+
+import json
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+HARNESS = ROOT / "benchmarks" / "harness"
+
+pytestmark = pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+
+CHANNEL_SCRIPT = """
+const { FakeDocument } = require(process.argv[1] + "/fake_dom");
+const { MutationObserver, loadScript } = require(process.argv[1] + "/load_script");
+const doc = new FakeDocument();
+
+// The page's world: its own window and console.
+const window = new EventTarget();
+window.alert = () => undefined;
+const pageConsole = { log() {}, info() {}, warn() {}, error() {}, debug() {} };
+const page = loadScript("page_events.js", doc, { window, console: pageConsole });
+
+// The content script's world, with a keepalive port that records what it sends.
+const sent = [];
+let fromWorker = null;
+const port = {
+  onDisconnect: { addListener() {} },
+  onMessage: { addListener(fn) { fromWorker = fn; } },
+  postMessage(message) { sent.push(message.event); },
+};
+const chrome = { runtime: { connect: () => port, onMessage: { addListener() {} } } };
+loadScript("content.js", doc, { chrome });
+
+const out = {};
+page("console.log('before subscribing')");
+out.unsubscribed = sent.length;
+
+fromWorker({ pageEvents: true });
+out.observing = MutationObserver.observing;
+page("globalThis.touched = false");
+page("console.log('hi', { get x() { globalThis.touched = true; } , toJSON() { globalThis.touched = true; } }, 3, null)");
+page("window.alert('Are you sure?')");
+out.touched = page("touched");
+out.events = sent.splice(0);
+
+// A page can neither forge events nor hijack the channel.
+for (const name of ["__relay_page_event", "__relay_page_events"]) {
+  doc.dispatchEvent(new CustomEvent(name, { detail: "console\\u0001log\\u0001forged\\u0001" }));
+}
+let overheard = 0;
+doc.addEventListener("page-chosen", () => { overheard += 1; });
+doc.dispatchEvent(new CustomEvent("__relay_page_events", { detail: "page-chosen" }));
+page("console.warn('still private')");
+out.forged = sent.splice(0);
+out.overheard = overheard;
+out.native = page("console.log.toString()");
+
+fromWorker({ pageEvents: false });
+out.observingAfter = MutationObserver.observing;
+page("console.log('after unsubscribing')");
+out.after = sent.length;
+console.log(JSON.stringify(out));
+"""
+
+
+def test_page_events_channel():
+    proc = subprocess.run(
+        ["node", "-e", CHANNEL_SCRIPT, str(HARNESS)], capture_output=True, text=True, timeout=60
+    )
+    assert proc.returncode == 0, proc.stderr
+    out = json.loads(proc.stdout)
+    assert out["unsubscribed"] == 0
+    assert out["observing"] == 1
+    assert out["events"] == [
+        {"type": "console", "level": "log", "text": "hi [object] 3 null"},
+        {"type": "dialog", "kind": "alert", "message": "Are you sure?"},
+    ]
+    # Page objects are described, never read or serialized.
+    assert out["touched"] is False
+    assert out["forged"] == [{"type": "console", "level": "warn", "text": "still private"}]
+    assert out["overheard"] == 0
+    assert out["native"] == "function log() { [native code] }"
+    assert out["observingAfter"] == 0
+    assert out["after"] == 0
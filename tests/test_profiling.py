@@ -0,0 +1,120 @@
+"""Tests for the built-in sampling profiler and timed locks."""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from browser_relay.profiling import SamplingProfiler, TimedLock
+from browser_relay.relay.server import Relay, create_app
+
+
+def _busy_until(stop: threading.Event):
+    while not stop.is_set():
+        time.sleep(0.001)
+
+
+class TestTimedLock:
+    def test_records_contended_wait_and_hold(self):
+        lock = TimedLock("test")
+        held = threading.Event()
+
+        def hold():
+            with lock:
+                held.set()
+                time.sleep(0.05)
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        held.wait()
+        with lock:
+            pass
+        holder.join()
+        stats = lock.stats()
+        assert stats["acquisitions"] == 2
+        assert stats["contended"] == 1
+        assert stats["wait_max_ms"] >= 30
+        assert stats["hold_max_ms"] >= 30
+
+    def test_non_blocking_acquire_of_held_lock_fails(self):
+        lock = TimedLock("test")
+        lock.acquire()
+        assert not _try_from_thread(lock)
+        lock.release()
+        assert lock.stats()["acquisitions"] == 1
+
+    def test_backs_a_condition(self):
+        lock = TimedLock("test")
+        ready = threading.Condition(lock)
+        got = []
+
+        def waiter():
+            with ready:
+                got.append(ready.wait_for(lambda: "x" in got, timeout=2))
+
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        time.sleep(0.02)
+        with ready:
+            got.append("x")
+            ready.notify_all()
+        thread.join()
+        assert got == ["x", True]
+
+
+def _try_from_thread(lock: TimedLock) -> bool:
+    result = []
+    thread = threading.Thread(target=lambda: result.append(lock.acquire(blocking=False)))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+class TestSamplingProfiler:
+    def test_samples_other_threads_as_collapsed_stacks(self, tmp_path):
+        profiler = SamplingProfiler()
+        stop = threading.Event()
+        worker = threading.Thread(target=_busy_until, args=(stop,), name="worker")
+        worker.start()
+        for _ in range(5):
+            profiler.sample()
+        stop.set()
+        worker.join()
+
+        stacks = [s for s in profiler.stacks if s.startswith("worker;")]
+        assert stacks
+        assert "_busy_until (tests/test_profiling.py:" in stacks[0].split(";")[-1]
+        assert sum(profiler.stacks[s] for s in stacks) == 5
+
+        folded, locks = profiler.write(tmp_path, "relay")
+        assert folded.name == f"relay-{os.getpid()}.folded"
+        for line in folded.read_text().splitlines():
+            stack, _, count = line.rpartition(" ")
+            assert stack and int(count) > 0
+        assert json.loads(locks.read_text())["samples"] == 5
+
+    def test_relay_locks_are_timed(self):
+        profiler = SamplingProfiler()
+        relay = Relay()
+        relay.use_lock(profiler.timed_lock("relay"))
+        app = create_app(relay)
+        with app.test_client() as client:
+            client.post("/command", json={"action": "click", "id": "c1"})
+            client.post("/result", json={"id": "c1", "ok": True})
+            assert client.get("/result?id=c1&timeout=1").get_json()["ok"] is True
+        stats = {lock.name: lock.stats() for lock in profiler.locks}
+        assert stats["relay"]["acquisitions"] >= 3
+
+
+def test_cli_profiles_a_run_when_asked(tmp_path):
+    env = {**os.environ, "BROWSER_RELAY_PROFILE": str(tmp_path)}
+    code = "from browser_relay.cli.app import app; app(['--help'])"
+    proc = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, timeout=60)
+    assert proc.returncode == 0
+    assert "Profile written" in proc.stderr
+    folded = list(tmp_path.glob("cli-*.folded"))
+    assert len(folded) == 1
+    assert "MainThread;" in folded[0].read_text()
+    assert list(tmp_path.glob("cli-*-locks.json"))
@@ -1,21 +1,23 @@
 """Tests for the relay server endpoints."""
 
+import gzip
 import json
 import threading
 import time
 
 import pytest
 
-from browser_relay.relay.server import app
+from browser_relay.relay.server import Relay, create_app
 
 
 @pytest.fixture()
-def client():
-    import browser_relay.relay.server as srv
-    srv._pending_command = None
-    srv._pending_result = None
-    srv._last_poll_ts = 0.0
+def relay():
+    return Relay()
 
+
+@pytest.fixture()
+def client(relay):
+    app = create_app(relay)
     app.config["TESTING"] = True
     with app.test_client() as c:
         yield c
@@ -111,3 +113,479 @@ class TestFullCycle:
         result = result_resp.get_json()
         assert result["ok"] is True
         assert result["elements"] == []
+
+
+class TestQueue:
+    def test_commands_are_queued_in_order(self, client):
+        client.post("/command", json={"action": "ping", "id": "a"})
+        client.post("/command", json={"action": "ping", "id": "b"})
+        assert client.get("/command").get_json()["id"] == "a"
+        assert client.get("/command").get_json()["id"] == "b"
+        assert client.get("/command").status_code == 204
+
+    def test_interactive_jumps_ahead_of_background(self, client):
+        client.post("/command", json={"action": "get_text", "id": "bg", "priority": "background"})
+        client.post("/command", json={"action": "click", "id": "fg", "priority": "interactive"})
+        assert client.get("/command").get_json()["id"] == "fg"
+        assert client.get("/command").get_json()["id"] == "bg"
+
+    def test_priority_is_not_forwarded_to_extension(self, client):
+        client.post("/command", json={"action": "click", "priority": "interactive", "client": "agent"})
+        cmd = client.get("/command").get_json()
+        assert "priority" not in cmd
+        assert "client" not in cmd
+
+    def test_unknown_priority_rejected(self, client):
+        resp = client.post("/command", json={"action": "ping", "priority": "urgent"})
+        assert resp.status_code == 400
+
+    def test_clients_share_a_lane_fairly(self, client):
+        for i in range(3):
+            client.post("/command", json={"action": "ping", "id": f"a{i}", "client": "a"})
+        client.post("/command", json={"action": "ping", "id": "b0", "client": "b"})
+        order = [client.get("/command").get_json()["id"] for _ in range(4)]
+        assert order == ["a0", "b0", "a1", "a2"]
+
+    def test_full_queue_returns_429_with_retry_after(self, client, relay, monkeypatch):
+        monkeypatch.setattr(relay.queue, "capacity", 4)
+        for i in range(2):
+            assert client.post("/command", json={"action": "ping", "priority": "background"}).status_code == 200
+        resp = client.post("/command", json={"action": "ping", "priority": "background"})
+        assert resp.status_code == 429
+        assert int(resp.headers["Retry-After"]) >= 1
+        assert client.post("/command", json={"action": "click", "priority": "interactive"}).status_code == 200
+
+    def test_per_client_limit(self, client, relay, monkeypatch):
+        monkeypatch.setattr(relay.queue, "per_client_limit", 1)
+        assert client.post("/command", json={"action": "ping", "client": "a"}).status_code == 200
+        assert client.post("/command", json={"action": "ping", "client": "a"}).status_code == 429
+        assert client.post("/command", json={"action": "ping", "client": "b"}).status_code == 200
+
+    def test_background_burst_does_not_refuse_interactive(self, client, relay, monkeypatch):
+        monkeypatch.setattr(relay.queue, "per_client_limit", 4)
+        for i in range(4):
+            command = {"action": "get_text", "params": {"selector": f"#r{i}"}, "priority": "background"}
+            assert client.post("/command", json=command, headers={"X-Relay-Client": "crawler"}).status_code == 200
+        resp = client.post("/command", json={"action": "scroll", "priority": "background", "client": "crawler"})
+        assert resp.status_code == 429
+        resp = client.post("/command", json={"action": "click", "priority": "interactive"}, headers={"X-Relay-Client": "agent"})
+        assert resp.status_code == 200
+        resp = client.post("/command", json={"action": "click", "priority": "interactive", "client": "crawler"})
+        assert resp.status_code == 200
+
+    def test_commands_for_absent_browsers_expire(self, client, relay):
+        client.post("/command", json={"action": "click", "browser": "gone", "timeout": 0})
+        time.sleep(0.01)
+        data = client.get("/status").get_json()
+        assert data["queue"]["depth"] == 0
+        assert data["queue"]["expired"] == 1
+        assert "gone" not in relay.targeted
+
+    def test_unanswered_dispatch_stops_counting_as_in_flight(self, client, monkeypatch):
+        monkeypatch.setattr("browser_relay.relay.server.DISPATCH_GRACE", 0)
+        client.post("/command", json={"action": "click", "timeout": 0.05})
+        client.post("/command", json={"action": "scroll"})
+        client.get("/command")
+        client.get("/command")
+        assert client.get("/status").get_json()["queue"]["in_flight"] == 2
+        time.sleep(0.06)
+        assert client.get("/status").get_json()["queue"]["in_flight"] == 1
+
+    def test_expired_commands_make_room(self, client, relay, monkeypatch):
+        monkeypatch.setattr(relay.queue, "capacity", 1)
+        client.post("/command", json={"action": "click", "priority": "interactive", "timeout": 0})
+        time.sleep(0.01)
+        assert client.post("/command", json={"action": "click", "priority": "interactive"}).status_code == 200
+
+    def test_status_reports_queue_depth(self, client):
+        client.post("/command", json={"action": "ping", "priority": "background"})
+        data = client.get("/status").get_json()
+        assert data["pending_command"] is True
+        assert data["queue"]["depth"] == 1
+        assert data["queue"]["by_priority"]["background"] == 1
+
+
+class TestBrowsers:
+    def test_targeted_command_waits_for_its_browser(self, client):
+        client.post("/command", json={"action": "ping", "id": "t1", "browser": "laptop"})
+        assert client.get("/command?browser=desktop").status_code == 204
+        assert client.get("/command?browser=laptop").get_json()["id"] == "t1"
+
+    def test_untargeted_command_goes_to_any_browser(self, client):
+        client.post("/command", json={"action": "ping", "id": "u1"})
+        assert client.get("/command?browser=desktop").get_json()["id"] == "u1"
+
+    def test_cancel_notice_goes_to_running_browser(self, client):
+        client.post("/command", json={"action": "wait", "id": "w1"})
+        client.get("/command?browser=laptop")
+        client.delete("/command/w1")
+        assert client.get("/command?browser=desktop").status_code == 204
+        assert client.get("/command?browser=laptop").get_json()["action"] == "cancel"
+
+    def test_status_lists_connected_browsers(self, client):
+        client.get("/command?browser=laptop")
+        client.get("/command")
+        data = client.get("/status").get_json()
+        assert sorted(data["browsers"]) == ["default", "laptop"]
+        assert data["extension_connected"] is True
+
+
+class TestResultById:
+    def test_result_is_matched_to_command_id(self, client):
+        client.post("/result", json={"id": "first", "ok": True, "value": 1})
+        client.post("/result", json={"id": "second", "ok": True, "value": 2})
+        resp = client.get("/result?id=second&timeout=1")
+        assert resp.get_json()["value"] == 2
+        resp = client.get("/result?id=first&timeout=1")
+        assert resp.get_json()["value"] == 1
+
+    def test_result_for_other_id_is_not_returned(self, client):
+        client.post("/result", json={"id": "other", "ok": True})
+        resp = client.get("/result?id=mine&timeout=0.3")
+        assert resp.status_code == 504
+
+    def test_waiter_is_woken_by_result(self, client):
+        def deliver():
+            time.sleep(0.2)
+            with client.application.test_client() as c:
+                c.post("/result", json={"id": "late", "ok": True})
+
+        threading.Thread(target=deliver).start()
+        started = time.time()
+        resp = client.get("/result?id=late&timeout=5")
+        assert resp.status_code == 200
+        assert time.time() - started < 2
+
+
+class TestCancellation:
+    def test_cancel_queued_command(self, client):
+        client.post("/command", json={"action": "wait", "id": "w1"})
+        resp = client.delete("/command/w1")
+        assert resp.status_code == 200
+        assert resp.get_json()["state"] == "queued"
+        assert client.get("/command").status_code == 204
+
+    def test_cancel_running_command_notifies_extension(self, client):
+        client.post("/command", json={"action": "wait", "id": "w1"})
+        client.post("/command", json={"action": "click", "id": "c1"})
+        client.get("/command")
+        resp = client.delete("/command/w1")
+        assert resp.get_json()["state"] == "running"
+        notice = client.get("/command").get_json()
+        assert notice == {"action": "cancel", "params": {"id": "w1"}}
+        assert client.get("/command").get_json()["id"] == "c1"
+
+    def test_cancel_only_poll_skips_new_work(self, client):
+        client.post("/command", json={"action": "click", "id": "c1"})
+        assert client.get("/command?cancel_only=1").status_code == 204
+        assert client.get("/command").get_json()["id"] == "c1"
+
+    def test_late_result_of_cancelled_command_is_dropped(self, client):
+        client.post("/command", json={"action": "wait", "id": "w1"})
+        client.get("/command")
+        client.delete("/command/w1")
+        resp = client.post("/result", json={"id": "w1", "ok": False, "error": "Cancelled"})
+        assert resp.get_json()["cancelled"] is True
+        assert client.get("/result?timeout=0.2").status_code == 504
+
+    def test_cancel_unknown_command(self, client):
+        assert client.delete("/command/nope").status_code == 404
+
+
+class TestDeadlines:
+    def test_timeout_becomes_deadline(self, client):
+        before = time.time() * 1000
+        client.post("/command", json={"action": "ping", "timeout": 5})
+        cmd = client.get("/command").get_json()
+        assert before + 4000 < cmd["deadline_ms"] < before + 6000
+        assert "timeout" not in cmd
+
+    def test_expired_command_is_not_dispatched(self, client):
+        client.post("/command", json={"action": "ping", "id": "old", "timeout": 0})
+        client.post("/command", json={"action": "ping", "id": "new"})
+        time.sleep(0.01)
+        assert client.get("/command").get_json()["id"] == "new"
+        assert client.get("/status").get_json()["queue"]["expired"] == 1
+
+    def test_invalid_timeout_rejected(self, client):
+        resp = client.post("/command", json={"action": "ping", "timeout": "soon"})
+        assert resp.status_code == 400
+
+
+class TestChunkedResults:
+    def _upload(self, client, cmd_id, pieces):
+        for seq, piece in enumerate(pieces):
+            resp = client.post(f"/result/{cmd_id}/chunk?seq={seq}", data=piece)
+            assert resp.status_code == 200
+
+    def test_stream_is_gzip_encoded(self, client):
+        self._upload(client, "big", [b"<div>", b"a" * 1000, b"</div>"])
+        resp = client.get("/result/big/stream", headers={"Accept-Encoding": "gzip"})
+        assert resp.headers["Content-Encoding"] == "gzip"
+        assert gzip.decompress(resp.data) == b"<div>" + b"a" * 1000 + b"</div>"
+
+    def test_stream_identity_without_accept_encoding(self, client):
+        self._upload(client, "big", [b"abc", b"def"])
+        resp = client.get("/result/big/stream")
+        assert "Content-Encoding" not in resp.headers
+        assert resp.data == b"abcdef"
+
+    def test_stream_is_served_once(self, client):
+        self._upload(client, "big", [b"abc"])
+        client.get("/result/big/stream")
+        assert client.get("/result/big/stream").status_code == 404
+
+    def test_out_of_order_chunk_rejected(self, client):
+        self._upload(client, "big", [b"abc"])
+        resp = client.post("/result/big/chunk?seq=3", data=b"x")
+        assert resp.status_code == 409
+
+    def test_chunks_dropped_when_cancelled(self, client, relay):
+        client.post("/command", json={"action": "get_html", "id": "big"})
+        client.get("/command")
+        self._upload(client, "big", [b"abc"])
+        client.delete("/command/big")
+        assert not relay.store.has_chunks("big")
+
+
+class TestResultStore:
+    def test_status_reports_store(self, client):
+        client.post("/result", json={"id": "r1", "ok": True})
+        results = client.get("/status").get_json()["results"]
+        assert results["results"] == 1
+        assert results["memory_bytes"] > 0
+
+    def test_evicted_result_returns_410(self, client, relay):
+        relay.store.max_bytes = 10
+        client.post("/result", json={"id": "huge", "ok": True, "html": "x" * 100})
+        resp = client.get("/result?id=huge&timeout=1")
+        assert resp.status_code == 410
+        assert resp.get_json()["evicted"] == "budget"
+
+    def test_spilled_result_is_served_whole(self, client, relay):
+        relay.store.spill_threshold = 16
+        client.post("/result", json={"id": "s1", "ok": True, "html": "y" * 5000})
+        assert relay.store.stats()["spills"] == 1
+        data = client.get("/result?id=s1&timeout=1").get_json()
+        assert data["html"] == "y" * 5000
+
+
+class TestNavigation:
+    def test_tab_seq_tracks_reported_navigations(self, client):
+        before = client.get("/navigation").get_json()["seq"]
+        client.post("/navigation?browser=b1", json={"tab_id": 4, "url": "https://x.test/"})
+        data = client.get("/navigation?tab_id=4").get_json()
+        assert data["tab_seq"] > before
+        assert client.get("/navigation?tab_id=5").get_json()["tab_seq"] == 0
+
+    def test_browser_scoped(self, client):
+        client.post("/navigation?browser=b1", json={"tab_id": 4})
+        assert client.get("/navigation?tab_id=4&browser=b2").get_json()["tab_seq"] == 0
+
+    def test_forgotten_tabs_report_floor(self, client, relay, monkeypatch):
+        import browser_relay.relay.server as srv
+
+        monkeypatch.setattr(srv, "NAVIGATION_MEMORY", 2)
+        for tab in (1, 2, 3):
+            client.post("/navigation", json={"tab_id": tab})
+        assert relay.navigation_seq(1) == 1
+
+    def test_requires_tab_id(self, client):
+        assert client.post("/navigation", json={"url": "x"}).status_code == 400
+
+
+
+class TestEvents:
+    def _events(self, client, query=""):
+        resp = client.get(f"/events?follow=0{query}")
+        assert resp.mimetype == "text/event-stream"
+        return [json.loads(line[6:]) for line in resp.get_data(as_text=True).splitlines() if line.startswith("data: ")]
+
+    def test_backlog_with_filters(self, client):
+        client.post("/events?browser=b1", json={"events": [
+            {"type": "console", "tab_id": 1, "level": "log", "text": "hi"},
+            {"type": "mutation", "tab_id": 2, "added": 3},
+            {"type": "dialog", "tab_id": 1, "kind": "alert", "message": "?"},
+        ]})
+        assert [e["id"] for e in self._events(client)] == [1, 2, 3]
+        assert [e["type"] for e in self._events(client, "&tab_id=1")] == ["console", "dialog"]
+        assert [e["tab_id"] for e in self._events(client, "&type=mutation")] == [2]
+        assert self._events(client, "&since=2")[0]["browser"] == "b1"
+
+    def test_navigation_reports_become_events(self, client):
+        client.post("/navigation", json={"tab_id": 4, "url": "https://x.test/"})
+        [event] = self._events(client)
+        assert event["type"] == "navigation"
+        assert event["url"] == "https://x.test/"
+
+    def test_gap_reported_when_resuming_past_dropped_events(self, relay, client):
+        from browser_relay.relay.events import EventLog
+
+        relay.events = EventLog(capacity=2)
+        client.post("/events", json={"events": [{"type": "load", "tab_id": 1}] * 5})
+        body = client.get("/events?follow=0", headers={"Last-Event-ID": "1"}).get_data(as_text=True)
+        assert 'event: gap\ndata: {"missed":2}' in body
+        assert body.count("event: load") == 2
+
+    def test_polls_report_subscribers(self, client, relay):
+        assert client.get("/command").headers["X-Relay-Subscribers"] == "0"
+        relay.events.subscribers = 2
+        client.post("/command", json={"action": "click"})
+        assert client.get("/command").headers["X-Relay-Subscribers"] == "2"
+
+    def test_rejects_unknown_types(self, client):
+        assert client.post("/events", json={"events": [{"type": "bogus"}]}).status_code == 400
+        assert client.get("/events?type=bogus").status_code == 400
+
+    def test_follow_waits_for_matching_event(self, relay, client):
+        resp = client.get("/events?tab_id=7", buffered=False)
+        stream = iter(resp.response)
+        assert next(stream) == b": ok\n\n"
+
+        def publish():
+            time.sleep(0.05)
+            client.application.test_client().post("/events", json={"events": [
+                {"type": "load", "tab_id": 6}, {"type": "load", "tab_id": 7},
+            ]})
+
+        publisher = threading.Thread(target=publish)
+        publisher.start()
+        frame = next(stream).decode()
+        publisher.join()
+        assert frame.startswith("id: 2\nevent: load\n")
+        assert relay.events.subscribers == 1
+        resp.close()
+        assert relay.events.subscribers == 0
+
+
+class TestCoalescing:
+    READ = {"action": "get_text", "params": {"selector": "h1", "tab_id": 3}}
+
+    def test_identical_reads_share_one_dispatch(self, client):
+        client.post("/command", json={**self.READ, "id": "r1"})
+        resp = client.post("/command", json={**self.READ, "params": {"tab_id": 3, "selector": "h1"}, "id": "r2"})
+        assert resp.get_json()["coalesced_with"] == "r1"
+        assert client.get("/command").get_json()["id"] == "r1"
+        assert client.get("/command").status_code == 204
+
+        client.post("/result", json={"id": "r1", "ok": True, "text": "Hello"})
+        assert client.get("/result?id=r1&timeout=1").get_json() == {"id": "r1", "ok": True, "text": "Hello"}
+        assert client.get("/result?id=r2&timeout=1").get_json() == {"id": "r2", "ok": True, "text": "Hello"}
+        assert client.get("/status").get_json()["queue"]["coalesced"] == 1
+
+    def test_follower_joins_a_running_read(self, client):
+        client.post("/command", json={**self.READ, "id": "r1"})
+        client.get("/command")
+        assert client.post("/command", json={**self.READ, "id": "r2"}).get_json()["coalesced_with"] == "r1"
+
+    def test_finished_read_is_not_joined(self, client):
+        client.post("/command", json={**self.READ, "id": "r1"})
+        client.get("/command")
+        client.post("/result", json={"id": "r1", "ok": True})
+        assert "coalesced_with" not in client.post("/command", json={**self.READ, "id": "r2"}).get_json()
+
+    def test_different_params_actions_and_writes_are_not_coalesced(self, client):
+        client.post("/command", json={**self.READ, "id": "r1"})
+        other = [
+            {"action": "get_text", "params": {"selector": "h2", "tab_id": 3}},
+            {"action": "get_html", "params": self.READ["params"]},
+            {**self.READ, "browser": "work"},
+            {"action": "click", "params": {"selector": "#b"}},
+            {"action": "click", "params": {"selector": "#b"}},
+        ]
+        for command in other:
+            assert "coalesced_with" not in client.post("/command", json=command).get_json()
+
+    def test_priority_is_part_of_the_key(self, client):
+        client.post("/command", json={**self.READ, "id": "r1", "priority": "batch"})
+        resp = client.post("/command", json={**self.READ, "id": "r2", "priority": "interactive"})
+        assert "coalesced_with" not in resp.get_json()
+        assert client.get("/command").get_json()["id"] == "r2"
+
+    def test_read_after_own_write_skips_a_flight_already_dispatched(self, client):
+        client.post("/command", json={**self.READ, "id": "r1", "client": "a"})
+        client.get("/command")
+        client.post("/command", json={"action": "click", "params": {"selector": "#b"}, "client": "b"})
+        assert "coalesced_with" not in client.post("/command", json={**self.READ, "id": "r2", "client": "b"}).get_json()
+        # Another client joins the fresher read; one without writes could join either.
+        assert client.post("/command", json={**self.READ, "id": "r3", "client": "c"}).get_json()["coalesced_with"] == "r2"
+
+    def test_read_waits_out_own_pending_write(self, client):
+        client.post("/command", json={**self.READ, "id": "r1", "client": "a"})
+        client.post("/command", json={"action": "click", "id": "w", "params": {"selector": "#b"}, "client": "b"})
+        assert "coalesced_with" not in client.post("/command", json={**self.READ, "id": "r2", "client": "b"}).get_json()
+        assert [client.get("/command").get_json()["id"] for _ in range(3)] == ["r1", "w", "r2"]
+
+    def test_read_after_answered_write_joins_a_queued_flight(self, client):
+        client.post("/command", json={"action": "click", "id": "w", "params": {"selector": "#b"}, "client": "b"})
+        client.get("/command")
+        client.post("/command", json={**self.READ, "id": "r1", "client": "a"})
+        assert "coalesced_with" not in client.post("/command", json={**self.READ, "id": "r2", "client": "b"}).get_json()
+        client.post("/result", json={"id": "w", "ok": True})
+        assert client.post("/command", json={**self.READ, "id": "r3", "client": "b"}).get_json()["coalesced_with"] == "r1"
+
+    def test_cancelled_follower_gets_no_result(self, client, relay):
+        client.post("/command", json={**self.READ, "id": "r1"})
+        client.post("/command", json={**self.READ, "id": "r2"})
+        assert client.delete("/command/r2").get_json()["state"] == "coalesced"
+        client.get("/command")
+        client.post("/result", json={"id": "r1", "ok": True})
+        assert "r1" in relay.store
+        assert "r2" not in relay.store
+
+    def test_cancelled_leader_keeps_running_for_followers(self, client, relay):
+        client.post("/command", json={**self.READ, "id": "r1"})
+        client.post("/command", json={**self.READ, "id": "r2"})
+        assert client.delete("/command/r1").get_json()["state"] == "queued"
+        assert client.get("/command").get_json()["id"] == "r1"
+        client.post("/result", json={"id": "r1", "ok": True})
+        assert "r1" not in relay.store
+        assert client.get("/result?id=r2&timeout=1").get_json()["id"] == "r2"
+
+    def test_read_is_cancelled_once_nobody_waits(self, client):
+        client.post("/command", json={**self.READ, "id": "r1"})
+        client.post("/command", json={**self.READ, "id": "r2"})
+        client.delete("/command/r1")
+        client.delete("/command/r2")
+        assert client.get("/command").status_code == 204
+
+    def test_read_outliving_the_leader_runs_itself(self, client):
+        client.post("/command", json={**self.READ, "id": "r1", "timeout": 0})
+        assert "coalesced_with" not in client.post("/command", json={**self.READ, "id": "r2", "timeout": 5}).get_json()
+        time.sleep(0.01)
+        cmd = client.get("/command").get_json()
+        assert cmd["id"] == "r2"
+        assert cmd["deadline_ms"] > time.time() * 1000
+        client.post("/result", json={"id": "r2", "ok": True})
+        assert client.get("/result?id=r2&timeout=1").get_json()["ok"] is True
+
+    def test_reads_join_only_leaders_that_outlive_them(self, client):
+        client.post("/command", json={**self.READ, "id": "r1", "timeout": 5})
+        assert client.post("/command", json={**self.READ, "id": "r2", "timeout": 1}).get_json()["coalesced_with"] == "r1"
+        assert "coalesced_with" not in client.post("/command", json={**self.READ, "id": "r3"}).get_json()
+        # The read with no deadline now leads; anything may join it.
+        assert client.post("/command", json={**self.READ, "id": "r4", "timeout": 9}).get_json()["coalesced_with"] == "r3"
+
+    def test_expired_flight_is_not_joined(self, relay):
+        relay.submit({**self.READ, "id": "r1", "deadline_ms": 1000}, "normal", "a")
+        assert relay.reads.follow({**self.READ, "id": "r2", "deadline_ms": 500}, "normal", "b", 2000) is None
+        assert len(relay.reads) == 0
+
+    def test_expired_running_flight_ends(self, client, relay):
+        client.post("/command", json={**self.READ, "id": "r1", "timeout": 0.05})
+        client.post("/command", json={**self.READ, "id": "r2", "timeout": 0.01})
+        client.get("/command")
+        time.sleep(0.06)
+        client.get("/status")
+        assert relay.reads.get("r1") is None
+        assert relay.reads.get("r2") is None
+
+    def test_streamed_result_is_copied_to_followers(self, client):
+        client.post("/command", json={"action": "get_html", "id": "big"})
+        client.post("/command", json={"action": "get_html", "id": "big2"})
+        client.get("/command")
+        client.post("/result/big/chunk?seq=0", data=b"<html>")
+        client.post("/result", json={"id": "big", "ok": True, "stream": {"chunks": 1}})
+        assert client.get("/result?id=big2&timeout=1").get_json()["stream"] == {"chunks": 1}
+        assert client.get("/result/big2/stream").data == b"<html>"
+        assert client.get("/result/big/stream").data == b"<html>"
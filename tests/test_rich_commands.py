@@ -10,9 +10,11 @@ CLI_APP = (ROOT / "src" / "browser_relay" / "cli" / "app.py").read_text()
 
 
 def test_content_supports_element_refs():
-    assert "const elementRefs = new Map()" in CONTENT_JS
+    assert "new WeakRef(node)" in CONTENT_JS
+    assert "const refOfElement = new WeakMap()" in CONTENT_JS
     assert "Element ref not found or stale" in CONTENT_JS
-    assert "ref: `e${count}`" in CONTENT_JS
+    assert "ref: refFor(node)" in CONTENT_JS
+    assert "info.contenteditable = true" in CONTENT_JS
 
 
 def test_content_has_rich_actions():
@@ -27,6 +29,7 @@ def test_content_has_rich_actions():
         'case "get_attr"',
         'case "get_value"',
         'case "count"',
+        'case "extract"',
     ]
     for action in expected_actions:
         assert action in CONTENT_JS
@@ -64,6 +67,90 @@ def test_cli_exposes_rich_commands():
         "def get_attr(",
         "def get_value(",
         "def count(",
+        "def extract(",
     ]
     for command in expected_commands:
         assert command in CLI_APP
+
+
+def test_extension_manages_block_rules():
+    assert "updateDynamicRules" in BACKGROUND_JS
+    assert "updateSessionRules" in BACKGROUND_JS
+    assert "onRuleMatchedDebug" in BACKGROUND_JS
+    assert '"main_frame"' not in BACKGROUND_JS.split("const SUBRESOURCE_TYPES")[1].split("];")[0]
+
+
+def test_extension_exports_and_imports_session_state():
+    assert "chrome.cookies.getAll({ domain })" in BACKGROUND_JS
+    assert "getAll({ url" not in BACKGROUND_JS
+    assert "if (location.origin !== origin) return false;" in BACKGROUND_JS
+    assert "chrome.cookies.set" in BACKGROUND_JS
+    assert "sessionStorage.setItem" in BACKGROUND_JS
+    assert 'action === "state_import"' in BACKGROUND_JS
+
+
+def test_extension_pushes_page_events():
+    assert "crypto.randomUUID()" in CONTENT_JS
+    assert "MutationObserver" in CONTENT_JS
+    assert "/events?browser=" in BACKGROUND_JS
+
+
+def test_page_events_only_while_subscribed():
+    assert 'resp.headers.get("X-Relay-Subscribers")' in BACKGROUND_JS
+    assert "if (!pageEventsWanted) return;" in BACKGROUND_JS
+    assert "mutationObserver.disconnect()" in CONTENT_JS
+
+
+def test_extension_reports_navigations():
+    assert "/navigation?browser=" in BACKGROUND_JS
+    assert 'changeInfo.status !== "loading"' in BACKGROUND_JS
+
+
+def test_extension_identifies_its_browser():
+    assert "browser_id" in BACKGROUND_JS
+    assert "/command?browser=" in BACKGROUND_JS
+
+
+def test_extension_supports_cancellation_and_deadlines():
+    assert "cancel_only=1" in BACKGROUND_JS
+    assert "AbortController" in BACKGROUND_JS
+    assert "deadline_ms" in BACKGROUND_JS
+    assert 'case "cancel"' in CONTENT_JS
+    assert "deadline_ms" in CONTENT_JS
+
+
+def test_background_uploads_large_results_in_chunks():
+    assert "CHUNK_THRESHOLD" in BACKGROUND_JS
+    assert "/chunk?seq=" in BACKGROUND_JS
+
+
+def test_background_injects_content_script_on_demand():
+    assert "readyFrames" in BACKGROUND_JS
+    assert 'files: ["content.js"], injectImmediately: true' in BACKGROUND_JS
+    assert "func: contentScriptLoaded" in BACKGROUND_JS
+    assert "globalThis.browserRelayContentLoaded = true" in CONTENT_JS
+    assert 'document.readyState === "loading"' in CONTENT_JS
+    # Every content-script command goes through the readiness check.
+    assert BACKGROUND_JS.count("chrome.tabs.sendMessage(") == 3
+
+
+def test_background_routes_commands_to_tab_id():
+    assert "async function targetTab(params)" in BACKGROUND_JS
+    assert "function runInTab(" in BACKGROUND_JS
+
+
+def test_evaluate_uses_cached_async_functions():
+    assert "const compiledScripts = new Map()" in CONTENT_JS
+    assert "new AsyncFunction(" in CONTENT_JS
+    assert "missing_script" in CONTENT_JS
+    assert 'action === "register_script"' in BACKGROUND_JS
+    assert "missing_script" in BACKGROUND_JS
+
+
+def test_type_supports_fast_and_human_modes():
+    assert 'mode === "fast"' in CONTENT_JS
+    assert 'mode === "human"' in CONTENT_JS
+    assert "function setNativeValue(" in CONTENT_JS
+    fast = CONTENT_JS.split('if (mode === "fast") {')[1].split("insertWholeText(")[0]
+    assert '!("value" in el)' in fast
+    assert "ok: false" in fast
@@ -0,0 +1,62 @@
+"""Tests for the content-script snapshot engine, run under the simulated DOM harness."""
+
+import json
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+BENCH = ROOT / "benchmarks" / "snapshot_bench.js"
+HARNESS = ROOT / "benchmarks" / "harness"
+
+pytestmark = pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+
+
+def test_snapshot_matches_previous_engine():
+    proc = subprocess.run(
+        ["node", str(BENCH), "--nodes", "3000", "--check"],
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    assert proc.returncode == 0, proc.stdout + proc.stderr
+    assert "DIFFERENT" not in proc.stdout
+    assert proc.stdout.count("identical") == 3
+
+
+REFS_SCRIPT = """
+const { FakeDocument } = require(process.argv[1] + "/fake_dom");
+const { loadScript } = require(process.argv[1] + "/load_script");
+const doc = new FakeDocument();
+const buttons = [0, 1, 2].map((i) => doc.createElement("button").append(`B${i}`));
+doc.body.append(...buttons);
+const get = loadScript("content.js", doc);
+const snapshot = () => get("doSnapshot")({ interactive_only: true }).elements.map((e) => e.ref);
+const error = (ref) => { try { get("resolveElement")(ref); return null; } catch (err) { return err.message; } };
+const out = { before: error("e0"), first: snapshot() };
+buttons[1].remove();
+const late = doc.createElement("button").append("B3");
+doc.body.append(late);
+out.second = snapshot();
+out.detached = error(out.first[1]);
+out.unknown = error("e99");
+out.resolves = get("resolveElement")(out.first[2]) === buttons[2];
+console.log(JSON.stringify(out));
+"""
+
+
+def test_refs_stay_bound_to_their_elements():
+    proc = subprocess.run(
+        ["node", "-e", REFS_SCRIPT, str(HARNESS)], capture_output=True, text=True, timeout=60
+    )
+    assert proc.returncode == 0, proc.stderr
+    out = json.loads(proc.stdout)
+    assert "no snapshot has been taken on this page" in out["before"]
+    assert out["first"] == ["e0", "e1", "e2"]
+    # The removed button's ref is not reused; the new button gets a new one.
+    assert out["second"] == ["e0", "e2", "e3"]
+    assert "detached from the page (last seen in snapshot 1, now 2)" in out["detached"]
+    assert "never issued" in out["unknown"]
+    assert out["resolves"] is True
@@ -0,0 +1,103 @@
+"""Tests for the local snapshot index and fuzzy ref lookup."""
+
+import pytest
+
+from browser_relay.snapshot_index import SnapshotIndex, StaleIndex, check_fresh, find, fuzzy_score, role_of
+
+ELEMENTS = [
+    {"ref": "e0", "tag": "a", "text": "Home", "href": "https://x.test/"},
+    {"ref": "e1", "tag": "button", "text": "Sign in"},
+    {"ref": "e2", "tag": "a", "text": "Sign in with Google", "href": "https://x.test/g"},
+    {"ref": "e3", "tag": "input", "type": "email", "placeholder": "Email address"},
+    {"ref": "e4", "tag": "div", "role": "button", "text": "", "ariaLabel": "Close dialog"},
+    {"ref": "e5", "tag": "a", "text": "Invoice #1042", "href": "https://x.test/i/1042"},
+    {"ref": "e6", "tag": "a", "text": "Invoices", "href": "https://x.test/i"},
+]
+
+
+class TestMatching:
+    def test_exact_beats_containment_beats_fuzzy(self):
+        assert fuzzy_score("Sign in", "sign in") == 1.0
+        assert fuzzy_score("sign in", "Sign in with Google") == 0.9
+        assert 0.6 < fuzzy_score("sing in", "Sign in") < 0.9
+
+    def test_implicit_roles(self):
+        assert role_of(ELEMENTS[1]) == "button"
+        assert role_of(ELEMENTS[0]) == "link"
+        assert role_of(ELEMENTS[3]) == "textbox"
+        assert role_of(ELEMENTS[4]) == "button"
+        assert role_of({"tag": "a"}) is None
+
+    def test_text_and_role(self):
+        matches = find(ELEMENTS, text="Sign in", role="button")
+        assert [el["ref"] for _, el in matches] == ["e1"]
+
+    def test_typo_still_matches(self):
+        assert find(ELEMENTS, text="Sing in", role="button")[0][1]["ref"] == "e1"
+
+    def test_equal_scores_keep_document_order(self):
+        refs = [el["ref"] for _, el in find(ELEMENTS, text="invoice", role="link")]
+        assert refs == ["e5", "e6"]
+
+    def test_aria_label_and_placeholder(self):
+        assert find(ELEMENTS, aria_label="close")[0][1]["ref"] == "e4"
+        assert find(ELEMENTS, text="email")[0][1]["ref"] == "e3"
+
+    def test_tag_filter(self):
+        assert {el["ref"] for _, el in find(ELEMENTS, tag="A")} == {"e0", "e2", "e5", "e6"}
+
+
+class TestIndex:
+    def test_save_and_load_last(self, tmp_path):
+        index = SnapshotIndex(tmp_path)
+        index.save({"tab_id": 7, "url": "https://x.test/", "elements": ELEMENTS}, nav_seq=3)
+        entry = index.load()
+        assert entry["tab_id"] == 7
+        assert entry["nav_seq"] == 3
+        assert len(entry["elements"]) == len(ELEMENTS)
+
+    def test_tabs_are_separate(self, tmp_path):
+        index = SnapshotIndex(tmp_path)
+        index.save({"tab_id": 1, "elements": ELEMENTS[:1]}, nav_seq=1)
+        index.save({"tab_id": 2, "elements": ELEMENTS[:2]}, nav_seq=1)
+        assert len(index.load(1)["elements"]) == 1
+        assert index.load()["tab_id"] == 2
+        assert index.load(3) is None
+
+    def test_files_are_private(self, tmp_path):
+        index = SnapshotIndex(tmp_path / "snapshots")
+        path = index.save({"tab_id": 1, "elements": ELEMENTS}, nav_seq=1)
+        assert path.stat().st_mode & 0o777 == 0o600
+        assert (tmp_path / "snapshots" / "last.json").stat().st_mode & 0o777 == 0o600
+        assert (tmp_path / "snapshots").stat().st_mode & 0o777 == 0o700
+
+    def test_secret_values_are_not_saved(self, tmp_path):
+        index = SnapshotIndex(tmp_path)
+        elements = [
+            {"ref": "e0", "tag": "input", "type": "password", "value": "hunter2"},
+            {"ref": "e1", "tag": "input", "type": "hidden", "value": "csrf-token"},
+            {"ref": "e2", "tag": "input", "type": "text", "value": "alice"},
+        ]
+        path = index.save({"tab_id": 1, "elements": elements}, nav_seq=1)
+        assert "hunter2" not in path.read_text()
+        assert "csrf-token" not in path.read_text()
+        assert [el.get("value") for el in index.load(1)["elements"]] == [None, None, "alice"]
+
+    def test_invalidate_one_tab_or_a_whole_browser(self, tmp_path):
+        index = SnapshotIndex(tmp_path)
+        for tab_id in (1, 2):
+            index.save({"tab_id": tab_id, "elements": ELEMENTS}, nav_seq=1)
+        index.save({"tab_id": 1, "elements": ELEMENTS}, nav_seq=1, browser="work")
+        index.invalidate(1)
+        assert index.load(1) is None
+        assert index.load(2) is not None
+        index.invalidate()
+        assert index.load(2) is None
+        assert index.load(1, browser="work") is not None
+
+    def test_freshness(self):
+        entry = {"tab_id": 1, "nav_seq": 5}
+        check_fresh(entry, 5)
+        check_fresh(entry, None)
+        with pytest.raises(StaleIndex):
+            check_fresh(entry, 6)
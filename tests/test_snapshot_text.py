@@ -0,0 +1,75 @@
+"""Tests for token-budgeted text snapshots."""
+
+import json
+
+from browser_relay.snapshot_text import compact_json, estimate_tokens, line_for, render_text, score, trim_json
+
+
+def _snapshot(items: int = 50) -> dict:
+    elements = [
+        {"ref": "e0", "tag": "a", "text": "Home", "href": "https://x.test/", "selector": "nav > a", "rect": {"x": 0, "y": 0, "w": 50, "h": 20}},
+        {"ref": "e1", "tag": "input", "type": "search", "placeholder": "Search", "value": "shoes", "selector": "#q", "rect": {"x": 100, "y": 0, "w": 200, "h": 20}},
+        {"ref": "e2", "tag": "button", "text": "Sign in", "selector": "#login", "rect": {"x": 400, "y": 0, "w": 60, "h": 20}},
+    ]
+    for i in range(items):
+        elements.append({
+            "ref": f"e{i + 3}",
+            "tag": "a",
+            "text": f"Item {i}",
+            "href": f"https://x.test/i/{i}",
+            "selector": f"#results > li:nth-of-type({i + 1}) > a",
+            "rect": {"x": 0, "y": 100 + i * 40, "w": 300, "h": 20},
+        })
+    elements.append({"ref": "e99", "tag": "button", "text": "Next page", "selector": "#next", "rect": {"x": 0, "y": 4000, "w": 80, "h": 20}})
+    return {"ok": True, "url": "https://x.test/", "title": "Shop", "viewport": {"w": 1280, "h": 800}, "elements": elements}
+
+
+def test_lines_are_compact():
+    snap = _snapshot()
+    assert line_for(snap["elements"][2]) == 'e2 button "Sign in"'
+    assert line_for(snap["elements"][1]) == 'e1 searchbox "Search" value="shoes"'
+    assert line_for({"ref": "e7", "tag": "a", "href": "https://x.test/x"}) == 'e7 link href="https://x.test/x"'
+
+
+def test_repeats_collapse_to_examples_and_summary():
+    lines = render_text(_snapshot()).splitlines()
+    assert lines[0] == "# Shop https://x.test/"
+    assert lines[4:8] == ['e3 link "Item 0"', 'e4 link "Item 1"', 'e5 link "Item 2"', '… 47 more link like "Item 3" (e6 … e52)']
+    assert lines[-1] == 'e99 button "Next page"'
+
+
+def test_budget_keeps_best_ranked_in_document_order():
+    text = render_text(_snapshot(), budget_tokens=40)
+    assert estimate_tokens(text) <= 40
+    lines = text.splitlines()
+    assert lines[1:3] == ['e1 searchbox "Search" value="shoes"', 'e2 button "Sign in"']
+    assert lines[-1].startswith("# ") and "more elements not shown" in lines[-1]
+
+
+def test_ranking_prefers_visible_interactive_labelled():
+    snap = _snapshot()
+    home, search, sign_in = snap["elements"][:3]
+    next_page = snap["elements"][-1]
+    assert score(search) > score(home)
+    assert score(sign_in) > score(next_page)
+    assert score({**sign_in, "text": ""}) < score(sign_in)
+
+
+def test_contenteditable_counts_as_a_field():
+    editor = {"ref": "e1", "tag": "div", "text": "Write here", "rect": {"x": 0, "y": 0, "w": 100, "h": 20}}
+    assert score({**editor, "contenteditable": True}) > score(editor)
+
+
+def test_json_budget_drops_whole_elements():
+    snap = _snapshot()
+    trimmed = trim_json(snap, budget_tokens=200)
+    assert estimate_tokens(compact_json(trimmed)) <= 200
+    assert trimmed["omitted"] == len(snap["elements"]) - len(trimmed["elements"])
+    refs = [e["ref"] for e in trimmed["elements"]]
+    assert {"e1", "e2"} <= set(refs)
+    assert "e99" not in refs
+
+
+def test_text_is_a_fraction_of_json():
+    snap = _snapshot()
+    assert len(render_text(snap)) * 10 < len(json.dumps(snap))
@@ -33,14 +33,17 @@ class TestManifestPermissions:
         assert cs["run_at"] == "document_start"
         assert cs["world"] == "MAIN"
 
-    def test_content_script_runs_at_document_idle(self):
+    def test_content_script_runs_at_document_start_after_stealth(self):
         manifest = json.loads((EXTENSION_DIR / "manifest.json").read_text())
+        files = [f for cs in manifest["content_scripts"] for f in cs["js"]]
         content_scripts = [
             cs for cs in manifest["content_scripts"]
             if "content.js" in cs.get("js", [])
         ]
         assert len(content_scripts) == 1
-        assert content_scripts[0]["run_at"] == "document_idle"
+        assert content_scripts[0]["run_at"] == "document_start"
+        # page_events.js must be listening before content.js hands it the channel.
+        assert files.index("stealth.js") < files.index("page_events.js") < files.index("content.js")
 
     def test_manifest_has_net_request_rules(self):
         manifest = json.loads((EXTENSION_DIR / "manifest.json").read_text())
@@ -116,6 +119,30 @@ class TestStealthJs:
     def test_spoofs_getter_descriptor(self, stealth_src):
         assert "getOwnPropertyDescriptor" in stealth_src
 
+    def test_returns_early_without_user_agent_data(self, stealth_src):
+        # Nothing is patched, toString included, where there is nothing to spoof.
+        assert stealth_src.index("if (!navigator.userAgentData) return;") < stealth_src.index("Function.prototype.toString =")
+
+
+class TestPageEventsJs:
+    @pytest.fixture()
+    def page_events_src(self):
+        return (EXTENSION_DIR / "page_events.js").read_text()
+
+    def test_runs_in_main_world_with_stealth(self):
+        manifest = json.loads((EXTENSION_DIR / "manifest.json").read_text())
+        [cs] = [cs for cs in manifest["content_scripts"] if "page_events.js" in cs["js"]]
+        assert cs["world"] == "MAIN"
+        assert cs["run_at"] == "document_start"
+
+    def test_hooks_look_native(self, page_events_src):
+        assert "makeNative(wrapped, level)" in page_events_src
+        assert "makeNative(wrapped, kind)" in page_events_src
+
+    def test_never_serializes_page_values(self, page_events_src):
+        assert "JSON.stringify" not in page_events_src
+        assert not re.search(r"\bString\(", page_events_src)
+
 
 class TestChromeLauncher:
     def test_no_detectable_flags_in_launch_args(self):
@@ -0,0 +1,84 @@
+"""Tests for the relay's result store: TTL, byte budget and spill-to-disk."""
+
+import os
+
+import pytest
+
+from browser_relay.relay.store import ResultEvicted, ResultStore
+
+
+def collect(parts) -> bytes:
+    return b"".join(parts)
+
+
+class TestResults:
+    def test_small_result_stays_in_memory(self):
+        store = ResultStore(spill_threshold=100)
+        store.put_result("a", b'{"id": "a"}')
+        assert store.stats()["memory_bytes"] == 11
+        assert collect(store.take_result("a")) == b'{"id": "a"}'
+        assert store.stats()["memory_bytes"] == 0
+
+    def test_large_result_is_spilled_and_streamed(self):
+        store = ResultStore(spill_threshold=10)
+        payload = b"x" * 1000
+        store.put_result("big", payload)
+        stats = store.stats()
+        assert stats["memory_bytes"] == 0
+        assert stats["spilled_bytes"] == 1000
+        assert stats["spills"] == 1
+        parts = store.take_result("big")
+        assert collect(parts) == payload
+        assert store.stats()["spilled_files"] == 0
+
+    def test_take_oldest_without_id(self):
+        store = ResultStore()
+        store.put_result("first", b"1")
+        store.put_result("second", b"2")
+        assert collect(store.take_result()) == b"1"
+
+    def test_ttl_evicts_and_reports(self):
+        store = ResultStore(ttl=10)
+        store.put_result("old", b"1")
+        store.expire(now=store._results["old"].created + 11)
+        assert store.stats()["evicted"]["ttl"] == 1
+        with pytest.raises(ResultEvicted):
+            store.take_result("old")
+        assert store.take_result("old") is None
+
+    def test_budget_evicts_oldest_first(self):
+        store = ResultStore(max_bytes=25, spill_threshold=10)
+        for name in ("a", "b", "c"):
+            store.put_result(name, b"y" * 10)
+        assert "a" not in store
+        assert "b" in store and "c" in store
+        assert store.stats()["evicted"]["budget"] == 1
+
+    def test_discard_removes_spill_file(self):
+        store = ResultStore(spill_threshold=1)
+        store.put_result("gone", b"abc")
+        path = store._results["gone"].path
+        store.discard("gone")
+        assert not os.path.exists(path)
+        assert store.stats()["spilled_bytes"] == 0
+
+
+class TestChunks:
+    def test_chunks_spill_once_threshold_crossed(self):
+        store = ResultStore(spill_threshold=5)
+        for piece in (b"abc", b"def", b"ghi"):
+            store.add_chunk("up", piece)
+        assert store.next_seq("up") == 3
+        assert store.stats()["spilled_bytes"] == 9
+        assert collect(store.take_chunks("up")) == b"abcdefghi"
+        assert store.take_chunks("up") is None
+
+    def test_copied_chunks_are_independent(self):
+        store = ResultStore(spill_threshold=5)
+        for piece in (b"abc", b"def"):
+            store.add_chunk("up", piece)
+        store.copy_chunks("up", "copy")
+        assert store.stats()["spilled_bytes"] == 12
+        assert collect(store.take_chunks("up")) == b"abcdef"
+        assert collect(store.take_chunks("copy")) == b"abcdef"
+        assert store.stats()["spilled_bytes"] == 0
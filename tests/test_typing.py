@@ -0,0 +1,58 @@
+"""Tests for fast-mode typing in content.js, under the harness."""
+
+import json
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+HARNESS = ROOT / "benchmarks" / "harness"
+
+pytestmark = pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+
+CONTENTEDITABLE_SCRIPT = """
+const { FakeDocument } = require(process.argv[1] + "/fake_dom");
+const { loadScript } = require(process.argv[1] + "/load_script");
+const doc = new FakeDocument();
+
+// An editor whose caret sits where focus leaves it: at the start.
+const events = [];
+const editor = { isContentEditable: true, textContent: "", dispatchEvent: (e) => events.push(e.type) };
+let caret = null;
+doc.createRange = () => ({
+  selectNodeContents(node) { this.node = node; this.start = 0; this.end = node.textContent.length; },
+  collapse(toStart) { if (toStart) this.end = this.start; else this.start = this.end; },
+});
+const selection = { removeAllRanges() { caret = null; }, addRange(range) { caret = range.start; } };
+doc.execCommand = (command, _, text) => {
+  const at = caret ?? 0;
+  editor.textContent = editor.textContent.slice(0, at) + text + editor.textContent.slice(at);
+  caret = at + text.length;
+};
+const window = { location: { href: doc.baseURI }, getSelection: () => selection };
+const insertWholeText = loadScript("content.js", doc, { window })("insertWholeText");
+
+const out = {};
+editor.textContent = "Hello";
+caret = 0;
+insertWholeText(editor, ", world", false);
+out.appended = editor.textContent;
+caret = 0;
+insertWholeText(editor, "Bye", true);
+out.cleared = editor.textContent;
+out.events = events;
+console.log(JSON.stringify(out));
+"""
+
+
+def test_fast_type_appends_to_contenteditable():
+    proc = subprocess.run(
+        ["node", "-e", CONTENTEDITABLE_SCRIPT, str(HARNESS)], capture_output=True, text=True, timeout=60
+    )
+    assert proc.returncode == 0, proc.stderr
+    out = json.loads(proc.stdout)
+    assert out["appended"] == "Hello, world"
+    assert out["cleared"] == "Bye"
+    assert out["events"] == ["change", "change"]